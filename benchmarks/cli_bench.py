@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+u"""명령줄 시작 시간 벤치마크
+
+``seektam`` 명령을 새 프로세스에서 여러 번 실행해 명령줄을 파싱하고
+끝나기까지 걸린 시간과 읽은 모듈 수를 잽니다.  cron이나 배포 훅에서
+자주 실행하므로 무거운 모듈을 맨 위에서 읽게 되면 여기서 드러납니다.
+
+.. code-block:: console
+
+   $ python benchmarks/cli_bench.py -o before.json
+   $ git checkout topic-branch
+   $ python benchmarks/cli_bench.py -o after.json --compare before.json
+
+"""
+from __future__ import absolute_import, division
+
+import datetime
+import json
+import os.path
+import platform
+import subprocess
+import sys
+import timeit
+
+from click import command, echo, option, Path
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+#: 모듈을 읽는 데 걸리는 시간만 재도록 명령줄을 파싱하다 끝나는 인자들
+COMMANDS = [
+    ('import', None),
+    ('usage', ['no-such-command']),
+    ('loader', ['loader']),
+    ('mealplan', ['mealplan']),
+    ('serve', ['serve', '--config', 'no-such-file.py']),
+]
+
+SCRIPT = '''
+import sys
+args = %r
+from seektam.cli import main
+if args is not None:
+    try:
+        main(args, prog_name='seektam')
+    except SystemExit:
+        pass
+sys.stderr.write('%%d\\n' %% len(sys.modules))
+'''
+
+
+def run_once(args):
+    u"""``args`` 로 ``seektam`` 을 한 번 실행하고 걸린 시간(초)과 읽은
+    모듈 수를 돌려줍니다.
+
+    """
+    start = timeit.default_timer()
+    process = subprocess.Popen(
+        [sys.executable, '-c', SCRIPT % (args,)], cwd=ROOT,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = process.communicate()
+    elapsed = timeit.default_timer() - start
+    return elapsed, int(err.strip().splitlines()[-1])
+
+
+def bench(args, repeat):
+    times = []
+    modules = None
+    for _ in range(repeat):
+        elapsed, modules = run_once(args)
+        times.append(elapsed)
+    times.sort()
+    return dict(runs=repeat, modules=modules, min_seconds=times[0],
+                median_seconds=times[len(times) // 2])
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(
+        commit=commit,
+        date=datetime.datetime.utcnow().isoformat() + 'Z',
+        python=platform.python_version(),
+        platform=platform.platform(),
+    )
+
+
+def compare(old, new):
+    u"""두 결과에서 같은 명령의 시간과 모듈 수를 나란히 보여줍니다."""
+    for name, result in sorted(new['results'].items()):
+        base = old['results'].get(name)
+        if base is None:
+            continue
+        for key in 'min_seconds', 'median_seconds', 'modules':
+            if not base.get(key):
+                continue
+            echo('{0:<10} {1:<16} {2:>10.4g} -> {3:>10.4g} ({4:+.1%})'.format(
+                name, key, base[key], result[key],
+                result[key] / base[key] - 1))
+
+
+@command()
+@option('--output', '-o', type=Path(dir_okay=False), default=None,
+        help=u'결과를 저장할 JSON 파일 (주지 않으면 표준 출력)')
+@option('--compare', 'baseline', type=Path(exists=True, dir_okay=False),
+        default=None, help=u'비교할 이전 결과 JSON 파일')
+@option('--repeat', '-n', type=int, default=10,
+        help=u'명령마다 실행할 횟수')
+@option('--only', multiple=True, type=str,
+        help=u'이 명령만 잼 (여러 번 쓸 수 있음)')
+def main(output, baseline, repeat, only):
+    results = {}
+    for name, args in COMMANDS:
+        if only and name not in only:
+            continue
+        results[name] = bench(args, repeat)
+        echo('{0}: {1:.3f}s, {2} modules'.format(
+            name, results[name]['min_seconds'], results[name]['modules']),
+            err=True)
+    report = dict(environment=environment(), options=dict(repeat=repeat),
+                  results=results)
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if output is None:
+        echo(data)
+    else:
+        with open(output, 'w') as f:
+            f.write(data + '\n')
+    if baseline is not None:
+        with open(baseline) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
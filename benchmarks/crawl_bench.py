@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+u"""크롤러 벤치마크
+
+``tests/crawl`` 의 녹화된 페이지를 가짜 HTTP 전송 계층으로 돌려주며
+:func:`~seektam.crawl.koreafood.get_food_list`,
+:func:`~seektam.crawl.koreafood.get_food_analysis`,
+:func:`~seektam.crawl.koreafood.food_to_model` 과 페이지 파서의 속도와
+최대 메모리를 잽니다.  측정마다 새 프로세스에서 돌리므로 최대 RSS가
+서로 섞이지 않습니다.
+
+.. code-block:: console
+
+   $ python benchmarks/crawl_bench.py -o before.json
+   $ git checkout topic-branch
+   $ python benchmarks/crawl_bench.py -o after.json --compare before.json
+
+"""
+from __future__ import absolute_import, division
+
+import codecs
+import datetime
+import io
+import json
+import multiprocessing
+import os.path
+import platform
+import resource
+import subprocess
+import timeit
+import urlparse
+
+from click import command, echo, option, Path
+from lxml import etree
+import requests
+from requests.adapters import BaseAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm.session import sessionmaker
+
+from seektam.crawl import koreafood
+from seektam.crawl.client import Client
+from seektam.crawl.parallel import crawl_pages
+from seektam.model.orm import Base
+
+FIXTURE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'tests', 'crawl')
+
+EMPTY_PAGE = '<html><head></head><body></body></html>'
+
+
+def read_fixture(name):
+    u"""녹화된 페이지를 서버가 보냈을 EUC-KR 바이트로 읽습니다."""
+    path = os.path.join(FIXTURE_DIR, name)
+    with codecs.open(path, encoding='euc-kr', errors='ignore') as f:
+        return f.read().encode('euc-kr')
+
+
+class FixtureAdapter(BaseAdapter):
+    u"""목록 페이지 ``pages`` 장과 그 음식들의 분석 페이지를 녹화된
+    페이지로 돌려주는 전송 계층.  목록 페이지는 모두 같은 음식을 담고,
+    분석 페이지는 식단 코드와 상관없이 같은 페이지를 돌려줍니다.
+
+    """
+
+    def __init__(self, pages):
+        super(FixtureAdapter, self).__init__()
+        self.pages = pages
+        self.list_page = read_fixture('koreafood_list_sample.htm')
+        self.analysis_pages = dict(
+            (str(n), read_fixture('koreafood_detail_D011010_%d.htm' % n))
+            for n in (1, 2))
+        self.requests = 0
+
+    def send(self, request, stream=False, **kwargs):
+        self.requests += 1
+        if request.method == 'GET':
+            query = urlparse.parse_qs(urlparse.urlsplit(request.url).query)
+            page = int(query['qPage'][0])
+            body = self.list_page if page <= self.pages else EMPTY_PAGE
+        else:
+            form = urlparse.parse_qs(request.body)
+            body = self.analysis_pages[form['h_NutriPage'][0]]
+        response = requests.Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'text/html; charset=euc-kr'
+        response.encoding = 'euc-kr'
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        if not stream:
+            response.content
+        return response
+
+    def close(self):
+        pass
+
+
+def fixture_client(pages):
+    client = Client()
+    adapter = FixtureAdapter(pages)
+    client.session.mount('http://koreanfood.rda.go.kr/', adapter)
+    return client, adapter
+
+
+def _repeat(func, number):
+    start = timeit.default_timer()
+    for _ in range(number):
+        func()
+    return timeit.default_timer() - start
+
+
+def bench_parse_list_page(options):
+    content = read_fixture('koreafood_list_sample.htm')
+    number = options['repeat']
+    elapsed = _repeat(lambda: koreafood.parse_list_page(content), number)
+    return dict(pages=number, seconds=elapsed,
+                seconds_per_page=elapsed / number,
+                pages_per_second=number / elapsed)
+
+
+def bench_parse_analysis_page(options):
+    content = read_fixture('koreafood_detail_D011010_2.htm')
+    number = options['repeat']
+    elapsed = _repeat(lambda: koreafood.parse_analysis_page(content), number)
+    return dict(pages=number, seconds=elapsed,
+                seconds_per_page=elapsed / number,
+                pages_per_second=number / elapsed)
+
+
+def bench_get_food_list(options):
+    client, adapter = fixture_client(options['pages'])
+    start = timeit.default_timer()
+    foods = sum(1 for _ in koreafood.get_food_list(
+        client=client, workers=options['workers']))
+    elapsed = timeit.default_timer() - start
+    return dict(foods=foods, pages=adapter.requests, seconds=elapsed,
+                workers=options['workers'],
+                foods_per_second=foods / elapsed,
+                pages_per_second=adapter.requests / elapsed,
+                seconds_per_page=elapsed / adapter.requests)
+
+
+def bench_get_food_analysis(options):
+    client, adapter = fixture_client(0)
+    number = options['repeat']
+    elapsed = _repeat(
+        lambda: koreafood.get_food_analysis('D011010', client), number)
+    return dict(foods=number, pages=adapter.requests, seconds=elapsed,
+                foods_per_second=number / elapsed,
+                pages_per_second=adapter.requests / elapsed,
+                seconds_per_page=elapsed / adapter.requests)
+
+
+def bench_crawl_pages(options):
+    pages = options['pages']
+
+    def make_crawler():
+        client, _ = fixture_client(pages)
+
+        def crawl(page):
+            foods = koreafood.get_list_page(page, client)
+            for food in foods:
+                food.aliment = koreafood.get_food_analysis(food.code, client)
+            return foods
+        return crawl
+
+    start = timeit.default_timer()
+    foods = sum(1 for _ in crawl_pages(make_crawler, options['processes']))
+    elapsed = timeit.default_timer() - start
+    return dict(foods=foods, seconds=elapsed,
+                processes=options['processes'],
+                foods_per_second=foods / elapsed)
+
+
+def bench_food_to_model(options):
+    client, _ = fixture_client(options['pages'])
+    foods = list(koreafood.get_food_list(client=client))
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    sess = sessionmaker(engine)()
+    cache = koreafood.AlimentCache.load(sess)
+    start = timeit.default_timer()
+    for food in foods:
+        koreafood.food_to_model(sess, food, cache)
+    elapsed = timeit.default_timer() - start
+    return dict(foods=len(foods), seconds=elapsed,
+                foods_per_second=len(foods) / elapsed)
+
+
+BENCHMARKS = [
+    ('parse_list_page', bench_parse_list_page),
+    ('parse_analysis_page', bench_parse_analysis_page),
+    ('get_food_list', bench_get_food_list),
+    ('get_food_analysis', bench_get_food_analysis),
+    ('crawl_pages', bench_crawl_pages),
+    ('food_to_model', bench_food_to_model),
+]
+
+
+def run_benchmark(name, options):
+    u"""``name`` 측정을 돌리고 결과에 최대 RSS(KiB)를 붙입니다.  새
+    프로세스에서 불러야 최대 RSS가 이 측정만의 값이 됩니다.
+
+    """
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result = dict(BENCHMARKS)[name](options)
+    result['peak_rss_kib'] = resource.getrusage(
+        resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_growth_kib'] = result['peak_rss_kib'] - before
+    return result
+
+
+def _run_in_process(name, options, queue):
+    queue.put(run_benchmark(name, options))
+
+
+def run_isolated(name, options):
+    u""":func:`run_benchmark` 를 새 프로세스에서 돌립니다.
+    ``crawl_pages`` 처럼 그 안에서 다시 프로세스를 띄우는 측정이 있으므로
+    :class:`multiprocessing.Pool` 의 데몬 프로세스는 쓰지 않습니다.
+
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_run_in_process, args=(name, options, queue))
+    process.start()
+    try:
+        return queue.get()
+    finally:
+        process.join()
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(
+        commit=commit,
+        date=datetime.datetime.utcnow().isoformat() + 'Z',
+        python=platform.python_version(),
+        platform=platform.platform(),
+        lxml='.'.join(map(str, etree.LXML_VERSION)),
+    )
+
+
+def compare(old, new):
+    u"""두 결과에서 같은 측정의 ``*_per_second`` 와 ``seconds_per_page``
+    를 나란히 보여줍니다.
+
+    """
+    for name, result in sorted(new['results'].items()):
+        base = old['results'].get(name)
+        if base is None:
+            continue
+        for key in sorted(result):
+            if not (key.endswith('_per_second') or
+                    key.endswith('_per_page') or key == 'peak_rss_kib'):
+                continue
+            if not base.get(key):
+                continue
+            echo('{0:<20} {1:<20} {2:>14.6g} -> {3:>14.6g} ({4:+.1%})'.format(
+                name, key, base[key], result[key],
+                result[key] / base[key] - 1))
+
+
+@command()
+@option('--output', '-o', type=Path(dir_okay=False), default=None,
+        help=u'결과를 저장할 JSON 파일 (주지 않으면 표준 출력)')
+@option('--compare', 'baseline', type=Path(exists=True, dir_okay=False),
+        default=None, help=u'비교할 이전 결과 JSON 파일')
+@option('--pages', type=int, default=20,
+        help=u'크롤링할 목록 페이지 수 (한 장에 음식 10개)')
+@option('--workers', '-w', type=int, default=1,
+        help=u'분석 페이지를 동시에 가져올 스레드 수')
+@option('--processes', '-p', type=int, default=multiprocessing.cpu_count(),
+        help=u'crawl_pages 측정에서 목록 페이지를 나눠 크롤링할 프로세스 수')
+@option('--repeat', '-n', type=int, default=200,
+        help=u'파서와 분석 페이지 측정을 되풀이할 횟수')
+@option('--only', multiple=True, type=str,
+        help=u'이 측정만 돌림 (여러 번 쓸 수 있음)')
+def main(output, baseline, pages, workers, processes, repeat, only):
+    options = dict(pages=pages, workers=workers, processes=processes,
+                   repeat=repeat)
+    names = [name for name, _ in BENCHMARKS if not only or name in only]
+    results = {}
+    for name in names:
+        results[name] = run_isolated(name, options)
+        echo('{0}: {1:.3f}s'.format(name, results[name]['seconds']),
+             err=True)
+    report = dict(environment=environment(), options=options,
+                  results=results)
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if output is None:
+        echo(data)
+    else:
+        with open(output, 'w') as f:
+            f.write(data + '\n')
+    if baseline is not None:
+        with open(baseline) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
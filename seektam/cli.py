@@ -3,29 +3,24 @@
 """:mod:`seektam.cli` --- Command-line interfaces
 ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
+cron이나 배포 훅에서 자주 실행하므로 ``seektam --help`` 가 빨리 뜨도록
+Flask, SQLAlchemy, 크롤러 같은 무거운 모듈은 명령마다 그 명령 안에서
+읽습니다.  이 모듈의 맨 위에서는 :mod:`click` 만 읽습니다.
+
 """
 from __future__ import absolute_import
 
-import code
 import functools
 
-from click import argument, group, option, Path
-from flask import _request_ctx_stack
-from sqlalchemy import create_engine
-from sqlalchemy.orm.scoping import scoped_session
-from sqlalchemy.orm.session import sessionmaker
-
-from .config import load_config
-from .crawl import koreafood
-from .model.orm import Base
-from .web.app import app
+from click import argument, echo, group, option, Path
 
-__all__ = 'cli', 'global_option', 'main', 'runserver'
+__all__ = 'cli', 'global_option', 'main', 'runserver', 'serve'
 
 
 def global_option(f):
     @functools.wraps(f)
     def internal(*args, **kwargs):
+        from .config import load_config
         load_config(kwargs.pop('config'))
         f(*args, **kwargs)
 
@@ -41,23 +36,372 @@ def cli():
 
 @cli.command()
 @argument('url')
-def loader(url):
+@option('--workers', '-w', type=int, default=1,
+        help=u'분석 페이지를 동시에 가져올 스레드 수')
+@option('--processes', '-p', type=int, default=1,
+        help=u'목록 페이지를 나눠 크롤링하고 파싱할 프로세스 수.  '
+             u'--workers 는 프로세스마다, --rate 와 --max-per-host 는 '
+             u'프로세스들을 합쳐 적용되고 DB에는 이 프로세스 하나만 '
+             u'씁니다')
+@option('--parse-workers', type=int, default=1,
+        help=u'분석 페이지를 동시에 파싱할 스레드 수')
+@option('--model-workers', type=int, default=1,
+        help=u'파싱한 음식을 동시에 DB 모델로 바꿀 스레드 수')
+@option('--queue-size', type=int, default=100,
+        help=u'단계 사이 대기열에 쌓아 둘 최대 음식 수')
+@option('--max-per-host', type=int, default=None,
+        help=u'호스트당 최대 동시 요청 수 (기본값: 프로세스마다 스레드 수)')
+@option('--pool-size', type=int, default=10,
+        help=u'호스트마다 유지할 HTTP 연결 수')
+@option('--timeout', type=float, default=30.0,
+        help=u'HTTP 요청 제한 시간(초)')
+@option('--retries', type=int, default=3,
+        help=u'실패한 HTTP 요청을 다시 시도할 횟수')
+@option('--rate', type=float, default=5.0,
+        help=u'처음 호스트당 초당 요청 수.  응답 시간과 오류에 따라 '
+             u'--min-rate 와 --max-rate 사이에서 조절합니다.  0이면 '
+             u'제한하지 않음')
+@option('--min-rate', type=float, default=0.2,
+        help=u'호스트당 최소 초당 요청 수')
+@option('--max-rate', type=float, default=50.0,
+        help=u'호스트당 최대 초당 요청 수')
+@option('--batch-size', '-b', type=int, default=500,
+        help=u'한 트랜잭션에 쓸 음식 수')
+@option('--cache-dir', type=Path(file_okay=False), default=None,
+        help=u'HTTP 응답을 저장할 디렉터리 (주지 않으면 캐시하지 않음)')
+@option('--cache-ttl', type=int, default=86400,
+        help=u'캐시된 응답을 다시 확인하지 않고 쓸 시간(초)')
+@option('--cache-size', type=int, default=1024,
+        help=u'캐시 디렉터리의 최대 크기(MiB)')
+@option('--offline', is_flag=True, default=False,
+        help=u'네트워크 없이 캐시된 응답만으로 다시 실행')
+@option('--incremental', '-i', is_flag=True, default=False,
+        help=u'목록 행이 바뀌었거나 새로 생긴 음식만 분석 페이지를 가져옴')
+@option('--checkpoint', type=Path(dir_okay=False), default=None,
+        help=u'진행 상황을 기록할 상태 파일')
+@option('--resume', is_flag=True, default=False,
+        help=u'상태 파일에 기록된 곳부터 이어서 크롤링')
+@option('--search-index', type=Path(dir_okay=False), default=None,
+        help=u'다 쓴 뒤 검색 색인을 만들어 저장할 파일 '
+             u'(웹의 SEARCH_INDEX_PATH)')
+@option('--similarity', type=Path(file_okay=False), default=None,
+        help=u'다 쓴 뒤 영양 유사도 행렬을 저장할 디렉터리 '
+             u'(웹의 SIMILARITY_PATH)')
+@option('--progress', type=float, default=10.0,
+        help=u'진행 상황을 출력할 간격(초).  0이면 출력하지 않음')
+@option('--stats-file', type=Path(dir_okay=False), default=None,
+        help=u'마친 뒤 크롤링 통계를 JSON으로 저장할 파일 '
+             u'(주지 않으면 표준 에러로 출력)')
+def loader(url, workers, processes, parse_workers, model_workers, queue_size,
+           max_per_host, pool_size, timeout, retries, rate, min_rate,
+           max_rate, batch_size, cache_dir, cache_ttl, cache_size, offline,
+           incremental, checkpoint, resume, search_index, similarity,
+           progress, stats_file):
     u"""농식품종합정보시스템 식품 정보(식단명 및 재료)를 DB에 저장합니다.
 
+    목록 크롤링, 분석 페이지 받기, 파싱, 모델 변환, DB 쓰기가 단계마다
+    따로 스레드를 두고 동시에 진행됩니다.  ``--processes`` 를 주면 목록
+    크롤링부터 파싱까지를 목록 페이지별로 나눠 여러 프로세스에서 하고,
+    결과는 이 프로세스가 페이지 순서대로 모아 씁니다.
+
     :param URL: 저장할 데이터베이스 URL (ex. mysql://scott@tiger:example.com/dbname)
     """
+    import contextlib
+    import json
+    from multiprocessing.pool import ThreadPool
+
+    import requests
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm.scoping import scoped_session
+    from sqlalchemy.orm.session import sessionmaker
+
+    from .crawl import koreafood
+    from .crawl.cache import DiskCache
+    from .crawl.checkpoint import Checkpoint
+    from .crawl.client import Client
+    from .crawl.parallel import CrawlProcessError, crawl_pages
+    from .crawl.ratelimit import AdaptiveLimiter
+    from .crawl.stats import CrawlStats, ProgressReporter
+    from .loader import BulkLoader, mark_stale, refresh_nutrition
+    from .migrations import (INITIAL_REVISION, current_revision,
+                             head_revision, stamp)
+    from .model.koreafood import Food, FoodNutrition
+    from .model.orm import Base
+    from .pipeline import Pipeline, Stage
+
+    http_cache = None
+    if cache_dir is not None:
+        http_cache = DiskCache(
+            cache_dir, ttl=cache_ttl, max_size=cache_size * 1024 * 1024,
+            offline=offline)
+    elif offline:
+        echo(u'--offline 은 --cache-dir 와 함께 써야 합니다.')
+        raise SystemExit(1)
+    if resume and checkpoint is None:
+        echo(u'--resume 은 --checkpoint 와 함께 써야 합니다.')
+        raise SystemExit(1)
+    if processes < 1:
+        echo(u'--processes 는 1 이상이어야 합니다.')
+        raise SystemExit(1)
+    if rate > 0 and not 0 < min_rate <= rate <= max_rate:
+        echo(u'0 < --min-rate <= --rate <= --max-rate 이어야 합니다.')
+        raise SystemExit(1)
+
     engine = create_engine(url)
-    Session = scoped_session(sessionmaker(engine))
+    Session = scoped_session(sessionmaker(engine, expire_on_commit=False))
     sess = Session()
 
     Base.metadata.bind = engine
-    Base.metadata.create_all()
-
-    for food in koreafood.get_food_list():
-        mfood = koreafood.food_to_model(sess, food)
-        sess.merge(mfood)
+    if not engine.has_table(Food.__tablename__):
+        Base.metadata.create_all()
+        stamp(url, 'head')
+    elif current_revision(engine) != head_revision():
+        # create_all은 없는 표만 만들고 없는 열은 두므로, 마이그레이션하지
+        # 않은 DB에 부르면 스키마가 반쯤 바뀐 채로 남습니다
+        if current_revision(engine) is not None:
+            echo(u'DB 스키마가 최신이 아닙니다.  먼저 마이그레이션하세요:\n'
+                 u'  seektam migrate URL')
+        elif engine.has_table(FoodNutrition.__tablename__):
+            echo(u'마이그레이션 리비전이 표시되지 않은 DB입니다.  '
+                 u'loader가 만든 최신 스키마라면:\n'
+                 u'  seektam migrate --stamp URL')
+        else:
+            echo(u'마이그레이션 전의 loader로 만든 DB입니다.  먼저 '
+                 u'마이그레이션하세요:\n'
+                 u'  seektam migrate --stamp -r %s URL\n'
+                 u'  seektam migrate URL' % INITIAL_REVISION)
+        raise SystemExit(1)
+    if sess.query(Food.id).first() is not None and \
+            sess.query(FoodNutrition.food_id).first() is None:
+        # 영양소 합계 표가 생기기 전에 채운 DB
+        refresh_nutrition(sess)
         sess.commit()
 
+    stats = CrawlStats()
+
+    def make_client(share=1, stats=stats):
+        # 프로세스 ``share`` 개가 함께 보내므로 요청 속도와 동시 요청 수를
+        # 나눠 갖습니다
+        rate_limiter = None
+        if rate > 0:
+            rate_limiter = AdaptiveLimiter(
+                rate=rate / share, min_rate=min_rate / share,
+                max_rate=max_rate / share)
+        return Client(
+            pool_size=max(pool_size, workers), timeout=timeout,
+            retries=retries,
+            max_per_host=max(1, max_per_host // share) if max_per_host
+            else workers,
+            cache=http_cache, stats=stats, rate_limiter=rate_limiter)
+
+    client = make_client()
+    if resume:
+        state = Checkpoint.load(checkpoint)
+    else:
+        state = Checkpoint(checkpoint)
+
+    known = {}
+    if incremental:
+        known = dict(
+            sess.query(Food.meal_code, Food.list_fingerprint).filter(
+                Food.meal_code != None))  # noqa
+
+    def fetch_analysis(food):
+        if food.code in state.codes:
+            return False
+        return not incremental or \
+            known.get(food.code) != food.list_fingerprint()
+
+    def fetch(food, client=client):
+        pages = None
+        if food.aliment is None and fetch_analysis(food):
+            try:
+                pages = koreafood.fetch_food_analysis(
+                    food.code, client, preload=True)
+            except requests.HTTPError as e:
+                # 이 음식만 쓰지 않고 넘어갑니다.  지문을 남기지 않으므로
+                # 다음 --incremental 에서 다시 가져옵니다.
+                echo(u'%s: 분석 페이지를 가져오지 못했습니다: %s' %
+                     (food.code, e), err=True)
+                food.failed = True
+        return food, pages
+
+    def parse(item, client=client):
+        food, pages = item
+        if pages is not None:
+            food.aliment = koreafood.parse_food_analysis(
+                food.code, pages, client)
+        return food
+
+    def make_crawler():
+        # 크롤링 프로세스 안에서 불립니다.  통계는 부모에게 없으므로
+        # 세지 않습니다.
+        worker_client = make_client(processes, stats=None)
+        pool = ThreadPool(workers) if workers > 1 else None
+
+        def crawl_one(food):
+            food.aliment = None
+            return parse(fetch(food, worker_client), worker_client)
+
+        def crawl(page):
+            foods = koreafood.get_list_page(page, worker_client)
+            if pool is None:
+                return map(crawl_one, foods)
+            return pool.map(crawl_one, foods)
+        return crawl
+
+    if processes > 1:
+        # 분석 페이지도 프로세스들이 가져와 파싱하므로 파이프라인은
+        # 모델 변환만 합니다
+        foods = crawl_pages(make_crawler, processes, state.start_page,
+                            queue_size)
+    else:
+        # 분석 페이지는 파이프라인의 단계들이 가져오므로 목록만 읽습니다
+        foods = koreafood.get_food_list(
+            client=client, workers=1, fetch_analysis=lambda food: False,
+            start_page=state.start_page)
+    # 재료는 이번에 파싱한 값으로 만들어 로더가 DB의 값을 고치도록,
+    # 저장된 재료를 미리 읽어 두지 않습니다
+    aliments = koreafood.AlimentCache()
+
+    def to_model(food):
+        if food.aliment is None:
+            return food, None
+        return food, koreafood.food_to_model(sess, food, aliments)
+
+    stages = [
+        Stage('model', stats.timed('convert', to_model), model_workers),
+    ]
+    if processes == 1:
+        # 여러 프로세스이면 가져오지 못한 분석 페이지를 부모가 제 몫의
+        # 요청 속도 밖에서 다시 가져오지 않도록 이 단계들을 뺍니다
+        stages[:0] = [
+            Stage('fetch', stats.timed('fetch', fetch), workers),
+            Stage('parse', stats.timed('parse', parse), parse_workers),
+        ]
+    pipeline = Pipeline(stages, queue_size=queue_size)
+    writer = BulkLoader(sess, batch_size=batch_size, on_flush=state.flushed,
+                        stats=stats)
+    seen = set(state.codes)
+    report = ProgressReporter(
+        stats, functools.partial(echo, err=True), progress)
+    try:
+        with report, contextlib.closing(pipeline.run(foods)) as results:
+            for food, model in results:
+                stats.count('foods')
+                seen.add(food.code)
+                if food.code in state.codes:
+                    continue
+                elif food.failed:
+                    stats.count('failed')
+                    continue
+                state.mark(food)
+                if model is not None:
+                    writer.add(model)
+            writer.flush()
+    except (requests.HTTPError, CrawlProcessError) as e:
+        # 목록을 끝까지 보지 못했으므로 나머지 음식을 오래된 것으로
+        # 표시하지 않습니다
+        echo(u'크롤링을 마치지 못했습니다: %s' % e, err=True)
+        raise SystemExit(1)
+    mark_stale(sess, seen)
+    state.clear()
+    if search_index is not None:
+        from .search import SearchIndex
+        SearchIndex.build(sess).save(search_index)
+    if similarity is not None:
+        from .similarity import SimilarityMatrix
+        SimilarityMatrix.build(sess).save(similarity)
+    summary = json.dumps(stats.summary(), indent=2, sort_keys=True)
+    if stats_file is None:
+        echo(summary, err=True)
+    else:
+        with open(stats_file, 'w') as f:
+            f.write(summary)
+
+
+@cli.command()
+@argument('url')
+@option('--revision', '-r', default='head',
+        help=u'올릴 마이그레이션 리비전 (기본값: head)')
+@option('--stamp', 'stamp_only', is_flag=True, default=False,
+        help=u'마이그레이션을 실행하지 않고 리비전만 표시.  마이그레이션 '
+             u'전의 loader로 만든 DB는 --stamp -r a3c1e6f0b2d4 로 표시한 '
+             u'뒤 migrate')
+def migrate(url, revision, stamp_only):
+    u"""DB 스키마를 마이그레이션합니다.
+
+    :param URL: 마이그레이션할 데이터베이스 URL
+    """
+    from .migrations import stamp, upgrade
+
+    if stamp_only:
+        stamp(url, revision)
+    else:
+        upgrade(url, revision)
+
+
+@cli.command()
+@argument('url')
+@option('--days', '-d', type=int, default=1, help=u'짤 날 수')
+@option('--size', '-n', type=int, default=6, help=u'하루에 고를 음식 수')
+@option('--require', '-r', multiple=True,
+        help=u'하루에 꼭 고를 대분류 (ex. 밥류, 반찬류:2).  여러 번 줄 수 있음')
+@option('--max-per-category', type=int, default=1,
+        help=u'하루에 한 대분류에서 고를 최대 음식 수')
+@option('--energy-min', type=float, default=None,
+        help=u'하루 최소 열량(kcal)')
+@option('--energy-max', type=float, default=None,
+        help=u'하루 최대 열량(kcal)')
+@option('--protein-min', type=float, default=None,
+        help=u'하루 최소 단백질(g)')
+@option('--sodium-max', type=float, default=None,
+        help=u'하루 최대 나트륨(mg)')
+@option('--similarity', type=Path(file_okay=False, exists=True),
+        default=None,
+        help=u'loader --similarity 로 저장한 행렬 (주지 않으면 DB에서 만듦)')
+def mealplan(url, days, size, require, max_per_category, energy_min,
+             energy_max, protein_min, sodium_max, similarity):
+    u"""하루 영양 목표를 맞추는 식단을 짭니다.
+
+    :param URL: 음식 정보가 저장된 데이터베이스 URL
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm.session import sessionmaker
+
+    from .mealplan import DEFAULT_TARGETS, MealPlanner, parse_required
+    from .model.koreafood import Food
+    from .similarity import SimilarityMatrix
+
+    targets = DEFAULT_TARGETS._replace(**dict(
+        (name, value) for name, value in [
+            ('energy_min', energy_min), ('energy_max', energy_max),
+            ('protein_min', protein_min), ('sodium_max', sodium_max)]
+        if value is not None))
+    sess = sessionmaker(create_engine(url))()
+    if similarity is None:
+        matrix = SimilarityMatrix.build(sess)
+    else:
+        matrix = SimilarityMatrix.load(similarity)
+    try:
+        planner = MealPlanner(
+            matrix, targets, size=size, required=parse_required(require),
+            max_per_category=max_per_category)
+        plan = planner.plan(days)
+    except ValueError as e:
+        echo(u'식단을 짤 수 없습니다: %s' % e)
+        raise SystemExit(1)
+    foods = dict(
+        (food.id, food) for food in sess.query(Food).filter(
+            Food.id.in_(set(id_ for day in plan for id_ in day))))
+    for n, day in enumerate(plan, 1):
+        echo(u'%d일째' % n)
+        for id_ in day:
+            echo(u'  %s (%s)' % (foods[id_].name, foods[id_].category_big))
+        totals = planner.totals(day)
+        echo(u'  열량 %(energy).0fkcal, 단백질 %(protein).1fg, '
+             u'나트륨 %(sodium).0fmg' % totals)
+
 
 @cli.command()
 @option('--debug/--no-debug', '-d/-D', default=None,
@@ -67,6 +411,7 @@ def loader(url):
 @global_option
 def runserver(debug, reload):
     u"""Flask web application을 실행합니다. (실 운영에 사용하지 마세요.)"""
+    from .web.app import app
 
     if debug is None:
         debug = app.debug
@@ -82,10 +427,60 @@ def runserver(debug, reload):
     )
 
 
+@cli.command()
+@option('--bind', '-b', multiple=True,
+        help=u'들을 주소 (기본값: 127.0.0.1:PORT).  여러 번 줄 수 있음')
+@option('--workers', '-w', type=int, default=None,
+        help=u'워커 프로세스 수 (기본값: CPU 수 × 2 + 1)')
+@option('--threads', '-t', type=int, default=1,
+        help=u'워커마다 요청을 처리할 스레드 수')
+@option('--preload/--no-preload', default=True,
+        help=u'포크하기 전에 앱과 색인을 읽어 워커들이 메모리를 나눠 씀')
+@option('--timeout', type=int, default=30,
+        help=u'응답하지 않는 워커를 다시 띄우기까지의 시간(초)')
+@option('--graceful-timeout', type=int, default=30,
+        help=u'재시작, 종료 때 처리 중인 요청을 기다릴 시간(초)')
+@option('--max-requests', type=int, default=0,
+        help=u'워커가 이만큼 요청을 처리하면 새 워커로 바꿈 (0이면 안 바꿈)')
+@option('--pid', type=Path(dir_okay=False), default=None,
+        help=u'마스터 PID 파일.  kill -HUP 으로 워커들을 차례로 새로 띄움')
+@option('--access-log', default=None,
+        help=u'접근 로그 파일 (- 이면 표준 출력)')
+@global_option
+def serve(bind, workers, threads, preload, timeout, graceful_timeout,
+          max_requests, pid, access_log):
+    u"""여러 워커 프로세스로 웹 애플리케이션을 실행합니다. (gunicorn)"""
+    import multiprocessing
+
+    from .web.app import app
+    try:
+        from .web.server import Server
+    except ImportError:
+        echo(u'serve 에는 gunicorn 이 필요합니다. '
+             u'(pip install Seektam-web[serve])')
+        raise SystemExit(1)
+    if not bind:
+        bind = ['127.0.0.1:%d' % app.config.get('PORT', 5000)]
+    if workers is None:
+        workers = multiprocessing.cpu_count() * 2 + 1
+    Server(app, dict(
+        bind=list(bind), workers=workers, threads=threads,
+        preload_app=preload, timeout=timeout,
+        graceful_timeout=graceful_timeout, max_requests=max_requests,
+        pidfile=pid, accesslog=access_log,
+    )).run()
+
+
 @cli.command()
 @global_option
 def shell():
     """Flask application context 속을 Python shell로 봅니다."""
+    import code
+
+    from flask import _request_ctx_stack
+
+    from .web.app import app
+
     with app.test_request_context():
         context = dict(app=_request_ctx_stack.top.app)
         code.interact(local=context)
@@ -7,13 +7,16 @@ import os.path
 
 from click import echo
 
-from .web.app import app
-
 __all__ = 'load_config',
 
 
 def load_config(config_file=None):
-    u"""설정파일을 읽습니다."""
+    u"""설정파일을 읽습니다.
+
+    명령줄에서 설정 파일만 검사할 때 Flask 앱을 읽지 않도록 앱은 파일을
+    다 검사한 뒤에 읽습니다.
+
+    """
     if config_file is None:
         try:
             config_file = os.environ['SEEKTAM_WEB_CONFIG']
@@ -26,6 +29,9 @@ def load_config(config_file=None):
     elif not config_file.endswith('.py'):
         echo(u'설정 파일은 .py 파일이어야 합니다.')
         raise SystemExit(1)
+    from .web.app import app
+    from .web.db import reset_database
     config = {}
     execfile(config_file, {}, config)
     app.config.update(config)
+    reset_database(app)
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.crawl.cache` --- On-disk HTTP response cache
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+:class:`DiskCache` 는 :class:`~seektam.crawl.client.Client` 에 붙여 쓰는
+응답 캐시입니다.  요청 메서드, URL, POST 본문으로 키를 만들고, 유효 기간
+(TTL)이 지나면 ``ETag`` / ``Last-Modified`` 로 조건부 요청을 보내
+다시 확인합니다.  서버가 둘 다 주지 않으면 본문의 해시로 바뀌었는지
+판단합니다.
+
+같은 본문에서 나온 파싱 결과도 본문 해시를 키로 저장해 두므로
+(:func:`parse_cached`), 바뀌지 않은 페이지는 다시 파싱하지 않습니다.
+
+"""
+from __future__ import absolute_import
+
+import cPickle as pickle
+import errno
+import hashlib
+import os
+import os.path
+import tempfile
+import threading
+import time
+import urllib
+
+__all__ = ('CacheMiss', 'CachedResponse', 'DiskCache', 'iter_body',
+           'parse_cached')
+
+
+class CacheMiss(LookupError):
+    u"""오프라인 모드에서 캐시에 없는 요청을 보냈을 때 일어납니다."""
+
+
+class CachedResponse(object):
+    u"""캐시에서 꺼낸 응답.  :class:`requests.Response` 의 일부 속성만
+    흉내냅니다.
+
+    """
+
+    def __init__(self, url, content, status_code=200, headers=None,
+                 content_hash=None, from_cache=True):
+        self.url = url
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content_hash = content_hash or hash_content(content)
+        self.from_cache = from_cache
+
+    def iter_content(self, chunk_size=1):
+        for n in range(0, len(self.content), chunk_size):
+            yield self.content[n:n+chunk_size]
+
+
+def hash_content(content):
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    return hashlib.sha1(content).hexdigest()
+
+
+class DiskCache(object):
+    u"""크기 제한이 있는 디스크 응답 캐시.
+
+    :param directory: 캐시 파일을 둘 디렉터리
+    :param ttl: 다시 확인하지 않고 캐시를 그대로 쓸 시간(초)
+    :param max_size: 캐시 디렉터리의 최대 크기(바이트).  넘으면 가장
+                     오래 쓰지 않은 항목부터 지웁니다.
+    :param offline: 참이면 네트워크를 쓰지 않고 캐시만으로 응답합니다.
+                    유효 기간은 무시하며, 캐시에 없으면
+                    :exc:`CacheMiss` 가 일어납니다.
+
+    """
+
+    #: 캐시에 남길 응답 헤더
+    kept_headers = 'content-type', 'etag', 'last-modified'
+
+    def __init__(self, directory, ttl=86400, max_size=1024 * 1024 * 1024,
+                 offline=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._size = None
+
+    @staticmethod
+    def key(method, url, params=None, data=None):
+        u"""요청을 가리키는 캐시 키를 만듭니다."""
+        parts = [method.upper(), url]
+        for values in params, data:
+            parts.append(urllib.urlencode(sorted((values or {}).items())))
+        return hashlib.sha1('\n'.join(parts)).hexdigest()
+
+    def _path(self, kind, key):
+        return os.path.join(self.directory, kind, key[:2], key)
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        try:
+            os.utime(path, None)  # 최근에 쓴 항목으로 표시
+        except OSError:
+            pass
+        return value
+
+    def _write(self, path, value):
+        dirname = os.path.dirname(path)
+        try:
+            os.makedirs(dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        fd, tmp = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.rename(tmp, path)
+        self._grow(os.path.getsize(path) - old_size)
+
+    def get(self, key):
+        u"""캐시된 응답 항목을 돌려줍니다.  없으면 ``None``."""
+        return self._read(self._path('responses', key))
+
+    def put(self, key, response):
+        u"""응답을 저장하고 저장된 항목을 돌려줍니다."""
+        headers = dict((k, v) for k, v in response.headers.items()
+                       if k.lower() in self.kept_headers)
+        entry = dict(
+            url=response.url, status_code=response.status_code,
+            headers=headers, content=response.content,
+            content_hash=hash_content(response.content),
+            stored_at=time.time())
+        self._write(self._path('responses', key), entry)
+        return entry
+
+    def refresh(self, key, entry):
+        u"""다시 확인한 항목의 저장 시각을 갱신합니다."""
+        entry = dict(entry, stored_at=time.time())
+        self._write(self._path('responses', key), entry)
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry['stored_at'] < self.ttl
+
+    @staticmethod
+    def conditional_headers(entry):
+        u"""``entry`` 를 다시 확인할 조건부 요청 헤더를 만듭니다."""
+        headers = {}
+        for k, v in entry['headers'].items():
+            if k.lower() == 'etag':
+                headers['If-None-Match'] = v
+            elif k.lower() == 'last-modified':
+                headers['If-Modified-Since'] = v
+        return headers
+
+    @staticmethod
+    def response(entry, from_cache=True):
+        return CachedResponse(
+            entry['url'], entry['content'], entry['status_code'],
+            entry['headers'], entry['content_hash'], from_cache)
+
+    def get_parsed(self, kind, content_hash):
+        u"""``content_hash`` 본문을 ``kind`` 방식으로 파싱한 결과를
+        돌려줍니다.  없으면 :exc:`KeyError` 가 일어납니다.
+
+        """
+        value = self._read(self._path('parsed', kind + '-' + content_hash))
+        if value is None:
+            raise KeyError((kind, content_hash))
+        return value[0]
+
+    def put_parsed(self, kind, content_hash, result):
+        self._write(self._path('parsed', kind + '-' + content_hash),
+                    (result,))
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def size(self):
+        u"""캐시 디렉터리의 전체 크기(바이트)."""
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            return self._size
+
+    def _grow(self, delta):
+        self.size()
+        with self._lock:
+            self._size += delta
+            if self._size <= self.max_size:
+                return
+            # 한 번 지울 때 여유를 두어 매번 디렉터리를 훑지 않게 합니다
+            target = self.max_size * 0.9
+            entries = sorted(self._entries())
+            self._size = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if self._size <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._size -= size
+
+
+def iter_body(response, chunk_size=16 * 1024):
+    u"""``response`` 본문을 조각으로 읽습니다.  ``iter_content`` 가 없는
+    응답은 본문 문자열을 그대로 돌려줍니다.
+
+    """
+    iter_content = getattr(response, 'iter_content', None)
+    if iter_content is None:
+        return response.content
+    return iter_content(chunk_size)
+
+
+def parse_cached(client, response, kind, parse):
+    u"""``response`` 본문을 ``parse`` 로 파싱합니다.
+
+    ``client`` 에 :class:`DiskCache` 가 붙어 있으면 같은 본문을 파싱한
+    결과를 캐시에서 꺼내 씁니다.  결과는 pickle할 수 있어야 합니다.
+    캐시가 없으면 본문을 다 받기 전에 ``iter_content`` 의 조각들을
+    ``parse`` 에 넘기므로, ``parse`` 는 문자열과 문자열 조각의 반복자를
+    모두 받아야 합니다.
+
+    """
+    cache = getattr(client, 'cache', None)
+    content_hash = getattr(response, 'content_hash', None)
+    if cache is None or content_hash is None:
+        return parse(iter_body(response))
+    try:
+        return cache.get_parsed(kind, content_hash)
+    except KeyError:
+        result = parse(response.content)
+        cache.put_parsed(kind, content_hash, result)
+        return result
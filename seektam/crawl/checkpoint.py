@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.crawl.checkpoint` --- Resumable crawl state
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+from __future__ import absolute_import
+
+import errno
+import json
+import os
+import os.path
+import tempfile
+
+__all__ = 'Checkpoint',
+
+
+class Checkpoint(object):
+    u"""크롤링이 어디까지 끝났는지 기록하는 상태 파일.
+
+    마지막으로 다 처리한 목록 페이지 번호(:attr:`page`)와 지금까지 처리한
+    식단 코드(:attr:`codes`)를 JSON 파일로 남깁니다.  프로세스가 죽으면
+    다음 실행은 ``page + 1`` 페이지부터 시작하고, 이미 처리한 코드는
+    건너뜁니다.
+
+    음식은 :meth:`mark` 로 처리 대기 목록에 올렸다가 DB에 쓰인 뒤
+    :meth:`flushed` 가 불릴 때에야 기록됩니다.
+
+    :param path: 상태 파일 경로.  ``None`` 이면 메모리에만 기록합니다.
+
+    """
+
+    def __init__(self, path, page=0, codes=()):
+        self.path = path
+        self.page = page
+        self.codes = set(codes)
+        self._pending = []
+
+    @classmethod
+    def load(cls, path):
+        u"""``path`` 의 상태를 읽습니다.  파일이 없으면 빈 상태를
+        돌려줍니다.
+
+        """
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return cls(path)
+        return cls(path, state['page'], state['codes'])
+
+    def save(self):
+        if self.path is None:
+            return
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(page=self.page, codes=sorted(self.codes)), f)
+        os.rename(tmp, self.path)
+
+    def clear(self):
+        u"""크롤링을 모두 마쳤을 때 상태 파일을 지웁니다."""
+        self.page = 0
+        self.codes = set()
+        self._pending = []
+        if self.path is None:
+            return
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    @property
+    def start_page(self):
+        u"""이어서 크롤링할 목록 페이지 번호."""
+        return self.page + 1
+
+    def mark(self, food):
+        u"""``food`` (:class:`~seektam.crawl.koreafood.Food`) 를 처리
+        대기 목록에 올립니다.
+
+        """
+        self._pending.append((food.page, food.code))
+
+    def flushed(self):
+        u"""대기 목록의 음식이 모두 DB에 쓰였음을 기록하고 저장합니다.
+
+        대기 목록의 마지막 음식이 속한 페이지는 아직 남은 음식이 있을 수
+        있으므로, 그 앞 페이지까지만 끝난 것으로 칩니다.
+
+        """
+        if not self._pending:
+            return
+        self.codes.update(code for _, code in self._pending)
+        last_page = self._pending[-1][0]
+        if last_page is not None:
+            self.page = max(self.page, last_page - 1)
+        self._pending = []
+        self.save()
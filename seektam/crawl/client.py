@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.crawl.client` --- HTTP client shared by crawlers
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+from __future__ import absolute_import
+
+import contextlib
+import time
+import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from .cache import CacheMiss
+from .ratelimit import HostLimiter
+
+__all__ = 'Client', 'url_kind'
+
+
+@contextlib.contextmanager
+def _no_limit():
+    yield
+
+
+def url_kind(url):
+    u"""통계에서 쓰는 URL 종류.  경로의 마지막 부분입니다."""
+    parts = urlparse.urlsplit(url)
+    return parts.path.rstrip('/').rsplit('/', 1)[-1] or parts.netloc
+
+
+def _retry(**kwargs):
+    u"""POST도 다시 시도하는 :class:`Retry`.  urllib3 1.26에서
+    ``method_whitelist`` 가 ``allowed_methods`` 로 바뀌었고 2.0에서는
+    없어졌습니다.
+
+    """
+    try:
+        return Retry(allowed_methods=False, **kwargs)
+    except TypeError:  # urllib3 < 1.26
+        return Retry(method_whitelist=False, **kwargs)
+
+
+def _retries(raw):
+    retries = getattr(raw, 'retries', None)
+    return len(getattr(retries, 'history', None) or ())
+
+
+class Client(object):
+    u"""연결을 재사용하는 크롤러용 HTTP 클라이언트.
+
+    하나의 :class:`requests.Session` 을 가지고 모든 요청을 보내므로
+    keep-alive 연결과 DNS 조회 결과를 크롤링 내내 다시 씁니다.
+    크롤링 함수들은 이 객체를 인자로 받으므로, 테스트에서는
+    :meth:`get` 과 :meth:`post` 만 가진 객체로 바꿔 끼울 수 있습니다.
+
+    :param pool_size: 호스트마다 유지할 연결 수
+    :param timeout: 요청 제한 시간(초).  ``(연결, 읽기)`` 튜플도 됩니다.
+    :param retries: 연결 실패나 5xx 응답을 다시 시도할 횟수
+    :param backoff: 재시도 사이 대기 시간의 지수 증가 계수(초)
+    :param max_per_host: 호스트당 최대 동시 요청 수.  ``None`` 이면
+                         제한하지 않습니다.
+    :param session: 쓸 세션.  주지 않으면 새로 만듭니다.
+    :param cache: 응답을 저장할 :class:`~seektam.crawl.cache.DiskCache`.
+                  주면 유효 기간 안의 응답은 네트워크를 쓰지 않고,
+                  지난 응답은 조건부 요청으로 다시 확인합니다.
+    :param stats: 요청 수, 받은 바이트, 재시도와 실패를 :func:`url_kind`
+                  마다 셀 :class:`~seektam.crawl.stats.CrawlStats`
+    :param rate_limiter: 호스트별 초당 요청 수를 응답에 따라 조절할
+                         :class:`~seektam.crawl.ratelimit.AdaptiveLimiter`.
+                         주면 5xx와 429 응답은 urllib3 대신 이 객체가
+                         재시도합니다.  시도마다 토큰을 받고 응답을
+                         알리므로, 줄인 속도와 ``Retry-After`` 를 지켜
+                         ``retries`` 번까지 다시 보냅니다.
+
+    """
+
+    #: 재시도할 HTTP 상태 코드
+    retry_statuses = 500, 502, 503, 504
+
+    #: ``rate_limiter`` 가 있을 때 속도를 줄여 다시 보낼 HTTP 상태 코드
+    throttled_statuses = 429,
+
+    def __init__(self, pool_size=10, timeout=(5, 30), retries=3,
+                 backoff=0.5, max_per_host=None, session=None, cache=None,
+                 stats=None, rate_limiter=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.cache = cache
+        self.stats = stats
+        self.backoff = backoff
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session() if session is None else session
+        # 속도 제한기가 있으면 5xx 재시도가 토큰을 받지 않고 나가지 않도록
+        # urllib3는 연결 실패만 재시도하고 :meth:`_send` 가 상태를 봅니다.
+        # 분석 페이지는 POST로 조회하므로 모든 메서드를 다시 시도합니다.
+        retry = _retry(
+            total=retries, backoff_factor=backoff,
+            status_forcelist=None if rate_limiter else self.retry_statuses)
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size,
+            max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.limiter = None
+        if max_per_host is not None:
+            self.limiter = HostLimiter(max_per_host)
+
+    def _send(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        slot = _no_limit() if self.limiter is None else self.limiter.slot(url)
+        with slot:
+            attempt = 0
+            while True:
+                r = self._attempt(method, url, **kwargs)
+                if self.rate_limiter is None or attempt >= self.retries:
+                    return r
+                elif r.status_code in self.retry_statuses:
+                    # urllib3와 같이 두 번째 재시도부터 기다립니다
+                    if attempt:
+                        time.sleep(self.backoff * 2 ** (attempt - 1))
+                elif r.status_code not in self.throttled_statuses:
+                    return r
+                # 속도 제한기가 줄인 속도와 ``Retry-After`` 를 지켜
+                # 다시 보냅니다
+                r.close()
+                attempt += 1
+
+    def _attempt(self, method, url, **kwargs):
+        kind = url_kind(url)
+        limiter = self.rate_limiter
+        if limiter is not None:
+            limiter.acquire(url, kind)
+        started = time.time()
+        try:
+            r = self.session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.RetryError):
+            # 재시도를 다 써 버린 뒤의 예외입니다
+            if limiter is not None:
+                limiter.failed(url)
+            if self.stats is not None:
+                self.stats.failure(kind, self.retries)
+            raise
+        except requests.RequestException:
+            if self.stats is not None:
+                self.stats.failure(kind)
+            raise
+        seconds = time.time() - started
+        if limiter is not None:
+            limiter.observe(url, r.status_code, seconds,
+                            r.headers.get('Retry-After'))
+        if self.stats is not None:
+            self.stats.request(kind, seconds, r.status_code,
+                               _retries(getattr(r, 'raw', None)))
+            self._count_body(r, kind)
+        return r
+
+    def _count_body(self, response, kind):
+        u"""``response`` 의 본문을 읽을 때마다 받은 바이트를 셉니다.
+        ``stream`` 으로 받은 본문은 파싱하면서 읽으므로 요청이 끝난 뒤에
+        셉니다.  네트워크에서는 처음 부른 ``iter_content`` 만 읽고, 그
+        뒤로는 ``content`` 에 받아 둔 본문을 다시 돌려주므로 처음 한
+        번만 셉니다.
+
+        """
+        iter_content = getattr(response, 'iter_content', None)
+        if iter_content is None:
+            return
+        stats = self.stats
+
+        def counted(chunks):
+            for chunk in chunks:
+                stats.downloaded(kind, len(chunk))
+                yield chunk
+
+        def counting(*args, **kwargs):
+            response.iter_content = iter_content
+            return counted(iter_content(*args, **kwargs))
+        response.iter_content = counting
+
+    def request(self, method, url, **kwargs):
+        cache = self.cache
+        if cache is None:
+            # 본문은 :func:`~seektam.crawl.cache.iter_body` 로 읽으며
+            # 파싱하도록 받지 않은 채 돌려줍니다
+            kwargs.setdefault('stream', True)
+            return self._send(method, url, **kwargs)
+
+        key = cache.key(method, url, kwargs.get('params'), kwargs.get('data'))
+        entry = cache.get(key)
+        if entry is not None and (cache.offline or cache.is_fresh(entry)):
+            if self.stats is not None:
+                self.stats.request(url_kind(url), cached=True)
+            return cache.response(entry)
+        elif cache.offline:
+            raise CacheMiss(method, url)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry is not None:
+            headers.update(cache.conditional_headers(entry))
+        r = self._send(method, url, headers=headers, **kwargs)
+        if entry is not None and r.status_code == 304:
+            return cache.response(cache.refresh(key, entry))
+        elif r.status_code != 200:
+            return r
+        return cache.response(cache.put(key, r), from_cache=False)
+
+    def get(self, url, params=None):
+        return self.request('GET', url, params=params)
+
+    def post(self, url, data=None, params=None):
+        return self.request('POST', url, data=data, params=params)
+
+    def close(self):
+        self.session.close()
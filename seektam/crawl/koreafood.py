@@ -1,4 +1,4 @@
-﻿# -*- coding: utf-8 -*-
+# -*- coding: utf-8 -*-
 
 '''
 농식품종합정보시스템 식단관리(메뉴젠) 데이터 가져오기
@@ -6,14 +6,32 @@ http://koreanfood.rda.go.kr/
 '''
 from __future__ import absolute_import
 
+import collections
+import hashlib
+import itertools
+import json
+import logging
+from multiprocessing.pool import ThreadPool
+import re
 import urllib
 
-import lxml.html
-from lxml.cssselect import CSSSelector
+from lxml import etree
 import requests
 from sqlalchemy.orm.exc import NoResultFound
 
 from ..model import koreafood
+from .cache import parse_cached
+from .client import Client
+
+LIST_URL = 'http://koreanfood.rda.go.kr/mgn/mgnmealinfo_mealquery.aspx'
+ANALYSIS_URL = 'http://koreanfood.rda.go.kr/mgn/mgn_User_meal_analysis.aspx'
+
+logger = logging.getLogger(__name__)
+
+
+def _fingerprint(value):
+    return hashlib.sha1(
+        json.dumps(value, sort_keys=True, default=repr)).hexdigest()
 
 
 class Food(object):
@@ -21,101 +39,473 @@ class Food(object):
         self.name = name
         self.category_big = u''
         self.category_small = u''
+        self.code = None
+        self.page = None
         self.aliment = {}
+        #: 분석 페이지를 가져오지 못했으면 참
+        self.failed = False
+
+    def list_fingerprint(self):
+        u"""목록 행(이름, 분류, 식단 코드)의 지문."""
+        return _fingerprint(
+            [self.name, self.category_big, self.category_small, self.code])
+
+    def analysis_fingerprint(self):
+        u"""분석 페이지에서 읽은 재료 정보의 지문.  분석 페이지를 가져오지
+        않았으면 ``None``.
+
+        """
+        if self.aliment is None:
+            return None
+        return _fingerprint(self.aliment)
+
+
+#: 파서에 한 번에 넣을 본문 크기
+CHUNK_SIZE = 16 * 1024
+
+_cells = etree.XPath('td')
+_header_cells = etree.XPath('th')
+_category_cells = etree.XPath(
+    'td[contains(concat(" ", @class, " "), " a_c ")]')
+_food_link = etree.XPath(
+    './/*[contains(concat(" ", @class, " "), " eumsiknm ")]')
+_text = etree.XPath('string()')
+
+
+def _iter_chunks(content, chunk_size=CHUNK_SIZE):
+    u"""본문을 파서에 넣을 바이트 조각으로 나눕니다.
+
+    유니코드 조각은 페이지의 ``<meta>`` 인코딩과 부딪히지 않도록 문자
+    참조를 써서 ASCII로 바꿉니다.  libxml2의 push 파서는 ``<!DOCTYPE``
+    선언이 두 조각에 걸치면 망가지고 ``<meta>`` 의 인코딩을 놓치기도
+    하므로, 첫 조각은 ``</head>`` 가 나올 때까지 모아서 넣습니다.
+
+    """
+    if isinstance(content, basestring):
+        content = [content[n:n+chunk_size]
+                   for n in range(0, len(content), chunk_size)]
+    head = ''
+    for chunk in content:
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode('ascii', 'xmlcharrefreplace')
+        if head is not None:
+            head += chunk
+            if '</head' not in head.lower() and len(head) < 4 * chunk_size:
+                continue
+            chunk, head = head, None
+        yield chunk
+    if head:
+        yield head
+
+
+def _iter_rows(content):
+    u"""HTML 본문을 조금씩 파서에 넣으며 닫힌 ``<tr>`` 요소를 차례로
+    돌려줍니다.
+
+    ``content`` 는 문자열이나 (``iter_content`` 처럼) 문자열 조각을 내는
+    반복자입니다.  돌려준 행은 다음 행으로 넘어갈 때 비우고 앞의 형제
+    요소와 함께 트리에서 떼어 내므로, 문서 전체를 메모리에 올리지
+    않습니다.
+
+    """
+    parser = etree.HTMLPullParser(events=('end',), tag='tr')
+
+    def drain():
+        for _, tr in parser.read_events():
+            yield tr
+            tr.clear()
+            parent = tr.getparent()
+            if parent is not None:
+                while tr.getprevious() is not None:
+                    del parent[0]
+
+    for chunk in _iter_chunks(content):
+        parser.feed(chunk)
+        for tr in drain():
+            yield tr
+    parser.close()
+    for tr in drain():
+        yield tr
+
+
+#: 분석 표 머리글에서 찾을 열쇠말과 그 열의 필드 이름.  영어 열쇠말은
+#: 머리글에서 로마자만 소문자로 남긴 것과 맞춰 보며, 앞에서부터 찾습니다.
+HEADER_KEYWORDS = (
+    (u'식품명', 'name'), (u'중량', 'weight'),
+    ('energy', 'energy'), ('moisture', 'moisture'), ('protein', 'protein'),
+    ('fat', 'fat'), ('nonfibrous', 'nonfiborous'), ('fiber', 'fiber'),
+    ('ash', 'ash'), ('calcium', 'calcium'), ('phosphorus', 'phosphorus'),
+    ('iron', 'iron'), ('sodium', 'sodium'), ('potassium', 'potassium'),
+    ('retinolequivalent', 'retinol_equivalent'), ('retinol', 'retinol'),
+    ('carotene', 'betacarotene'), ('thiamin', 'thiamin'),
+    ('riboflavin', 'riboflavin'), ('niacin', 'niacin'),
+    ('ascobicacid', 'ascobic_acid'),
+)
+
+
+class AlimentRow(collections.namedtuple(
+        'AlimentRow', ('name', 'weight') + koreafood.NUTRIENTS)):
+    u"""분석 페이지에서 읽은 재료 한 줄.
+
+    ``name`` 밖의 값은 모두 :class:`float` 이고, 페이지에 없던 열은
+    ``None`` 입니다.
+
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_fields(cls, name, fields):
+        return cls(name, *[fields.get(f) for f in cls._fields[1:]])
+
+
+#: :func:`parse_analysis_page` 의 결과.  ``fields`` 는 열마다의 필드
+#: 이름(모르는 열은 ``None``), ``rows`` 는 ``(식품명, 값 튜플)`` 목록,
+#: ``unknown`` 은 알 수 없는 머리글들입니다.
+AnalysisPage = collections.namedtuple(
+    'AnalysisPage', ['fields', 'rows', 'unknown'])
+
+
+def _header_labels(rows):
+    u"""두 줄짜리 표 머리글을 열 순서대로 펼칩니다.  ``colspan`` 이 있는
+    칸은 둘째 줄의 칸들로 바꿉니다.  ``rows`` 는 머리글 행마다
+    ``(colspan, 글자)`` 목록입니다.
+
+    """
+    if not rows:
+        return []
+    sub = iter(rows[1] if len(rows) > 1 else ())
+    labels = []
+    for span, text in rows[0]:
+        if span > 1:
+            labels.extend(next(sub)[1] for _ in range(span))
+        else:
+            labels.append(text)
+    return labels
+
+
+def _header_field(label):
+    roman = re.sub('[^a-z]', '', label.lower())
+    for keyword, field in HEADER_KEYWORDS:
+        if keyword in roman or keyword in label:
+            return field
+    return None
+
+
+def _to_float(text):
+    text = (text or '').replace(',', '').strip()
+    if text in ('', '-'):
+        return None
+    return float(text)
+
+
+def parse_analysis_page(content):
+    u"""분석 페이지의 표를 머리글에 맞춰 읽어 :class:`AnalysisPage` 로
+    돌려줍니다.  마지막 합계 행은 뺍니다.
+
+    ``content`` 는 본문 문자열이나 본문 조각을 내는 반복자이며, 표의
+    행만 하나씩 읽고 버립니다.
+
+    """
+    headers = []  # 바로 앞에 나온 머리글 행들
+    columns = None
+    fields = unknown = ()
+    rows = []
+    last = None
+    for tr in _iter_rows(content):
+        parent = tr.getparent()
+        if parent is None or parent.get('id') != 'anal_Table':
+            if columns is not None:
+                continue
+            th = _header_cells(tr)
+            if th:
+                headers.append([(int(c.get('colspan') or 1), _text(c))
+                                for c in th])
+            else:
+                headers = []
+            continue
+        if columns is None:
+            labels = _header_labels(headers)
+            all_fields = tuple(_header_field(label) for label in labels)
+            unknown = tuple(label.strip() for label, field
+                            in zip(labels, all_fields) if field is None)
+            try:
+                name_column = all_fields.index('name')
+            except ValueError:
+                name_column = 0
+            columns = [(n, field) for n, field in enumerate(all_fields)
+                       if field is not None and field != 'name']
+            fields = tuple(field for _, field in columns)
+        if last is not None:  # 합계 행이 마지막에 오므로 한 행씩 늦춰 넣습니다
+            rows.append(last)
+        cells = [td.text for td in _cells(tr)]
+        last = (cells[name_column],
+                tuple(_to_float(cells[n]) if n < len(cells) else None
+                      for n, _ in columns))
+    if columns is None:
+        return AnalysisPage((), [], ())
+    return AnalysisPage(fields, rows, unknown)
 
 
-def get_food_analysis(code):
-    filter_entry = CSSSelector('#anal_Table > tr')
-    filter_column = CSSSelector('.c_l_b')
+def check_response(response):
+    u"""``response`` 가 2xx가 아니면 :class:`requests.HTTPError` 를
+    일으킵니다.  서버의 오류 페이지를 빈 목록으로 읽어 목록이 끝난
+    것으로 알거나, 재료가 없는 음식으로 쓰지 않도록 합니다.
 
+    """
+    status = response.status_code
+    if not 200 <= status < 300:
+        raise requests.HTTPError(
+            '%d error for %s' % (status, getattr(response, 'url', None)),
+            response=response)
+
+
+def fetch_food_analysis(code, client=None, preload=False):
+    u"""식단 코드 ``code`` 의 분석 페이지 두 장을 요청해 응답 목록을
+    돌려줍니다.  본문은 :func:`parse_food_analysis` 로 읽습니다.
+
+    :param preload: 참이면 본문까지 모두 받아 둡니다.  응답을 다른
+                    스레드에서 파싱할 때 씁니다.
+    :raises requests.HTTPError: 분석 페이지가 2xx가 아닐 때
+
+    """
     param = dict(mealcode=code, mealname='')
     post_param = dict(meal_CD=code, meal_NM='', h_NutriPage=0)
-    url = 'http://koreanfood.rda.go.kr/mgn/mgn_User_meal_analysis.aspx'
-
-    session = requests.Session()
-    result = {}
 
+    if client is None:
+        client = Client()
+    responses = []
     for n in range(1, 2+1):
         post_param['h_NutriPage'] = n
-        r = session.post(
-            '{}?{}'.format(url, urllib.urlencode(param)), post_param)
-        h = lxml.html.fromstring(r.content)
-        for elem in list(filter_entry(h)[:-1]):  # 합계 제외
-            data = [x.text for x in filter_column(elem)]
-            if data[0] not in result:
-                result[data[0]] = [data[1]]  # 식품명 및 중량 기록
+        r = client.post(
+            '{}?{}'.format(ANALYSIS_URL, urllib.urlencode(param)), post_param)
+        check_response(r)
+        if preload:
+            r.content
+        responses.append(r)
+    return responses
+
+
+def parse_food_analysis(code, responses, client=None):
+    u""":func:`fetch_food_analysis` 로 받은 분석 페이지들을 읽어 재료
+    이름마다 :class:`AlimentRow` 를 돌려줍니다.
+
+    """
+    merged = collections.OrderedDict()
+    found = set()
+    for r in responses:
+        page = parse_cached(
+            client, r, 'koreafood.analysis.v2', parse_analysis_page)
+        if page.unknown:
+            logger.warning('%s: unknown analysis columns %s',
+                           code, ', '.join(page.unknown))
+        found.update(page.fields)
+        for name, values in page.rows:
+            merged.setdefault(name, {}).update(zip(page.fields, values))
+
+    missing = [f for f in AlimentRow._fields[1:] if f not in found]
+    if merged and missing:
+        logger.warning('%s: missing analysis columns %s',
+                       code, ', '.join(missing))
+    return dict((name, AlimentRow.from_fields(name, fields))
+                for name, fields in merged.items())
+
 
-            result[data[0]] += data[2:]  # 나머지 데이터 기록
+def get_food_analysis(code, client=None):
+    u"""식단 코드 ``code`` 의 분석 페이지 두 장을 읽어 재료 이름마다
+    :class:`AlimentRow` 를 돌려줍니다.
 
-    return result
+    """
+    if client is None:
+        client = Client()
+    return parse_food_analysis(
+        code, fetch_food_analysis(code, client), client)
 
 
-def get_food_list():
-    filter_category = CSSSelector('.list_data_01 > .a_c')
-    filter_foodname = CSSSelector('.eumsiknm')
+def _parse_meal_code(entry):
+    arg = entry.attrib['href'].split('?')[1].split('&')
+    code = filter(lambda x: x.startswith('meal_code'), arg)[0]
+    return code.split('=')[-1]
+
+
+def parse_list_page(content):
+    u"""목록 페이지에서 음식들을
+    ``(이름, 대분류, 소분류, 식단 코드)`` 튜플 목록으로 돌려줍니다.
+
+    ``content`` 는 본문 문자열이나 본문 조각을 내는 반복자입니다.
+
+    """
+    entries = []
+    for tr in _iter_rows(content):
+        if 'list_data_01' not in (tr.get('class') or '').split():
+            continue
+        categories = [td.text for td in _category_cells(tr)]
+        for entry in _food_link(tr):
+            entries.append((entry.text.strip(), categories[0], categories[1],
+                            _parse_meal_code(entry)))
+    return entries
+
+
+def get_list_page(page, client=None):
+    u"""목록 페이지 ``page`` 의 :class:`Food` 들을 분석 페이지 없이
+    돌려줍니다.  목록이 끝났으면 빈 목록입니다.
+
+    :raises requests.HTTPError: 목록 페이지가 2xx가 아닐 때
+
+    """
     param = dict(
-        qPage=0, s_firstSort='', s_secondSort='', t_mealName='',
+        qPage=page, s_firstSort='', s_secondSort='', t_mealName='',
         mealcd='', mealnm='', strflag='true')
+    if client is None:
+        client = Client()
+    r = client.get(LIST_URL + '?' + urllib.urlencode(param))
+    check_response(r)
+
+    foods = []
+    for name, category_big, category_small, code in parse_cached(
+            client, r, 'koreafood.list', parse_list_page):
+        food = Food(name)
+        food.category_big = category_big
+        food.category_small = category_small
+        food.code = code
+        food.page = page
+        foods.append(food)
+    return foods
+
 
-    n = 1
-    while True:
-        param['qPage'] = n
-        r = requests.get(
-            'http://koreanfood.rda.go.kr/mgn/mgnmealinfo_mealquery.aspx?'
-            + urllib.urlencode(param))
-        h = lxml.html.fromstring(r.content)
+def get_food_list(client=None, workers=1, fetch_analysis=None, start_page=1):
+    u"""식단 목록을 차례로 돌며 :class:`Food` 를 돌려줍니다.
 
-        categories = map(lambda x: x.text, filter_category(h))
-        entry = None
-        for entry in filter_foodname(h):
-            food = Food(entry.text.strip())
-            food.category_big = categories[0]
-            food.category_small = categories[1]
+    :param client: 목록과 분석 페이지를 가져올
+                   :class:`~seektam.crawl.client.Client`.
+                   주지 않으면 ``workers`` 에 맞춰 새로 만듭니다.
+    :param workers: 목록 한 페이지에 속한 음식들의 분석 페이지를 동시에
+                    가져올 스레드 수.  1이면 음식마다 차례로 가져옵니다.
 
-            arg = entry.attrib['href'].split('?')[1].split('&')
-            code = filter(lambda x: x.startswith('meal_code'), arg)[0]
-            code = code.split('=')[-1]
-            food.aliment = get_food_analysis(code)
+    :param fetch_analysis: :class:`Food` 를 받아 분석 페이지를 가져올지
+                           정하는 함수.  거짓을 돌려준 음식은 분석 페이지를
+                           가져오지 않고 :attr:`Food.aliment` 를 ``None``
+                           으로 둔 채 나옵니다.
+    :param start_page: 크롤링을 시작할 목록 페이지 번호
 
-            yield food
+    ``workers`` 와 관계없이 음식은 항상 목록에 나온 순서대로 나옵니다.
 
-            categories = categories[3:]
+    """
+    if client is None:
+        client = Client(pool_size=max(workers, 10), max_per_host=workers)
+    pool = ThreadPool(workers) if workers > 1 else None
 
-        if entry is None:
-            break
-        n = n+1
+    try:
+        n = start_page
+        while True:
+            foods = get_list_page(n, client)
+            wanted = [fetch_analysis is None or bool(fetch_analysis(f))
+                      for f in foods]
 
+            if pool is None:
+                for food, want in itertools.izip(foods, wanted):
+                    food.aliment = None
+                    if want:
+                        food.aliment = get_food_analysis(food.code, client)
+                    yield food
+            else:
+                analyses = pool.imap(
+                    lambda code: get_food_analysis(code, client),
+                    [f.code for f, want in itertools.izip(foods, wanted)
+                     if want])
+                for food, want in itertools.izip(foods, wanted):
+                    food.aliment = next(analyses) if want else None
+                    yield food
 
-def food_to_model(sess, food):
+            if not foods:
+                break
+            n = n+1
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+class AlimentCache(object):
+    u"""재료 이름으로 :class:`~seektam.model.koreafood.Aliment` 를 찾는
+    캐시.
+
+    :meth:`load` 로 이미 저장된 재료를 한 번에 읽어 두고,
+    :func:`food_to_model` 이 새로 만든 재료도 채워 넣으므로 로더가
+    도는 동안 재료마다 DB를 조회하지 않아도 됩니다.
+
+    """
+
+    def __init__(self, aliments=()):
+        self._aliments = dict((a.name, a) for a in aliments)
+
+    @classmethod
+    def load(cls, sess):
+        u"""``sess`` 에 저장된 모든 재료를 쿼리 한 번으로 읽어 옵니다."""
+        return cls(sess.query(koreafood.Aliment).all())
+
+    def get(self, name):
+        return self._aliments.get(name)
+
+    def add(self, aliment):
+        self._aliments[aliment.name] = aliment
+
+    def __contains__(self, name):
+        return name in self._aliments
+
+    def __len__(self):
+        return len(self._aliments)
+
+
+def _new_aliment(name, row):
+    u""":class:`AlimentRow` 의 값을 중량으로 나누어 1g당 값을 가진
+    :class:`~seektam.model.koreafood.Aliment` 를 만듭니다.
+
+    """
+    maliment = koreafood.Aliment()
+    maliment.name = name
+    weight = row.weight or 1.0
+    for c in koreafood.NUTRIENTS:
+        value = getattr(row, c)
+        setattr(maliment, c, None if value is None else value / weight)
+    return maliment
+
+
+def food_to_model(sess, food, cache=None):
+    u""":class:`Food` 를 :class:`seektam.model.koreafood.Food` 로 바꿉니다.
+    재료마다 분석 페이지의 중량을
+    :class:`~seektam.model.koreafood.FoodAliment` 에 남깁니다.
+
+    :param cache: 재료를 찾을 :class:`AlimentCache`.  주면 ``sess`` 를
+                  조회하지 않고 캐시에서만 재료를 찾습니다.
+
+    """
     ret = []
     mfood = koreafood.Food()
     mfood.name = food.name
     mfood.category_big = food.category_big
     mfood.category_small = food.category_small
+    mfood.meal_code = food.code
+    mfood.list_fingerprint = food.list_fingerprint()
+    mfood.analysis_fingerprint = food.analysis_fingerprint()
+    mfood.stale = False
 
     for k in food.aliment:
-        try:
-            maliment = sess.query(koreafood.Aliment).filter(
-                koreafood.Aliment.name == k).one()
-        except NoResultFound:
-            arr = food.aliment[k]
-            maliment = koreafood.Aliment()
-
-            # FIXME: take food.aliment as dict(dict()), not dict(list())
-            columns = [
-                'weight', 'energy', 'moisture', 'protein', 'fat',
-                'nonfiborous', 'fiber', 'ash', 'calcium', 'potassium',
-                'retinol_equivalent', 'retinol', 'betacarotene',
-                'thiamin', 'riboflavin', 'niacin', 'ascobic_acid'
-                ]
-
-            maliment.name = k
-            arr = map(lambda x: x.replace(',', ''), arr)
-            weight = float(arr[0]) if arr[0] else 1.0
-            for c in columns[1:]:
-                setattr(maliment, c, float(arr[columns.index(c)]) / weight)
-
-        ret.append(maliment)
-
-    mfood.aliments = ret
+        if cache is not None:
+            maliment = cache.get(k)
+        else:
+            try:
+                maliment = sess.query(koreafood.Aliment).filter(
+                    koreafood.Aliment.name == k).one()
+            except NoResultFound:
+                maliment = None
+
+        if maliment is None:
+            maliment = _new_aliment(k, food.aliment[k])
+            if cache is not None:
+                cache.add(maliment)
+
+        ret.append(koreafood.FoodAliment(
+            maliment, getattr(food.aliment[k], 'weight', None)))
+
+    mfood.food_aliments = ret
     return mfood
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.crawl.parallel` --- Crawling list pages in processes
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+목록 페이지를 프로세스 여러 개에 나눠 크롤링합니다.  lxml 파싱과 값
+변환은 GIL을 잡으므로 스레드로는 CPU 하나를 넘지 못합니다.
+
+프로세스 ``k`` (0부터) 는 ``start_page + k`` 페이지부터 프로세스 수만큼
+건너뛰며 빈 페이지가 나올 때까지 크롤링합니다.  전체 페이지 수를 몰라도
+나눌 수 있고, 페이지마다 걸리는 시간이 비슷하므로 프로세스들이 거의 같은
+속도로 나아갑니다.  부모 프로세스는 받은 페이지를 번호 순서대로 다시
+늘어놓으므로 한 프로세스로 크롤링한 것과 같은 순서로 음식이 나옵니다.
+느린 페이지 하나를 기다리는 동안 다른 프로세스들이 앞서 나가 받아 둔
+페이지가 끝없이 쌓이지 않도록, 부모가 기다리는 페이지보다
+``processes * queue_size`` 페이지 넘게 앞선 프로세스는 멈춰 기다립니다.
+
+"""
+from __future__ import absolute_import
+
+import itertools
+import multiprocessing
+import Queue
+import traceback
+
+__all__ = 'CrawlProcessError', 'crawl_pages'
+
+
+class CrawlProcessError(RuntimeError):
+    u"""크롤링 프로세스가 예외로 끝났거나 죽었을 때 일어납니다.
+    메시지에 자식 프로세스의 트레이스백이 들어 있습니다.
+
+    """
+
+
+def _work(make_crawler, index, processes, start_page, queue, next_page,
+          moved, window):
+    try:
+        crawl = make_crawler()
+        for page in itertools.count(start_page + index, processes):
+            with moved:
+                while page >= next_page.value + window:
+                    moved.wait()
+            foods = crawl(page)
+            queue.put(('page', page, foods))
+            if not foods:
+                return
+    except Exception:
+        queue.put(('error', index, traceback.format_exc()))
+
+
+def _receive(queue, workers, poll=1.0):
+    while True:
+        try:
+            return queue.get(timeout=poll)
+        except Queue.Empty:
+            for worker in workers:
+                if worker.exitcode not in (None, 0):
+                    raise CrawlProcessError('%s exited with code %d' %
+                                            (worker.name, worker.exitcode))
+
+
+def crawl_pages(make_crawler, processes, start_page=1, queue_size=100):
+    u"""목록 페이지들을 ``processes`` 개의 프로세스에서 크롤링해 음식을
+    페이지 순서대로 돌려줍니다.
+
+    :param make_crawler: 프로세스마다 한 번 불러, 목록 페이지 번호를
+                         받아 그 페이지의 음식 목록을 돌려주는 함수를
+                         얻습니다.  HTTP 연결처럼 프로세스끼리 나눠 쓸 수
+                         없는 것은 이 안에서 만듭니다.  빈 목록은 목록이
+                         끝났다는 뜻입니다.
+    :param processes: 크롤링할 프로세스 수
+    :param start_page: 크롤링을 시작할 목록 페이지 번호
+    :param queue_size: 부모에게 보내고 아직 받지 않은 최대 페이지 수.
+                       받았지만 앞 페이지를 기다리느라 아직 내놓지 못한
+                       페이지는 ``processes * queue_size`` 개를 넘지
+                       않습니다.
+    :raises CrawlProcessError: 프로세스 하나가 실패했을 때
+
+    """
+    if processes < 1:
+        raise ValueError('processes must be positive: %r' % (processes,))
+    queue = multiprocessing.Queue(queue_size)
+    # 부모가 다음에 내놓을 페이지.  프로세스들은 이보다 너무 앞서지 않게
+    # ``moved`` 로 기다립니다.
+    next_page = multiprocessing.Value('l', start_page, lock=False)
+    moved = multiprocessing.Condition()
+    workers = [
+        multiprocessing.Process(
+            target=_work, name='crawl-%d' % index,
+            args=(make_crawler, index, processes, start_page, queue,
+                  next_page, moved, processes * queue_size))
+        for index in range(processes)
+    ]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    pages = {}  # 앞 페이지를 기다리는 동안 먼저 온 페이지들
+    end = None
+    page = start_page
+    try:
+        while end is None or page < end:
+            if page in pages:
+                for food in pages.pop(page):
+                    yield food
+                page += 1
+                with moved:
+                    next_page.value = page
+                    moved.notify_all()
+                continue
+            kind, number, payload = _receive(queue, workers)
+            if kind == 'error':
+                raise CrawlProcessError(
+                    'crawl-%d failed:\n%s' % (number, payload))
+            elif payload:
+                pages[number] = payload
+            elif end is None or number < end:
+                end = number
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
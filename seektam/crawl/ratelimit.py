@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.crawl.ratelimit` --- Request limiting for crawlers
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+:class:`HostLimiter` 는 호스트별 동시 요청 수를, :class:`AdaptiveLimiter`
+는 호스트별 초당 요청 수를 제한합니다.
+
+"""
+from __future__ import absolute_import
+
+import collections
+import contextlib
+import email.utils
+import threading
+import time
+import urlparse
+
+__all__ = 'AdaptiveLimiter', 'HostLimiter', 'parse_retry_after'
+
+
+class HostLimiter(object):
+    u"""호스트별로 동시에 진행 중인 요청 수를 제한합니다.
+
+    :param limit: 한 호스트에 동시에 보낼 수 있는 최대 요청 수
+
+    """
+
+    def __init__(self, limit):
+        if limit < 1:
+            raise ValueError('limit must be positive: %r' % (limit,))
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._slots = {}
+
+    def _semaphore(self, url):
+        host = urlparse.urlsplit(url).netloc
+        with self._lock:
+            try:
+                return self._slots[host]
+            except KeyError:
+                sem = threading.BoundedSemaphore(self.limit)
+                self._slots[host] = sem
+                return sem
+
+    @contextlib.contextmanager
+    def slot(self, url):
+        u"""``url`` 의 호스트에 요청할 자리가 날 때까지 기다립니다."""
+        sem = self._semaphore(url)
+        sem.acquire()
+        try:
+            yield
+        finally:
+            sem.release()
+
+
+def parse_retry_after(value, now=None):
+    u"""``Retry-After`` 헤더 값을 기다릴 초로 바꿉니다.  초 수와 HTTP
+    날짜 둘 다 읽으며, 읽을 수 없으면 ``None`` 입니다.
+
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    if now is None:
+        now = time.time()
+    return max(0.0, email.utils.mktime_tz(parsed) - now)
+
+
+class _Bucket(object):
+    u"""호스트 하나의 토큰 버킷과 그 호스트를 기다리는 요청들."""
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+        #: 이 시각까지는 요청하지 않습니다 (``Retry-After``)
+        self.paused_until = 0.0
+        #: 이 시각까지는 요청 속도를 다시 줄이지 않습니다
+        self.calm_until = 0.0
+        #: 응답 시간의 지수 이동 평균과 그 최솟값
+        self.latency = self.baseline = None
+        #: 종류마다 기다리는 요청들과, 기다리는 요청이 있는 종류의 차례
+        self.waiting = collections.defaultdict(collections.deque)
+        self.turns = collections.deque()
+
+    def refill(self, now):
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(float(self.burst), self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def enqueue(self, kind, ticket):
+        if not self.waiting[kind]:
+            self.turns.append(kind)
+        self.waiting[kind].append(ticket)
+
+    def first(self):
+        return self.waiting[self.turns[0]][0]
+
+    def dequeue(self, kind, ticket):
+        waiting = self.waiting[kind]
+        first = waiting[0] is ticket
+        waiting.remove(ticket)
+        if first and self.turns[0] == kind:
+            # 차례를 다음 종류로 넘깁니다
+            self.turns.popleft()
+            if waiting:
+                self.turns.append(kind)
+        elif not waiting:
+            self.turns.remove(kind)
+
+
+class AdaptiveLimiter(object):
+    u"""호스트별 초당 요청 수를 토큰 버킷으로 제한하고, 응답에 따라
+    AIMD로 조절합니다.
+
+    성공한 응답마다 요청 속도를 조금씩(초당 ``increase`` 만큼) 올리고,
+    5xx나 429 응답, 연결 실패와 제한 시간 초과, 또는 응답 시간이 지금까지
+    가장 빨랐던 때의 ``latency_factor`` 배를 넘으면 ``decrease`` 배로
+    줄입니다.  ``Retry-After`` 를 받으면 그 시간 동안 그 호스트에는
+    요청하지 않습니다.
+
+    한 호스트를 기다리는 요청들은 종류(ex. 목록 페이지와 분석 페이지)
+    마다 번갈아 보내므로 한쪽이 다른 쪽을 굶기지 않습니다.
+
+    :param rate: 처음 초당 요청 수
+    :param min_rate: 줄일 수 있는 최소 초당 요청 수
+    :param max_rate: 올릴 수 있는 최대 초당 요청 수
+    :param burst: 한꺼번에 보낼 수 있는 최대 요청 수
+    :param increase: 1초 동안 성공하면 늘릴 초당 요청 수
+    :param decrease: 혼잡할 때 곱할 수 (0과 1 사이)
+    :param latency_factor: 응답 시간이 가장 빨랐던 때의 몇 배를 넘으면
+                           혼잡으로 볼지
+    :param max_pause: ``Retry-After`` 로 기다릴 최대 시간(초)
+    :param clock: 시각을 돌려주는 함수 (테스트용)
+
+    """
+
+    #: 혼잡으로 보는 HTTP 상태 코드 (5xx 말고)
+    congested_statuses = 429,
+
+    def __init__(self, rate=5.0, min_rate=0.2, max_rate=50.0, burst=None,
+                 increase=1.0, decrease=0.5, latency_factor=4.0,
+                 max_pause=300.0, clock=time.time):
+        if not 0 < min_rate <= rate <= max_rate:
+            raise ValueError('rates must satisfy 0 < min_rate <= rate <= '
+                             'max_rate: %r, %r, %r' %
+                             (min_rate, rate, max_rate))
+        if not 0 < decrease < 1:
+            raise ValueError('decrease must be between 0 and 1: %r' %
+                             (decrease,))
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.burst = max(1, int(rate)) if burst is None else burst
+        self.increase = float(increase)
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.max_pause = max_pause
+        self.clock = clock
+        self._cond = threading.Condition(threading.Lock())
+        self._buckets = {}
+
+    def _bucket(self, url):
+        host = urlparse.urlsplit(url).netloc
+        try:
+            return self._buckets[host]
+        except KeyError:
+            bucket = _Bucket(self.rate, self.burst, self.clock())
+            self._buckets[host] = bucket
+            return bucket
+
+    def acquire(self, url, kind=None):
+        u"""``url`` 의 호스트에 요청을 보내도 될 때까지 기다립니다.
+
+        :param kind: 요청 종류.  같은 호스트를 기다리는 요청들은
+                     종류마다 번갈아 보냅니다.
+
+        """
+        ticket = object()
+        with self._cond:
+            bucket = self._bucket(url)
+            bucket.enqueue(kind, ticket)
+            try:
+                while True:
+                    now = self.clock()
+                    bucket.refill(now)
+                    if now < bucket.paused_until:
+                        timeout = bucket.paused_until - now
+                    elif bucket.first() is not ticket:
+                        timeout = None  # 차례가 오면 깨웁니다
+                    elif bucket.tokens < 1:
+                        timeout = (1 - bucket.tokens) / bucket.rate
+                    else:
+                        bucket.tokens -= 1
+                        return
+                    self._cond.wait(timeout)
+            finally:
+                bucket.dequeue(kind, ticket)
+                self._cond.notify_all()
+
+    def observe(self, url, status, seconds=None, retry_after=None):
+        u"""``url`` 에 보낸 요청의 응답을 알립니다.
+
+        :param status: HTTP 상태 코드
+        :param seconds: 응답 머리를 받기까지 걸린 시간(초)
+        :param retry_after: ``Retry-After`` 헤더 값
+
+        """
+        congested = status >= 500 or status in self.congested_statuses
+        with self._cond:
+            bucket = self._bucket(url)
+            now = self.clock()
+            pause = parse_retry_after(retry_after, now)
+            if pause is not None:
+                until = now + min(pause, self.max_pause)
+                bucket.paused_until = max(bucket.paused_until, until)
+            if seconds is not None and not congested:
+                congested = self._slow(bucket, seconds)
+            self._adjust(bucket, congested, now)
+            self._cond.notify_all()
+
+    def failed(self, url):
+        u"""``url`` 에 보낸 요청이 연결 실패나 제한 시간 초과로 끝났음을
+        알립니다.
+
+        """
+        with self._cond:
+            bucket = self._bucket(url)
+            self._adjust(bucket, True, self.clock())
+
+    def _slow(self, bucket, seconds):
+        if bucket.latency is None:
+            bucket.latency = seconds
+        else:
+            bucket.latency = 0.8 * bucket.latency + 0.2 * seconds
+        if bucket.baseline is None or bucket.latency < bucket.baseline:
+            bucket.baseline = bucket.latency
+        return bucket.latency > bucket.baseline * self.latency_factor
+
+    def _adjust(self, bucket, congested, now):
+        bucket.refill(now)
+        if not congested:
+            # 1초 동안 성공하면 ``increase`` 만큼 늘어납니다
+            bucket.rate = min(self.max_rate,
+                              bucket.rate + self.increase / bucket.rate)
+        elif now >= bucket.calm_until:
+            # 줄인 속도로 보낸 요청의 응답이 올 때까지는 다시 줄이지
+            # 않습니다.  이미 보낸 요청들의 실패로 한꺼번에 줄지 않도록.
+            bucket.rate = max(self.min_rate, bucket.rate * self.decrease)
+            bucket.tokens = min(bucket.tokens, 1.0)
+            bucket.calm_until = now + max(1.0 / bucket.rate,
+                                          bucket.latency or 0.0)
+
+    def rates(self):
+        u"""호스트마다 지금의 초당 요청 수."""
+        with self._cond:
+            return dict((host, bucket.rate)
+                        for host, bucket in self._buckets.items())
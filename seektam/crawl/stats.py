@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.crawl.stats` --- Crawl throughput and error statistics
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+요청 수와 받은 바이트, 재시도와 실패를 URL 종류마다 세고, HTTP 요청,
+파싱, 모델 변환, DB 쓰기처럼 단계마다 걸린 시간을 잽니다.
+:class:`~seektam.crawl.client.Client` 에 ``stats`` 로 넘기면 요청은
+알아서 세고, 단계 시간은 :meth:`CrawlStats.phase` 로 잽니다.
+
+"""
+from __future__ import absolute_import
+
+import collections
+import contextlib
+import functools
+import threading
+import time
+
+__all__ = 'CrawlStats', 'ProgressReporter'
+
+
+class _Timing(object):
+
+    __slots__ = 'count', 'total', 'max'
+
+    def __init__(self):
+        self.count = 0
+        self.total = self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        return dict(count=self.count, total=self.total, max=self.max,
+                    mean=self.total / self.count if self.count else 0.0)
+
+
+class _Requests(object):
+
+    __slots__ = 'count', 'cached', 'bytes', 'retries', 'failures', 'statuses'
+
+    def __init__(self):
+        self.count = self.cached = self.bytes = 0
+        self.retries = self.failures = 0
+        self.statuses = collections.Counter()
+
+    def as_dict(self):
+        return dict(count=self.count, cached=self.cached, bytes=self.bytes,
+                    retries=self.retries, failures=self.failures,
+                    statuses=dict((str(k), v)
+                                  for k, v in self.statuses.items()))
+
+
+class CrawlStats(object):
+    u"""크롤링 통계.  여러 스레드에서 함께 씁니다.
+
+    :param clock: 시각을 돌려주는 함수 (테스트용)
+
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.started = clock()
+        self._lock = threading.Lock()
+        self._requests = collections.defaultdict(_Requests)
+        self._phases = collections.defaultdict(_Timing)
+        self._items = collections.Counter()
+
+    def request(self, kind, seconds=None, status=None, retries=0,
+                cached=False):
+        u"""``kind`` 종류의 URL에 요청 하나를 보냈음을 기록합니다.
+        ``seconds`` 는 응답 머리를 받기까지 걸린 시간이고 ``http``
+        단계로 셉니다.  ``cached`` 이면 네트워크를 쓰지 않은 것입니다.
+
+        """
+        with self._lock:
+            entry = self._requests[kind]
+            entry.count += 1
+            entry.retries += retries
+            if cached:
+                entry.cached += 1
+            if status is not None:
+                entry.statuses[status] += 1
+                if status >= 400:
+                    entry.failures += 1
+            if seconds is not None:
+                self._phases['http'].add(seconds)
+
+    def failure(self, kind, retries=0):
+        u"""``kind`` 종류의 요청이 예외로 끝났음을 기록합니다."""
+        with self._lock:
+            entry = self._requests[kind]
+            entry.count += 1
+            entry.retries += retries
+            entry.failures += 1
+            entry.statuses['error'] += 1
+
+    def downloaded(self, kind, size):
+        with self._lock:
+            self._requests[kind].bytes += size
+
+    def count(self, name, n=1):
+        u"""처리한 ``name`` (ex. ``foods``) 수를 늘립니다."""
+        with self._lock:
+            self._items[name] += n
+
+    def record(self, phase, seconds):
+        with self._lock:
+            self._phases[phase].add(seconds)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        u"""``with`` 블록에 걸린 시간을 ``name`` 단계로 셉니다."""
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, self.clock() - started)
+
+    def timed(self, name, function):
+        u"""부를 때마다 걸린 시간을 ``name`` 단계로 세는 ``function``."""
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def summary(self):
+        u"""지금까지의 통계를 JSON으로 바꿀 수 있는 :class:`dict` 로."""
+        elapsed = max(self.clock() - self.started, 1e-9)
+        with self._lock:
+            requests = dict((kind, entry.as_dict())
+                            for kind, entry in self._requests.items())
+            phases = dict((name, timing.as_dict())
+                          for name, timing in self._phases.items())
+            items = dict(self._items)
+        total = sum(r['count'] for r in requests.values())
+        size = sum(r['bytes'] for r in requests.values())
+        return dict(
+            elapsed=elapsed, items=items,
+            rates=dict(
+                [('requests', total / elapsed), ('bytes', size / elapsed)] +
+                [(name, n / elapsed) for name, n in items.items()]),
+            requests=requests, phases=phases,
+            totals=dict(
+                requests=total, bytes=size,
+                retries=sum(r['retries'] for r in requests.values()),
+                failures=sum(r['failures'] for r in requests.values())))
+
+    def format(self):
+        u"""진행 상황 한 줄."""
+        s = self.summary()
+        totals, rates = s['totals'], s['rates']
+        parts = ['%ds' % s['elapsed']]
+        parts.extend('%s %d (%.1f/s)' % (name, n, rates[name])
+                     for name, n in sorted(s['items'].items()))
+        parts.append('requests %d (%.1f/s, %.1f KiB/s, %d retries, '
+                     '%d failed)' % (totals['requests'], rates['requests'],
+                                     rates['bytes'] / 1024,
+                                     totals['retries'], totals['failures']))
+        phases = s['phases']
+        if phases:
+            parts.append(' '.join(
+                '%s %.0fms' % (name, phases[name]['mean'] * 1000)
+                for name in sorted(phases)))
+        return ' | '.join(parts)
+
+
+class ProgressReporter(object):
+    u"""``interval`` 초마다 :meth:`CrawlStats.format` 을 ``write`` 로
+    내보내는 스레드.  ``with`` 문으로 씁니다.
+
+    """
+
+    def __init__(self, stats, write, interval=10.0):
+        self.stats = stats
+        self.write = write
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write(self.stats.format())
+
+    def __enter__(self):
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._run,
+                                            name='crawl-progress')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.loader` --- Writing crawled foods into the database
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+from __future__ import absolute_import
+
+import collections
+import time
+
+from sqlalchemy import bindparam, func
+from sqlalchemy.sql import select
+
+from .model.koreafood import (Aliment, association_food_aliment_table, Food,
+                              FoodNutrition, NUTRIENTS)
+from .model.revision import bump_revision
+
+__all__ = 'BulkLoader', 'REVISION', 'mark_stale', 'refresh_nutrition'
+
+#: 로더가 쓸 때마다 올리는 :class:`~seektam.model.revision.Revision` 이름
+REVISION = u'koreafood'
+
+
+def _chunks(seq, size):
+    seq = list(seq)
+    for n in range(0, len(seq), size):
+        yield seq[n:n+size]
+
+
+def _data_columns(table):
+    return [c for c in table.columns if not c.primary_key]
+
+
+def _same(old, new):
+    u"""DB에 저장한 값과 새 값이 같은지.  ``FLOAT`` 가 단정밀도인 DB도
+    있으므로 조금 다른 것은 같게 봅니다.
+
+    """
+    if old is None or new is None:
+        return old is new
+    return abs(old - new) <= 1e-5 * max(abs(old), abs(new))
+
+
+def _row(obj, columns):
+    u"""``obj`` 의 속성으로 executemany에 넘길 행을 만듭니다.
+
+    executemany는 모든 행에 같은 키가 있어야 하므로, 값이 ``None`` 인
+    열은 빼는 대신 열의 기본값으로 채웁니다.
+
+    """
+    row = {}
+    for c in columns:
+        value = getattr(obj, c.name)
+        if value is None and c.default is not None and c.default.is_scalar:
+            value = c.default.arg
+        row[c.name] = value
+    return row
+
+
+class BulkLoader(object):
+    u""":func:`~seektam.crawl.koreafood.food_to_model` 로 만든 음식 모델을
+    모아 두었다가 한 번에 씁니다.
+
+    음식 하나마다 ``merge`` 와 ``commit`` 을 하는 대신, ``batch_size`` 개씩
+    모아 ``koreafood_aliments``, ``koreafood_foods``,
+    ``koreafood_food_aliment_rels`` 에 executemany로 넣고 묶음마다
+    트랜잭션을 한 번만 커밋합니다.  음식은 이름으로, 재료는 이름으로
+    찾아 이미 있으면 갱신합니다.  영양소 값이 바뀐 재료는 그 재료를 쓰는
+    다른 음식들의 영양소 합계도 다시 계산합니다.
+
+    :param session: 쓸 :class:`~sqlalchemy.orm.session.Session`
+    :param batch_size: 한 트랜잭션에 쓸 음식 수
+    :param on_flush: 묶음을 커밋한 뒤 인자 없이 부를 함수
+    :param stats: 묶음을 쓰는 데 걸린 시간을 ``write`` 단계로, 쓴 음식
+                  수를 ``written`` 으로 셀
+                  :class:`~seektam.crawl.stats.CrawlStats`
+
+    """
+
+    #: ``IN`` 절 하나에 넣을 최대 값 수 (SQLite 변수 개수 제한)
+    in_clause_limit = 500
+
+    def __init__(self, session, batch_size=500, on_flush=None, stats=None):
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive: %r' % (batch_size,))
+        self.session = session
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.stats = stats
+        self.buffer = []
+
+    def add(self, food):
+        u"""음식 모델을 버퍼에 넣고, 버퍼가 차면 :meth:`flush` 합니다."""
+        self.buffer.append(food)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        u"""버퍼에 모인 음식을 한 트랜잭션으로 씁니다."""
+        if not self.buffer:
+            if self.on_flush is not None:
+                self.on_flush()
+            return
+        foods = collections.OrderedDict()
+        for food in self.buffer:  # 같은 이름은 나중 것을 씁니다
+            foods.pop(food.name, None)
+            foods[food.name] = food
+        foods = foods.values()
+        self.buffer = []
+        started = time.time()
+        try:
+            aliment_ids, changed = self._write_aliments(foods)
+            food_ids = self._write_foods(foods)
+            self._write_rels(foods, food_ids, aliment_ids)
+            refresh_nutrition(
+                self.session,
+                sorted(set(food_ids.values()) | self._foods_using(changed)))
+            bump_revision(self.session, REVISION)
+        except Exception:
+            self.session.rollback()
+            raise
+        self.session.commit()
+        if self.stats is not None:
+            self.stats.record('write', time.time() - started)
+            self.stats.count('written', len(foods))
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def _ids_by(self, column, values):
+        ids = {}
+        for chunk in _chunks(values, self.in_clause_limit):
+            query = select([column, column.table.c.id]).where(
+                column.in_(chunk))
+            ids.update(self.session.execute(query).fetchall())
+        return ids
+
+    def _write_aliments(self, foods):
+        table = Aliment.__table__
+        columns = _data_columns(table)
+        aliments = collections.OrderedDict()
+        for food in foods:
+            for aliment in food.aliments:
+                aliments.setdefault(aliment.name, aliment)
+
+        # 이미 있는 재료도 새로 파싱한 값으로 고칩니다.  예전 파서가 열을
+        # 밀려 읽어 저장한 값이 남지 않도록.
+        ids = {}
+        updates = []
+        nutrients = [table.c[name] for name in NUTRIENTS]
+        for chunk in _chunks(aliments, self.in_clause_limit):
+            query = select([table.c.name, table.c.id] + nutrients).where(
+                table.c.name.in_(chunk))
+            for row in self.session.execute(query):
+                ids[row.name] = row.id
+                update = _row(aliments[row.name], columns)
+                if not all(_same(row[c.name], update[c.name])
+                           for c in nutrients):
+                    update['_id'] = row.id
+                    updates.append(update)
+        if updates:
+            self.session.execute(
+                table.update().where(table.c.id == bindparam('_id')),
+                updates)
+
+        rows = [_row(aliments[name], columns)
+                for name in aliments if name not in ids]
+        if rows:
+            self.session.execute(table.insert(), rows)
+            ids.update(self._ids_by(
+                table.c.name, [row['name'] for row in rows]))
+        return ids, [u['_id'] for u in updates]
+
+    def _foods_using(self, aliment_ids):
+        table = association_food_aliment_table
+        food_ids = set()
+        for chunk in _chunks(aliment_ids, self.in_clause_limit):
+            query = select([table.c.food_id]).where(
+                table.c.aliment_id.in_(chunk)).distinct()
+            food_ids.update(row.food_id for row in self.session.execute(query))
+        return food_ids
+
+    def _write_foods(self, foods):
+        table = Food.__table__
+        columns = _data_columns(table)
+        rows = collections.OrderedDict()
+        for food in foods:
+            rows[food.name] = _row(food, columns)
+
+        # 식단 코드가 있으면 코드로, 없으면 이름으로 기존 행을 찾습니다
+        ids = {}
+        by_code = self._ids_by(
+            table.c.meal_code,
+            [row['meal_code'] for row in rows.values() if row['meal_code']])
+        for name, row in rows.items():
+            if row['meal_code'] in by_code:
+                ids[name] = by_code[row['meal_code']]
+        ids.update(self._ids_by(
+            table.c.name, [name for name in rows if name not in ids]))
+
+        updates = []
+        for name in ids:
+            update = dict(rows[name])
+            update['_id'] = ids[name]
+            updates.append(update)
+        if updates:
+            self.session.execute(
+                table.update().where(table.c.id == bindparam('_id')),
+                updates)
+
+        inserts = [values for name, values in rows.items()
+                   if name not in ids]
+        if inserts:
+            self.session.execute(table.insert(), inserts)
+            ids.update(self._ids_by(
+                table.c.name, [row['name'] for row in inserts]))
+        return ids
+
+    def _write_rels(self, foods, food_ids, aliment_ids):
+        table = association_food_aliment_table
+        for chunk in _chunks(food_ids.values(), self.in_clause_limit):
+            self.session.execute(
+                table.delete().where(table.c.food_id.in_(chunk)))
+
+        rels = {}
+        for food in foods:
+            food_id = food_ids[food.name]
+            for rel in food.food_aliments:
+                key = food_id, aliment_ids[rel.aliment.name]
+                if rels.get(key) is not None and rel.weight is not None:
+                    rels[key] += rel.weight  # 같은 재료가 두 번 나오면 더합니다
+                else:
+                    rels[key] = rel.weight
+        if rels:
+            self.session.execute(
+                table.insert(),
+                [dict(food_id=f, aliment_id=a, weight=rels[f, a])
+                 for f, a in sorted(rels)])
+
+
+def refresh_nutrition(session, food_ids=None):
+    u"""음식들의 :class:`~seektam.model.koreafood.FoodNutrition` 을 재료
+    표에서 다시 계산합니다.  재료의 1g당 값에 음식에 든 중량을 곱해
+    더하며, 중량을 모르는 재료는 1g으로 칩니다.  커밋은 부른 쪽에서
+    합니다.
+
+    :param session: 쓸 :class:`~sqlalchemy.orm.session.Session`
+    :param food_ids: 다시 계산할 음식 ID들.  ``None`` 이면 모든 음식
+
+    """
+    table = FoodNutrition.__table__
+    foods = Food.__table__
+    rels = association_food_aliment_table
+    aliments = Aliment.__table__
+
+    def totals(where):
+        weight = func.coalesce(rels.c.weight, 1.0)
+        query = select(
+            [foods.c.id] +
+            [func.sum(aliments.c[name] * weight) for name in NUTRIENTS]
+        ).select_from(
+            foods.outerjoin(rels, rels.c.food_id == foods.c.id)
+                 .outerjoin(aliments, aliments.c.id == rels.c.aliment_id)
+        ).group_by(foods.c.id)
+        if where is not None:
+            query = query.where(where)
+        return table.insert().from_select(
+            ['food_id'] + list(NUTRIENTS), query)
+
+    if food_ids is None:
+        session.execute(table.delete())
+        session.execute(totals(None))
+        return
+    for chunk in _chunks(food_ids, BulkLoader.in_clause_limit):
+        session.execute(table.delete().where(table.c.food_id.in_(chunk)))
+        session.execute(totals(foods.c.id.in_(chunk)))
+
+
+def mark_stale(session, seen_codes):
+    u"""``seen_codes`` 에 없는 식단 코드의 음식을 오래된 것으로 표시하고,
+    있는 음식은 표시를 지웁니다.
+
+    :param session: 쓸 :class:`~sqlalchemy.orm.session.Session`
+    :param seen_codes: 이번 크롤링에서 목록에 나온 식단 코드들
+    :returns: 오래된 것으로 표시된 음식 수
+
+    """
+    table = Food.__table__
+    stale = {}
+    query = select([table.c.meal_code, table.c.stale]).where(
+        table.c.meal_code != None)  # noqa
+    for code, was_stale in session.execute(query):
+        is_stale = code not in seen_codes
+        if bool(was_stale) != is_stale:
+            stale.setdefault(is_stale, []).append(code)
+    for is_stale, codes in stale.items():
+        for chunk in _chunks(codes, BulkLoader.in_clause_limit):
+            session.execute(
+                table.update().where(table.c.meal_code.in_(chunk)),
+                dict(stale=is_stale))
+    if stale:
+        bump_revision(session, REVISION)
+    session.commit()
+    return session.execute(
+        select([func.count()]).select_from(table).where(
+            table.c.stale == True)  # noqa
+    ).scalar()
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.mealplan` --- Meal plans that meet daily targets
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+하루치 음식 합계가 열량 범위, 최소 단백질, 최대 나트륨을 맞추도록
+음식들을 고릅니다.  하루는 자리(slot) 몇 개로 이루어지고, 밥류 하나와
+국류 하나처럼 정해 둔 분류의 자리가 먼저 옵니다.  나머지 자리에서는 한
+분류에서 너무 많이 고르지 않습니다.
+
+:class:`~seektam.similarity.SimilarityMatrix` 의 영양소 행렬 위에서,
+모든 후보의 점수를 한 번에 계산하는 탐욕법으로 시작한 뒤 자리 하나를
+바꿔 나아지지 않을 때까지 국소 탐색합니다.
+
+.. code-block:: python
+
+   planner = MealPlanner(matrix, required=[(u'밥류', 1), (u'국류', 1)])
+   for day in planner.plan(days=7):
+       print day
+
+"""
+from __future__ import absolute_import
+
+import collections
+
+import numpy
+
+from .model.koreafood import NUTRIENTS
+
+__all__ = 'COLUMNS', 'DEFAULT_TARGETS', 'MealPlanner', 'Targets', \
+    'parse_required'
+
+#: 하루 목표.  열량(kcal)은 범위, 단백질(g)은 최소, 나트륨(mg)은 최대.
+Targets = collections.namedtuple(
+    'Targets', ['energy_min', 'energy_max', 'protein_min', 'sodium_max'])
+
+#: 성인 하루 기준의 기본 목표
+DEFAULT_TARGETS = Targets(1800.0, 2400.0, 55.0, 2000.0)
+
+#: 고려하는 영양소와 :meth:`MealPlanner.totals` 의 키
+COLUMNS = 'energy', 'protein', 'sodium'
+
+_EPSILON = 1e-9
+
+
+def _under(values, target):
+    u"""``values`` 가 ``target`` 에 모자란 양의 ``target`` 에 대한 비율."""
+    return numpy.maximum(target - values, 0) / max(target, _EPSILON)
+
+
+def _over(values, target):
+    u"""``values`` 가 ``target`` 을 넘는 양의 ``target`` 에 대한 비율."""
+    return numpy.maximum(values - target, 0) / max(target, _EPSILON)
+
+
+def parse_required(values):
+    u"""``u'밥류'`` 나 ``u'반찬류:2'`` 같은 문자열들을 :class:`MealPlanner`
+    의 ``required`` 로 바꿉니다.
+
+    :raises ValueError: 수가 정수가 아닐 때
+
+    """
+    required = []
+    for value in values:
+        name, sep, count = value.rpartition(u':')
+        if not sep:
+            name, count = value, u'1'
+        required.append((name, int(count)))
+    return required
+
+
+class MealPlanner(object):
+    u"""식단을 짭니다.
+
+    :param matrix: :class:`~seektam.similarity.SimilarityMatrix`
+    :param targets: 하루 :class:`Targets`
+    :param size: 하루에 고를 음식 수
+    :param required: ``(대분류, 수)`` 쌍들.  하루에 그 분류에서 꼭 고를
+                     음식 수
+    :param max_per_category: 하루에 한 대분류에서 고를 최대 음식 수.
+                             ``required`` 에 준 수가 더 크면 그 수
+    :param max_iterations: 국소 탐색에서 자리를 바꿀 최대 횟수
+
+    열량을 모르는 (합계가 0인) 음식은 고르지 않습니다.
+
+    """
+
+    def __init__(self, matrix, targets=DEFAULT_TARGETS, size=6, required=(),
+                 max_per_category=1, max_iterations=100):
+        if size < 1:
+            raise ValueError('size must be positive: %r' % (size,))
+        self.matrix = matrix
+        self.targets = Targets(*targets)
+        self.size = size
+        self.max_iterations = max_iterations
+        columns = [NUTRIENTS.index(name) for name in COLUMNS]
+        self.values = numpy.asarray(matrix.raw, dtype=numpy.float64)[
+            :, columns]
+        self.category = numpy.asarray(matrix.category_big)
+        self.usable = self.values[:, 0] > 0
+        names = matrix.categories['category_big']
+        self.slots = []
+        limits = collections.defaultdict(lambda: max_per_category)
+        for name, count in required:
+            if name not in names:
+                raise ValueError(u'unknown category: ' + name)
+            code = names.index(name)
+            limits[code] = max(limits[code], count)
+            self.slots.extend([code] * count)
+        if len(self.slots) > size:
+            raise ValueError('size %d is less than the required foods %d' %
+                             (size, len(self.slots)))
+        self.slots.extend([None] * (size - len(self.slots)))
+        self.limits = numpy.array(
+            [limits[c] for c in range(len(names))] + [max_per_category],
+            dtype=numpy.int64)  # 마지막은 분류가 없는 음식 (-1)
+
+    def penalty(self, totals, fraction=1.0):
+        u"""합계 ``totals`` (``(m, 3)`` 배열) 가 목표에서 벗어난 정도.
+        ``fraction`` 은 목표 가운데 채워야 할 몫입니다.
+
+        """
+        t = self.targets
+        lo, hi = t.energy_min * fraction, t.energy_max * fraction
+        protein, sodium = t.protein_min * fraction, t.sodium_max * fraction
+        energy = totals[:, 0]
+        middle = max((lo + hi) / 2, _EPSILON)
+        return (_under(energy, lo) + _over(energy, hi) +
+                _under(totals[:, 1], protein) + _over(totals[:, 2], sodium) +
+                # 같은 값이면 범위 가운데에 가까운 쪽
+                0.01 * numpy.abs(energy - middle) / middle)
+
+    def _allowed(self, slot, chosen, excluded):
+        u"""``chosen`` (행 번호들) 에 더해 ``slot`` 자리에 올 수 있는
+        후보 행이 참인 배열.
+
+        """
+        allowed = self.usable & ~excluded
+        if self.slots[slot] is not None:
+            allowed &= self.category == self.slots[slot]
+        counts = numpy.bincount(self.category[chosen] + 1,
+                                minlength=len(self.limits))
+        full = counts[1:] >= self.limits[:-1]
+        allowed &= ~full[self.category] | (self.category < 0)
+        if counts[0] >= self.limits[-1]:
+            allowed &= self.category >= 0
+        allowed[chosen] = False
+        return allowed
+
+    def day(self, exclude=()):
+        u"""하루 식단.  ``exclude`` 에 든 음식 ID는 고르지 않습니다.
+
+        :returns: 음식 ID 목록 (자리 순서)
+        :raises ValueError: 자리를 채울 음식이 모자랄 때
+
+        """
+        excluded = numpy.zeros(len(self.values), dtype=bool)
+        if exclude:
+            ids = numpy.asarray(sorted(exclude), dtype=numpy.int64)
+            excluded[numpy.in1d(self.matrix.ids, ids)] = True
+        # 후보가 적은 자리부터 탐욕적으로 채웁니다
+        order = sorted(range(self.size), key=lambda slot: (
+            self.slots[slot] is None,
+            (self.category == self.slots[slot]).sum()
+            if self.slots[slot] is not None else 0))
+        chosen = numpy.zeros(self.size, dtype=numpy.int64)
+        totals = numpy.zeros(len(COLUMNS))
+        for n, slot in enumerate(order):
+            allowed = self._allowed(slot, chosen[order[:n]], excluded)
+            candidates = numpy.flatnonzero(allowed)
+            if not len(candidates):
+                raise ValueError('not enough foods for slot %d' % slot)
+            scores = self.penalty(totals + self.values[candidates],
+                                  float(n + 1) / self.size)
+            chosen[slot] = candidates[numpy.argmin(scores)]
+            totals += self.values[chosen[slot]]
+        return [int(self.matrix.ids[row])
+                for row in self._improve(chosen, excluded)]
+
+    def _improve(self, chosen, excluded):
+        u"""자리 하나를 가장 많이 나아지게 바꾸기를 더 나아지지 않을
+        때까지 되풀이합니다.
+
+        """
+        totals = self.values[chosen].sum(axis=0)
+        current = self.penalty(totals[numpy.newaxis])[0]
+        for _ in range(self.max_iterations):
+            best = current - _EPSILON, None, None
+            for slot in range(self.size):
+                others = numpy.delete(chosen, slot)
+                candidates = numpy.flatnonzero(
+                    self._allowed(slot, others, excluded))
+                if not len(candidates):
+                    continue
+                scores = self.penalty(totals - self.values[chosen[slot]] +
+                                      self.values[candidates])
+                n = numpy.argmin(scores)
+                if scores[n] < best[0]:
+                    best = scores[n], slot, candidates[n]
+            score, slot, row = best
+            if slot is None:
+                break
+            totals += self.values[row] - self.values[chosen[slot]]
+            chosen[slot] = row
+            current = score
+        return chosen
+
+    def plan(self, days=1, repeat=False):
+        u"""``days`` 일치 식단.  ``repeat`` 가 거짓이면 앞선 날에 고른
+        음식은 다시 고르지 않습니다.
+
+        :returns: 날마다 음식 ID 목록
+
+        """
+        result = []
+        used = set()
+        for _ in range(days):
+            day = self.day(() if repeat else used)
+            used.update(day)
+            result.append(day)
+        return result
+
+    def totals(self, food_ids):
+        u"""``food_ids`` 의 :data:`COLUMNS` 영양소 합계."""
+        rows = self.matrix.rows(food_ids)
+        return dict(zip(COLUMNS, self.values[rows].sum(axis=0).tolist()))
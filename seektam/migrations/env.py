@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import with_statement
+
+from alembic import context
+from sqlalchemy import engine_from_config, pool
+
+from seektam.model import koreafood, revision  # noqa  (테이블 등록)
+from seektam.model.orm import Base
+
+config = context.config
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    context.configure(
+        url=config.get_main_option('sqlalchemy.url'),
+        target_metadata=target_metadata, literal_binds=True,
+        render_as_batch=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    engine = engine_from_config(
+        config.get_section(config.config_ini_section),
+        prefix='sqlalchemy.', poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        # SQLite는 ALTER TABLE이 약하므로 batch 모드로 표를 다시 만듭니다
+        context.configure(
+            connection=connection, target_metadata=target_metadata,
+            render_as_batch=True)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
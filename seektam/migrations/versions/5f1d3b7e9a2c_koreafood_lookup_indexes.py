@@ -0,0 +1,36 @@
+"""indexes for category browsing, reverse aliment lookup and nutrient ranges
+
+Revision ID: 5f1d3b7e9a2c
+Revises: e4b8a2d6c0f1
+Create Date: 2026-10-18 09:30:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5f1d3b7e9a2c'
+down_revision = 'e4b8a2d6c0f1'
+branch_labels = None
+depends_on = None
+
+RANGE_COLUMNS = 'protein', 'fat', 'nonfiborous', 'sodium'
+
+
+def upgrade():
+    op.create_index('ix_koreafood_foods_category', 'koreafood_foods',
+                    ['category_big', 'category_small'])
+    op.create_index('ix_koreafood_food_aliment_rels_aliment',
+                    'koreafood_food_aliment_rels', ['aliment_id', 'food_id'])
+    for column in RANGE_COLUMNS:
+        op.create_index('ix_koreafood_food_nutrition_' + column,
+                        'koreafood_food_nutrition', [column])
+
+
+def downgrade():
+    for column in RANGE_COLUMNS:
+        op.drop_index('ix_koreafood_food_nutrition_' + column,
+                      'koreafood_food_nutrition')
+    op.drop_index('ix_koreafood_food_aliment_rels_aliment',
+                  'koreafood_food_aliment_rels')
+    op.drop_index('ix_koreafood_foods_category', 'koreafood_foods')
@@ -0,0 +1,53 @@
+"""initial koreafood schema
+
+Revision ID: a3c1e6f0b2d4
+Revises: None
+Create Date: 2026-10-18 09:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c1e6f0b2d4'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+NUTRIENTS = (
+    'energy', 'moisture', 'protein', 'fat', 'nonfiborous', 'fiber', 'ash',
+    'calcium', 'phosphorus', 'iron', 'sodium', 'potassium',
+    'retinol_equivalent', 'retinol', 'betacarotene', 'thiamin', 'riboflavin',
+    'niacin', 'ascobic_acid',
+)
+
+
+def upgrade():
+    op.create_table(
+        'koreafood_foods',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.Unicode(200), nullable=True),
+        sa.Column('category_big', sa.Unicode(20), nullable=True),
+        sa.Column('category_small', sa.Unicode(20), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'))
+    op.create_table(
+        'koreafood_aliments',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.Unicode(200), nullable=True),
+        *([sa.Column(name, sa.Float(), nullable=True) for name in NUTRIENTS] +
+          [sa.PrimaryKeyConstraint('id'), sa.UniqueConstraint('name')]))
+    op.create_table(
+        'koreafood_food_aliment_rels',
+        sa.Column('food_id', sa.Integer(), nullable=False),
+        sa.Column('aliment_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['aliment_id'], ['koreafood_aliments.id']),
+        sa.ForeignKeyConstraint(['food_id'], ['koreafood_foods.id']),
+        sa.PrimaryKeyConstraint('food_id', 'aliment_id'))
+
+
+def downgrade():
+    op.drop_table('koreafood_food_aliment_rels')
+    op.drop_table('koreafood_aliments')
+    op.drop_table('koreafood_foods')
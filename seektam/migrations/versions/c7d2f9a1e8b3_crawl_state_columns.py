@@ -0,0 +1,39 @@
+"""crawl state columns on koreafood_foods
+
+Revision ID: c7d2f9a1e8b3
+Revises: a3c1e6f0b2d4
+Create Date: 2026-10-18 09:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2f9a1e8b3'
+down_revision = 'a3c1e6f0b2d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('koreafood_foods') as batch:
+        batch.add_column(sa.Column('meal_code', sa.Unicode(20), nullable=True))
+        batch.add_column(
+            sa.Column('list_fingerprint', sa.String(40), nullable=True))
+        batch.add_column(
+            sa.Column('analysis_fingerprint', sa.String(40), nullable=True))
+        batch.add_column(
+            sa.Column('stale', sa.Boolean(), nullable=False,
+                      server_default=sa.false()))
+        batch.create_unique_constraint(
+            'uq_koreafood_foods_meal_code', ['meal_code'])
+
+
+def downgrade():
+    with op.batch_alter_table('koreafood_foods') as batch:
+        batch.drop_constraint('uq_koreafood_foods_meal_code', type_='unique')
+        batch.drop_column('stale')
+        batch.drop_column('analysis_fingerprint')
+        batch.drop_column('list_fingerprint')
+        batch.drop_column('meal_code')
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""revisions, per-food nutrition totals and aliment weights
+
+Revision ID: e4b8a2d6c0f1
+Revises: c7d2f9a1e8b3
+Create Date: 2026-10-18 09:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b8a2d6c0f1'
+down_revision = 'c7d2f9a1e8b3'
+branch_labels = None
+depends_on = None
+
+NUTRIENTS = (
+    'energy', 'moisture', 'protein', 'fat', 'nonfiborous', 'fiber', 'ash',
+    'calcium', 'phosphorus', 'iron', 'sodium', 'potassium',
+    'retinol_equivalent', 'retinol', 'betacarotene', 'thiamin', 'riboflavin',
+    'niacin', 'ascobic_acid',
+)
+
+
+def upgrade():
+    op.create_table(
+        'revisions',
+        sa.Column('name', sa.Unicode(50), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name'))
+    # 합계는 다음 loader 실행이 비어 있는 표를 보고 채웁니다
+    op.create_table(
+        'koreafood_food_nutrition',
+        sa.Column('food_id', sa.Integer(), nullable=False),
+        *([sa.Column(name, sa.Float(), nullable=True) for name in NUTRIENTS] +
+          [sa.ForeignKeyConstraint(['food_id'], ['koreafood_foods.id']),
+           sa.PrimaryKeyConstraint('food_id')]))
+    op.create_index('ix_koreafood_food_nutrition_energy',
+                    'koreafood_food_nutrition', ['energy'])
+    with op.batch_alter_table('koreafood_food_aliment_rels') as batch:
+        batch.add_column(sa.Column('weight', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('koreafood_food_aliment_rels') as batch:
+        batch.drop_column('weight')
+    op.drop_index('ix_koreafood_food_nutrition_energy',
+                  'koreafood_food_nutrition')
+    op.drop_table('koreafood_food_nutrition')
+    op.drop_table('revisions')
@@ -1,38 +1,91 @@
 # -*- coding: utf-8 -*-
 
+from sqlalchemy import Boolean
 from sqlalchemy import Column
 from sqlalchemy import Float
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
-from sqlalchemy import Table
+from sqlalchemy import String
 from sqlalchemy import Unicode
+from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import relationship
 
 from .orm import Base
 
-
-association_food_aliment_table = Table(
-    'koreafood_food_aliment_rels',
-    Base.metadata,
-    Column(
-        'food_id', Integer, ForeignKey('koreafood_foods.id'),
-        primary_key=True),
-    Column(
-        'aliment_id', Integer, ForeignKey('koreafood_aliments.id'),
-        primary_key=True)
+#: :class:`Aliment` 의 영양소 열 이름들 (분석 페이지의 열 순서)
+NUTRIENTS = (
+    'energy', 'moisture', 'protein', 'fat', 'nonfiborous', 'fiber', 'ash',
+    'calcium', 'phosphorus', 'iron', 'sodium', 'potassium',
+    'retinol_equivalent', 'retinol', 'betacarotene', 'thiamin', 'riboflavin',
+    'niacin', 'ascobic_acid',
 )
 
 
+class FoodAliment(Base):
+    u"""음식에 들어가는 재료와 그 양."""
+
+    __tablename__ = 'koreafood_food_aliment_rels'
+    __table_args__ = (
+        # 재료로 음식 찾기 ("X가 든 음식")
+        Index('ix_koreafood_food_aliment_rels_aliment',
+              'aliment_id', 'food_id'),
+    )
+
+    food_id = Column(
+        Integer, ForeignKey('koreafood_foods.id'), primary_key=True)
+    aliment_id = Column(
+        Integer, ForeignKey('koreafood_aliments.id'), primary_key=True)
+    #: 음식 1인분에 들어가는 재료의 중량(g).  모르면 ``None``
+    weight = Column(Float)
+    # backref가 아니므로 :attr:`Aliment.food_aliments` 에 이 행을 넣지
+    # 않습니다
+    aliment = relationship('Aliment')
+
+    def __init__(self, aliment=None, weight=None, **kwargs):
+        super(FoodAliment, self).__init__(
+            aliment=aliment, weight=weight, **kwargs)
+
+
+association_food_aliment_table = FoodAliment.__table__
+
+
 class Food(Base):
     __tablename__ = 'koreafood_foods'
+    __table_args__ = (
+        # 대분류, 대분류+소분류로 찾기
+        Index('ix_koreafood_foods_category', 'category_big', 'category_small'),
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(Unicode(200), unique=True)
     category_big = Column(Unicode(20))
     category_small = Column(Unicode(20))
-    aliments = relationship(
-        'Aliment',
-        secondary=association_food_aliment_table)
+    #: 농식품종합정보시스템의 식단 코드 (ex. ``D011010``)
+    meal_code = Column(Unicode(20), unique=True)
+    #: 목록 행(이름, 분류, 코드)의 SHA-1 지문
+    list_fingerprint = Column(String(40))
+    #: 분석 페이지 내용의 SHA-1 지문
+    analysis_fingerprint = Column(String(40))
+    #: 마지막 크롤링에서 목록에 없었으면 참
+    stale = Column(Boolean, nullable=False, default=False)
+    #: 재료와 중량 (:class:`FoodAliment`) 목록
+    food_aliments = relationship(
+        'FoodAliment', cascade='all, delete-orphan')
+    #: 재료 (:class:`Aliment`) 목록.  :attr:`food_aliments` 를 거치며,
+    #: 여기에 넣은 재료는 중량을 모르는 것으로 들어갑니다.
+    aliments = association_proxy('food_aliments', 'aliment')
+    #: 재료 영양소의 합 (:class:`FoodNutrition`).  로더가 씁니다.
+    nutrition = relationship(
+        'FoodNutrition', uselist=False, viewonly=True)
+
+    def nutrient(self, name):
+        u"""영양소 ``name`` 의 합.  아직 계산되지 않았으면 ``None``."""
+        if name not in NUTRIENTS:
+            raise ValueError('unknown nutrient: %r' % (name,))
+        if self.nutrition is None:
+            return None
+        return getattr(self.nutrition, name)
 
 
 class Aliment(Base):
@@ -59,3 +112,43 @@ class Aliment(Base):
     riboflavin = Column(Float)
     niacin = Column(Float)
     ascobic_acid = Column(Float)
+    #: 이 재료가 든 :class:`FoodAliment` 목록.  재료를 지우면 함께
+    #: 지웁니다.  :attr:`FoodAliment.aliment` 의 backref가 아니므로 처음
+    #: 읽을 때 DB에서 가져오고, 로더가 재료를 캐시해 두는 동안 새로 만든
+    #: 행과 음식을 붙잡지 않습니다.
+    food_aliments = relationship('FoodAliment', cascade='all, delete-orphan')
+
+
+class FoodNutrition(Base):
+    u"""음식마다 재료 영양소를 미리 더해 둔 표.
+
+    조회할 때마다 재료 표와 조인해 더하지 않도록
+    :class:`~seektam.loader.BulkLoader` 가 바뀐 음식만 다시 계산해
+    둡니다.  열은 :data:`NUTRIENTS` 와 같으며, 범위로 자주 거르는
+    열에는 인덱스가 있습니다.
+
+    """
+
+    __tablename__ = 'koreafood_food_nutrition'
+
+    food_id = Column(
+        Integer, ForeignKey('koreafood_foods.id'), primary_key=True)
+    energy = Column(Float, index=True)
+    moisture = Column(Float)
+    protein = Column(Float, index=True)
+    fat = Column(Float, index=True)
+    nonfiborous = Column(Float, index=True)
+    fiber = Column(Float)
+    ash = Column(Float)
+    calcium = Column(Float)
+    phosphorus = Column(Float)
+    iron = Column(Float)
+    sodium = Column(Float, index=True)
+    potassium = Column(Float)
+    retinol_equivalent = Column(Float)
+    retinol = Column(Float)
+    betacarotene = Column(Float)
+    thiamin = Column(Float)
+    riboflavin = Column(Float)
+    niacin = Column(Float)
+    ascobic_acid = Column(Float)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import func
+from sqlalchemy import Integer
+from sqlalchemy import Unicode
+from sqlalchemy.sql import select
+
+from .orm import Base
+
+
+class Revision(Base):
+    u"""데이터 묶음이 바뀔 때마다 올라가는 번호.
+
+    로더가 ``koreafood`` 데이터를 쓸 때마다 번호를 올리므로, 웹
+    애플리케이션은 번호만 보고 캐시한 응답이 아직 유효한지 압니다.
+
+    """
+
+    __tablename__ = 'revisions'
+
+    name = Column(Unicode(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=func.now(),
+                        onupdate=func.now())
+
+
+def bump_revision(session, name):
+    u"""``name`` 의 번호를 하나 올립니다.  커밋은 부른 쪽에서 합니다."""
+    table = Revision.__table__
+    result = session.execute(
+        table.update().where(table.c.name == name).values(
+            value=table.c.value + 1))
+    if not result.rowcount:
+        session.execute(table.insert().values(name=name, value=1))
+
+
+def get_revision(session, name):
+    u"""``name`` 의 현재 번호.  아직 없으면 0."""
+    table = Revision.__table__
+    value = session.execute(
+        select([table.c.value]).where(table.c.name == name)).scalar()
+    return value or 0
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.pipeline` --- Staged producer/consumer pipeline
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+from __future__ import absolute_import
+
+import Queue
+import sys
+import threading
+
+__all__ = 'Pipeline', 'Stage'
+
+_DONE = object()
+
+
+class _Stopped(Exception):
+    u"""파이프라인이 멈춰 스레드가 끝나야 할 때 일어납니다."""
+
+
+class _Failure(object):
+    u"""단계에서 일어난 예외.  항목 대신 다음 단계로 흘려 보내,
+    소비자가 그 항목의 차례에 다시 일으킵니다.
+
+    """
+
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+class Stage(object):
+    u"""파이프라인의 한 단계.
+
+    :param name: 단계 이름 (스레드 이름에 씁니다)
+    :param func: 앞 단계의 항목 하나를 받아 다음 단계로 넘길 항목을
+                 돌려주는 함수.  ``workers`` 개의 스레드에서 동시에
+                 불리므로 스레드에 안전해야 합니다.
+    :param workers: 이 단계를 돌릴 스레드 수
+    :param queue_size: 이 단계 앞에 둘 대기열의 최대 길이.  ``None``
+                       이면 :class:`Pipeline` 의 값을 씁니다.
+
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=None):
+        if workers < 1:
+            raise ValueError('workers must be positive: %r' % (workers,))
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size
+
+
+class Pipeline(object):
+    u"""항목을 여러 :class:`Stage` 에 차례로 흘려 보내는 파이프라인.
+
+    단계마다 따로 스레드를 두고 길이 제한이 있는 대기열로 잇습니다.
+    뒤 단계가 밀리면 앞 단계는 대기열에 자리가 날 때까지 기다리므로,
+    전체 시간은 단계들의 합이 아니라 가장 느린 단계에 가까워집니다.
+
+    :meth:`run` 은 결과를 원본과 같은 순서로 돌려줍니다.  단계에서
+    예외가 일어나면 그 앞 항목들을 모두 돌려준 뒤 그 자리에서 예외를
+    다시 일으킵니다.
+
+    :param stages: :class:`Stage` 목록
+    :param queue_size: 단계 사이 대기열의 기본 최대 길이
+
+    """
+
+    def __init__(self, stages, queue_size=100):
+        if queue_size < 1:
+            raise ValueError('queue_size must be positive: %r' % (queue_size,))
+        self.stages = list(stages)
+        self.queue_size = queue_size
+
+    @property
+    def window(self):
+        u"""한꺼번에 처리 중일 수 있는 최대 항목 수.  순서를 맞추려고
+        붙잡아 두는 결과도 여기에 포함됩니다.
+
+        """
+        return (sum((s.queue_size or self.queue_size) + s.workers
+                    for s in self.stages) + self.queue_size)
+
+    def run(self, source):
+        u"""``source`` 의 항목들을 단계에 흘려 보내고 마지막 단계의
+        결과를 원본 순서대로 내는 제너레이터를 돌려줍니다.
+
+        ``source`` 는 별도 스레드에서 돕니다.  결과를 다 읽기 전에
+        그만두려면 제너레이터의 ``close()`` 를 부르세요.
+
+        """
+        return _Run(self, source).results()
+
+
+class _Run(object):
+
+    poll_interval = 0.1
+
+    def __init__(self, pipeline, source):
+        self.stop = threading.Event()
+        self.tokens = Queue.Queue(pipeline.window)
+        self.inboxes = [Queue.Queue(s.queue_size or pipeline.queue_size)
+                        for s in pipeline.stages]
+        self.outbox = Queue.Queue()
+        self.threads = []
+        outboxes = self.inboxes[1:] + [self.outbox]
+        self._spawn('source', self._feed, source,
+                    self.inboxes[0] if self.inboxes else self.outbox)
+        for stage, inbox, outbox in zip(pipeline.stages, self.inboxes,
+                                        outboxes):
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for n in range(stage.workers):
+                self._spawn('%s-%d' % (stage.name, n), self._work,
+                            stage, inbox, outbox, remaining, lock)
+
+    def _spawn(self, name, target, *args):
+        thread = threading.Thread(target=self._guard, name=name,
+                                  args=(target,) + args)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def _guard(self, target, *args):
+        try:
+            target(*args)
+        except _Stopped:
+            pass
+
+    def _put(self, queue, entry):
+        while not self.stop.is_set():
+            try:
+                queue.put(entry, timeout=self.poll_interval)
+                return
+            except Queue.Full:
+                continue
+        raise _Stopped()
+
+    def _get(self, queue):
+        while not self.stop.is_set():
+            try:
+                return queue.get(timeout=self.poll_interval)
+            except Queue.Empty:
+                continue
+        raise _Stopped()
+
+    def _feed(self, source, outbox):
+        seq = 0
+        try:
+            for item in source:
+                self._put(self.tokens, None)
+                self._put(outbox, (seq, item))
+                seq += 1
+        except _Stopped:
+            raise
+        except Exception:
+            self._put(self.tokens, None)
+            self._put(outbox, (seq, _Failure(sys.exc_info())))
+        self._put(outbox, _DONE)
+
+    def _work(self, stage, inbox, outbox, remaining, lock):
+        while True:
+            entry = self._get(inbox)
+            if entry is _DONE:
+                self._put(inbox, _DONE)  # 같은 단계의 다른 스레드에게
+                with lock:
+                    remaining[0] -= 1
+                    last = not remaining[0]
+                if last:
+                    self._put(outbox, _DONE)
+                return
+            seq, item = entry
+            if not isinstance(item, _Failure):
+                try:
+                    item = stage.func(item)
+                except Exception:
+                    item = _Failure(sys.exc_info())
+            self._put(outbox, (seq, item))
+
+    def results(self):
+        pending = {}
+        next_seq = 0
+        try:
+            while True:
+                entry = self.outbox.get()
+                if entry is _DONE:
+                    break
+                seq, item = entry
+                pending[seq] = item
+                while next_seq in pending:
+                    item = pending.pop(next_seq)
+                    next_seq += 1
+                    self.tokens.get_nowait()
+                    if isinstance(item, _Failure):
+                        exc_type, exc_value, tb = item.exc_info
+                        raise exc_type, exc_value, tb
+                    yield item
+        finally:
+            self.stop.set()
+            for thread in self.threads:
+                thread.join()
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.search` --- In-memory food search index
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+재료로 음식을 찾는 역색인과, 음식과 재료 이름을 한글 음절 단위로 찾는
+색인입니다.  ID 목록은 모두 정렬된 :class:`array.array` 로 들고 있어
+작고, 교집합과 차집합은 이분 탐색으로 구합니다.
+
+.. code-block:: python
+
+   index = SearchIndex.build(session)
+   index.foods(with_aliments=[u'두부', u'파'], without=[u'돼지고기'])
+
+"""
+from __future__ import absolute_import
+
+import array
+import bisect
+import cPickle as pickle
+import collections
+import os
+import os.path
+import tempfile
+
+from sqlalchemy.sql import select
+
+from .loader import REVISION
+from .model.koreafood import Aliment, FoodAliment, Food
+from .model.revision import get_revision
+
+__all__ = ('NameIndex', 'SearchIndex', 'difference', 'intersect',
+           'ngrams', 'union')
+
+#: ID 배열의 형식 코드
+TYPECODE = 'i'
+
+
+def _ids(values=()):
+    return array.array(TYPECODE, values)
+
+
+def intersect(a, b):
+    u"""정렬된 두 ID 배열의 교집합."""
+    if len(a) > len(b):
+        a, b = b, a
+    result = _ids()
+    lo = 0
+    for value in a:
+        lo = bisect.bisect_left(b, value, lo)
+        if lo == len(b):
+            break
+        if b[lo] == value:
+            result.append(value)
+    return result
+
+
+def difference(a, b):
+    u"""정렬된 ID 배열 ``a`` 에서 ``b`` 에 있는 것을 뺍니다."""
+    result = _ids()
+    lo = 0
+    for value in a:
+        lo = bisect.bisect_left(b, value, lo)
+        if lo == len(b) or b[lo] != value:
+            result.append(value)
+    return result
+
+
+def union(arrays):
+    u"""정렬된 ID 배열들의 합집합."""
+    arrays = list(arrays)
+    if len(arrays) == 1:
+        return arrays[0]
+    values = set()
+    for ids in arrays:
+        values.update(ids)
+    return _ids(sorted(values))
+
+
+def _normalize(text):
+    return u''.join(text.lower().split())
+
+
+def ngrams(text, n=2):
+    u"""``text`` 의 글자(한글은 음절) ``n`` 개짜리 조각들."""
+    text = _normalize(text)
+    return set(text[i:i+n] for i in range(len(text) - n + 1))
+
+
+class NameIndex(object):
+    u"""이름으로 ID를 찾는 색인.
+
+    앞부분 검색은 정렬한 이름 목록을 이분 탐색하고, 부분 문자열 검색은
+    한 글자와 두 글자 조각의 역색인으로 후보를 좁힌 뒤 확인합니다.
+    한글 음절은 한 글자로 다루므로 "두부" 는 "두", "부", "두부" 조각이
+    됩니다.
+
+    :param items: ``(ID, 이름)`` 쌍들
+
+    """
+
+    def __init__(self, items):
+        entries = sorted((_normalize(name), id_) for id_, name in items)
+        self.keys = [key for key, _ in entries]
+        self.ids = _ids(id_ for _, id_ in entries)
+        self.names = dict((id_, name) for id_, name in items)
+        grams = collections.defaultdict(set)
+        for key, id_ in entries:
+            for n in 1, 2:
+                for gram in ngrams(key, n):
+                    grams[gram].add(id_)
+        self.grams = dict((gram, _ids(sorted(ids)))
+                          for gram, ids in grams.items())
+
+    def prefix(self, text):
+        u"""이름이 ``text`` 로 시작하는 ID들 (정렬됨)."""
+        text = _normalize(text)
+        if not text:
+            return _ids(sorted(self.ids))
+        lo = bisect.bisect_left(self.keys, text)
+        # 마지막 글자를 다음 코드 포인트로 바꾼 값이 범위의 끝입니다
+        hi = bisect.bisect_left(self.keys,
+                                text[:-1] + unichr(ord(text[-1]) + 1), lo)
+        return _ids(sorted(self.ids[lo:hi]))
+
+    def exact(self, text):
+        u"""이름이 ``text`` 와 같은 ID들 (정렬됨)."""
+        text = _normalize(text)
+        lo = bisect.bisect_left(self.keys, text)
+        hi = bisect.bisect_right(self.keys, text)
+        return _ids(sorted(self.ids[lo:hi]))
+
+    def contains(self, text):
+        u"""이름에 ``text`` 가 들어 있는 ID들 (정렬됨)."""
+        text = _normalize(text)
+        if not text:
+            return _ids()
+        grams = ngrams(text, 1 if len(text) == 1 else 2)
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(self.grams.get(g, ()))):
+            ids = self.grams.get(gram)
+            if ids is None:
+                return _ids()
+            candidates = ids if candidates is None else intersect(
+                candidates, ids)
+        if len(text) <= 2:
+            return candidates
+        return _ids(id_ for id_ in candidates
+                    if text in _normalize(self.names[id_]))
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class SearchIndex(object):
+    u"""음식 검색 색인.  :meth:`build` 로 DB에서 만듭니다.
+
+    :param foods: ``(음식 ID, 이름)`` 쌍들
+    :param aliments: ``(재료 ID, 이름)`` 쌍들
+    :param rels: ``(음식 ID, 재료 ID)`` 쌍들
+    :param revision: 색인을 만든 때의
+                     :class:`~seektam.model.revision.Revision` 번호
+
+    """
+
+    def __init__(self, foods, aliments, rels, revision=0):
+        foods = list(foods)
+        aliments = list(aliments)
+        self.revision = revision
+        self.food_names = NameIndex(foods)
+        self.aliment_names = NameIndex(aliments)
+        # 재료 이름은 "두부,일반두부" 처럼 쉼표로 나뉘므로 조각마다 찾습니다
+        self.aliment_tokens = NameIndex(
+            (id_, token) for id_, name in aliments
+            for token in name.split(u',') if token.strip())
+        food_ids = set(id_ for id_, _ in foods)
+        postings = collections.defaultdict(set)
+        for food_id, aliment_id in rels:
+            if food_id in food_ids:
+                postings[aliment_id].add(food_id)
+        #: 재료 ID마다 그 재료가 든 음식 ID 배열
+        self.postings = dict((aliment_id, _ids(sorted(ids)))
+                             for aliment_id, ids in postings.items())
+        self.all_foods = _ids(sorted(food_ids))
+
+    @classmethod
+    def build(cls, session):
+        u"""``session`` 의 DB에서 색인을 만듭니다.  오래된
+        (:attr:`~seektam.model.koreafood.Food.stale`) 음식은 뺍니다.
+
+        """
+        foods = Food.__table__
+        aliments = Aliment.__table__
+        rels = FoodAliment.__table__
+        revision = get_revision(session, REVISION)
+        return cls(
+            session.execute(select([foods.c.id, foods.c.name]).where(
+                foods.c.stale == False)),  # noqa
+            session.execute(select([aliments.c.id, aliments.c.name])),
+            session.execute(select([rels.c.food_id, rels.c.aliment_id])),
+            revision)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, path):
+        u"""색인을 ``path`` 에 원자적으로 저장합니다."""
+        dirname = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+
+    def aliments_named(self, term):
+        u"""재료 이름의 한 조각이 ``term`` 인 재료 ID들.  그런 재료가
+        없으면 ``term`` 으로 시작하는 조각이 있는 재료들.
+
+        """
+        ids = self.aliment_tokens.exact(term)
+        if not len(ids):
+            ids = self.aliment_tokens.prefix(term)
+        return _ids(sorted(set(ids)))
+
+    def foods_containing(self, term):
+        u"""``term`` 재료가 든 음식 ID들."""
+        return union([self.postings.get(aliment_id, _ids())
+                      for aliment_id in self.aliments_named(term)] or
+                     [_ids()])
+
+    def foods(self, name=None, prefix=False, with_aliments=(), without=()):
+        u"""조건에 맞는 음식 ID들 (정렬됨).
+
+        :param name: 음식 이름에 들어 있을 글자
+        :param prefix: 참이면 ``name`` 으로 시작하는 이름만
+        :param with_aliments: 모두 들어 있어야 할 재료들
+        :param without: 하나도 들어 있으면 안 될 재료들
+
+        """
+        result = self.all_foods
+        if name:
+            result = intersect(result, (
+                self.food_names.prefix(name) if prefix else
+                self.food_names.contains(name)))
+        for term in sorted(with_aliments,
+                           key=lambda t: len(self.foods_containing(t))):
+            if not len(result):
+                break
+            result = intersect(result, self.foods_containing(term))
+        for term in without:
+            result = difference(result, self.foods_containing(term))
+        return result
+
+    def aliments(self, name, prefix=False):
+        u"""이름에 ``name`` 이 들어 있는 (``prefix`` 가 참이면 ``name``
+        으로 시작하는) 재료 ID들 (정렬됨).
+
+        """
+        if prefix:
+            return self.aliment_names.prefix(name)
+        return self.aliment_names.contains(name)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.similarity` --- Foods with similar nutrition
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+음식마다 :data:`~seektam.model.koreafood.NUTRIENTS` 합계를 한 행으로 하는
+NumPy 행렬을 만들고, 영양이 비슷한 음식을 찾습니다.  영양소마다 단위가
+다르므로 표준편차로 나눈 값으로 비교합니다.
+
+행렬은 디렉터리 하나에 ``.npy`` 파일들로 저장하고 읽을 때 메모리
+매핑하므로, 같은 파일을 읽는 웹 워커들은 페이지 캐시를 함께 씁니다.
+저장한 경로는 그 디렉터리를 가리키는 심볼릭 링크입니다.
+
+.. code-block:: python
+
+   SimilarityMatrix.build(session).save('similarity')
+   matrix = SimilarityMatrix.load('similarity')
+   matrix.similar([food_id], k=5, max_sodium=800)
+
+"""
+from __future__ import absolute_import
+
+import json
+import os
+import os.path
+import shutil
+import tempfile
+
+import numpy
+from sqlalchemy.sql import select
+
+from .loader import REVISION
+from .model.koreafood import Food, FoodNutrition, NUTRIENTS
+from .model.revision import get_revision
+
+__all__ = 'METRICS', 'SimilarityMatrix'
+
+#: 지원하는 유사도: 코사인, 표준편차로 나눈 유클리드 거리
+METRICS = 'cosine', 'euclidean'
+
+#: 한 번에 점수를 계산할 질의 행 수
+BATCH_SIZE = 256
+
+_ARRAYS = 'ids', 'raw', 'scaled', 'unit', 'sqnorm', 'category_big', \
+    'category_small'
+
+
+def _codes(values):
+    names = sorted(set(values) - set([None]))
+    index = dict((name, n) for n, name in enumerate(names))
+    return numpy.array([index.get(v, -1) for v in values],
+                       dtype=numpy.int32), names
+
+
+class SimilarityMatrix(object):
+    u"""음식 영양소 행렬.  :meth:`build` 로 DB에서 만들거나 :meth:`load`
+    로 저장한 것을 읽습니다.
+
+    :param ids: 음식 ID (오름차순) ``(n,)`` 배열
+    :param raw: 음식마다의 영양소 합계 ``(n, len(NUTRIENTS))`` 배열
+    :param category_big: 대분류 번호 ``(n,)`` 배열 (없으면 -1)
+    :param category_small: 소분류 번호 ``(n,)`` 배열 (없으면 -1)
+    :param categories: ``{'category_big': [이름...], ...}`` 번호의 이름
+    :param revision: 행렬을 만든 때의
+                     :class:`~seektam.model.revision.Revision` 번호
+
+    """
+
+    def __init__(self, ids, raw, category_big, category_small, categories,
+                 revision=0, scaled=None, unit=None, sqnorm=None):
+        self.ids = ids
+        self.raw = raw
+        self.category_big = category_big
+        self.category_small = category_small
+        self.categories = categories
+        self.revision = revision
+        if scaled is None:
+            scale = raw.std(axis=0) if len(raw) else numpy.ones(raw.shape[1])
+            scale[scale == 0] = 1
+            scaled = (raw / scale).astype(numpy.float32)
+        if unit is None:
+            norm = numpy.sqrt((scaled * scaled).sum(axis=1))
+            norm[norm == 0] = 1
+            unit = scaled / norm[:, numpy.newaxis]
+        if sqnorm is None:
+            sqnorm = (scaled * scaled).sum(axis=1)
+        self.scaled = scaled
+        self.unit = unit
+        self.sqnorm = sqnorm
+
+    @classmethod
+    def build(cls, session):
+        u"""``session`` 의 DB에서 행렬을 만듭니다.  오래된 음식은
+        뺍니다.  모르는 영양소는 0으로 셉니다.
+
+        """
+        foods = Food.__table__
+        nutrition = FoodNutrition.__table__
+        revision = get_revision(session, REVISION)
+        rows = session.execute(
+            select([foods.c.id, foods.c.category_big, foods.c.category_small] +
+                   [nutrition.c[name] for name in NUTRIENTS])
+            .select_from(foods.join(nutrition))
+            .where(foods.c.stale == False)  # noqa
+            .order_by(foods.c.id)
+        ).fetchall()
+        ids = numpy.array([row[0] for row in rows], dtype=numpy.int64)
+        raw = numpy.array([row[3:] for row in rows], dtype=numpy.float64)
+        raw = numpy.nan_to_num(raw.reshape(len(rows), len(NUTRIENTS)))
+        big, big_names = _codes([row[1] for row in rows])
+        small, small_names = _codes([row[2] for row in rows])
+        return cls(ids, raw.astype(numpy.float32), big, small,
+                   dict(category_big=big_names, category_small=small_names),
+                   revision)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        u""":meth:`save` 로 저장한 ``path`` 디렉터리를 읽습니다.  ``mmap``
+        이 참이면 배열을 읽기 전용으로 메모리 매핑합니다.
+
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['nutrients'] != list(NUTRIENTS):
+            raise ValueError('%s was saved with other nutrients' % (path,))
+        arrays = dict(
+            (name, numpy.load(os.path.join(path, name + '.npy'),
+                              mmap_mode='r' if mmap else None))
+            for name in _ARRAYS)
+        return cls(categories=meta['categories'], revision=meta['revision'],
+                   **arrays)
+
+    def save(self, path):
+        u"""``path`` 에 저장합니다.  옆에 새 디렉터리를 다 쓴 뒤
+        ``path`` 심볼릭 링크를 그리로 한 번에 바꿔 걸므로, 읽는 쪽은
+        언제나 예전 것이나 새것 하나를 온전히 봅니다.  예전 것을 매핑해
+        둔 프로세스는 그대로 씁니다.
+
+        """
+        path = os.path.abspath(path)
+        parent, base = os.path.split(path)
+        tmp = tempfile.mkdtemp(prefix=base + '.', dir=parent)
+        for name in _ARRAYS:
+            numpy.save(os.path.join(tmp, name + '.npy'), getattr(self, name))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(dict(revision=self.revision, nutrients=list(NUTRIENTS),
+                           categories=self.categories), f)
+        old = None
+        if os.path.islink(path):
+            old = os.path.join(parent, os.readlink(path))
+        elif os.path.isdir(path):
+            # 링크를 쓰기 전에 디렉터리로 저장한 행렬
+            old = tempfile.mkdtemp(prefix=base + '.', dir=parent)
+            os.rename(path, os.path.join(old, 'old'))
+        link = tempfile.mktemp(prefix=base + '.', suffix='.link', dir=parent)
+        os.symlink(os.path.basename(tmp), link)
+        os.rename(link, path)
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self, food_ids):
+        u"""``food_ids`` 의 행 번호들.  없는 음식이면 :exc:`KeyError`."""
+        food_ids = numpy.asarray(food_ids, dtype=numpy.int64)
+        if not len(self.ids) and len(food_ids):
+            raise KeyError(food_ids[0])
+        rows = numpy.searchsorted(self.ids, food_ids)
+        missing = self.ids[numpy.minimum(rows, len(self.ids) - 1)] != food_ids
+        if missing.any():
+            raise KeyError(food_ids[missing][0])
+        return rows
+
+    def mask(self, category_big=None, category_small=None, max_energy=None,
+             max_sodium=None):
+        u"""조건에 맞는 행이 참인 ``(n,)`` 배열."""
+        mask = numpy.ones(len(self.ids), dtype=bool)
+        for key, value in (('category_big', category_big),
+                           ('category_small', category_small)):
+            if value is not None:
+                try:
+                    code = self.categories[key].index(value)
+                except ValueError:
+                    code = -2
+                mask &= getattr(self, key) == code
+        for name, value in (('energy', max_energy), ('sodium', max_sodium)):
+            if value is not None:
+                mask &= self.raw[:, NUTRIENTS.index(name)] <= value
+        return mask
+
+    def scores(self, rows, metric='cosine'):
+        u"""``rows`` 행들과 모든 행의 유사도 ``(len(rows), n)`` 배열.
+        클수록 비슷합니다 (유클리드는 거리에 -1을 곱한 값).
+
+        """
+        if metric == 'cosine':
+            return numpy.dot(self.unit[rows], self.unit.T)
+        elif metric == 'euclidean':
+            d2 = self.sqnorm[rows][:, numpy.newaxis] + self.sqnorm - \
+                2 * numpy.dot(self.scaled[rows], self.scaled.T)
+            return -numpy.sqrt(numpy.maximum(d2, 0))
+        raise ValueError('metric must be one of %r: %r' % (METRICS, metric))
+
+    def similar(self, food_ids, k=10, metric='cosine', **conditions):
+        u"""``food_ids`` 의 음식마다 가장 비슷한 음식 ``k`` 개.
+
+        :param food_ids: 기준 음식 ID들
+        :param k: 음식마다 찾을 수
+        :param metric: :data:`METRICS` 중 하나
+        :param conditions: :meth:`mask` 의 조건
+        :returns: 음식마다 ``[(음식 ID, 점수), ...]`` 목록 (비슷한 순)
+
+        """
+        if metric not in METRICS:
+            raise ValueError(
+                'metric must be one of %r: %r' % (METRICS, metric))
+        rows = self.rows(food_ids)
+        mask = self.mask(**conditions)
+        k = max(0, min(k, int(mask.sum())))
+        result = []
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            scores = self.scores(batch, metric)
+            scores[:, ~mask] = -numpy.inf
+            scores[numpy.arange(len(batch)), batch] = -numpy.inf  # 자기 자신
+            if 0 < k < scores.shape[1]:
+                top = numpy.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = numpy.tile(numpy.arange(scores.shape[1]),
+                                 (len(batch), 1))[:, :k]
+            for n, columns in enumerate(top):
+                row_scores = scores[n, columns]
+                order = numpy.argsort(-row_scores, kind='mergesort')
+                result.append([
+                    (int(self.ids[c]), float(s))
+                    for c, s in zip(columns[order], row_scores[order])
+                    if s != -numpy.inf])
+        return result
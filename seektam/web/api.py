@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.web.api` --- Read-only JSON API
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+음식과 재료를 JSON으로 돌려줍니다.  응답 본문은 로더가 올리는
+:class:`~seektam.model.revision.Revision` 번호와 요청 경로를 키로
+프로세스 안에 캐시하고, 같은 값으로 ``ETag`` 를 만들어 바뀌지 않았으면
+``304 Not Modified`` 로 답합니다.
+
+"""
+from __future__ import absolute_import
+
+import bisect
+import functools
+import hashlib
+import threading
+
+from flask import Blueprint, abort, current_app, json, jsonify, request
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, subqueryload
+
+from ..loader import REVISION
+from ..mealplan import DEFAULT_TARGETS, MealPlanner, parse_required
+from ..model.koreafood import Aliment, Food, FoodAliment, NUTRIENTS
+from ..model.revision import get_revision
+from ..search import SearchIndex
+from ..similarity import METRICS, SimilarityMatrix
+from .cache import ResponseCache
+from .db import get_session
+
+__all__ = ('api', 'cached_json', 'response_cache', 'search_index',
+           'similarity_matrix')
+
+#: (:class:`flask.Blueprint`) 읽기 전용 JSON API
+api = Blueprint('api', __name__)
+
+_search_lock = threading.Lock()
+_similarity_lock = threading.Lock()
+
+
+def response_cache(app=None):
+    u"""``app`` 의 :class:`~seektam.web.cache.ResponseCache`."""
+    if app is None:
+        app = current_app
+    return app.extensions.setdefault(
+        'seektam.response_cache',
+        ResponseCache(app.config['API_CACHE_SIZE']))
+
+
+def search_index(app=None):
+    u"""``app`` 의 :class:`~seektam.search.SearchIndex`.
+
+    DB의 :class:`~seektam.model.revision.Revision` 번호가 바뀌면 새로
+    마련합니다.  ``SEARCH_INDEX_PATH`` 에 로더가 저장한 색인이 같은
+    번호이면 그것을 읽고, 아니면 DB에서 만듭니다.
+
+    """
+    if app is None:
+        app = current_app
+    revision = get_revision(get_session(), REVISION)
+    with _search_lock:
+        index = app.extensions.get('seektam.search_index')
+        if index is not None and index.revision == revision:
+            return index
+        index = None
+        path = app.config.get('SEARCH_INDEX_PATH')
+        if path:
+            try:
+                index = SearchIndex.load(path)
+            except (IOError, OSError):
+                pass
+            else:
+                if index.revision != revision:
+                    index = None
+        if index is None:
+            index = SearchIndex.build(get_session())
+        app.extensions['seektam.search_index'] = index
+        return index
+
+
+def similarity_matrix(app=None):
+    u"""``app`` 의 :class:`~seektam.similarity.SimilarityMatrix`.
+
+    ``SIMILARITY_PATH`` 가 있으면 ``loader --similarity`` 로 거기 저장한
+    행렬을 메모리 매핑해 씁니다.  파일이 없거나 DB의
+    :class:`~seektam.model.revision.Revision` 번호와 다르면 DB에서
+    메모리에 만들어 둡니다.  워커들이 같은 경로에 한꺼번에 쓰지 않도록
+    저장은 로더만 합니다.
+
+    """
+    if app is None:
+        app = current_app
+    revision = get_revision(get_session(), REVISION)
+    with _similarity_lock:
+        matrix = app.extensions.get('seektam.similarity')
+        if matrix is not None and matrix.revision == revision:
+            return matrix
+        path = app.config.get('SIMILARITY_PATH')
+        matrix = None
+        if path:
+            try:
+                matrix = SimilarityMatrix.load(path)
+            except (IOError, OSError, ValueError):
+                pass
+            else:
+                if matrix.revision != revision:
+                    matrix = None
+        if matrix is None:
+            matrix = SimilarityMatrix.build(get_session())
+        app.extensions['seektam.similarity'] = matrix
+        return matrix
+
+
+def cached_json(view):
+    u"""뷰가 돌려준 값을 JSON 응답으로 바꾸고 캐시합니다."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        revision = get_revision(get_session(), REVISION)
+        path = request.full_path
+        digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+        etag = '%d-%s' % (revision, digest[:16])
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            cache = response_cache()
+            body = cache.get(revision, path)
+            if body is None:
+                body = json.dumps(view(*args, **kwargs))
+                cache.put(revision, path, body)
+            response = current_app.response_class(
+                body, mimetype='application/json')
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['API_MAX_AGE']
+        return response
+    return wrapper
+
+
+def _page_size():
+    size = request.args.get('limit', type=int)
+    if size is None:
+        return current_app.config['API_PAGE_SIZE']
+    return max(1, min(size, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+def _aliment(aliment, nutrients=True):
+    data = dict(id=aliment.id, name=aliment.name)
+    if nutrients:
+        data['nutrients'] = dict(
+            (name, getattr(aliment, name)) for name in NUTRIENTS)
+    return data
+
+
+def _food(food, nutrients=False):
+    aliments = []
+    for rel in food.food_aliments:
+        aliment = _aliment(rel.aliment, nutrients)
+        aliment['weight'] = rel.weight
+        aliments.append(aliment)
+    return dict(
+        id=food.id, name=food.name, category_big=food.category_big,
+        category_small=food.category_small, meal_code=food.meal_code,
+        stale=food.stale,
+        nutrition=dict((name, food.nutrient(name)) for name in NUTRIENTS),
+        aliments=aliments)
+
+
+def _load_aliments():
+    return subqueryload(Food.food_aliments).joinedload(FoodAliment.aliment)
+
+
+@api.errorhandler(400)
+def bad_request(error):
+    return jsonify(error=error.description), 400
+
+
+@api.errorhandler(404)
+def not_found(error):
+    return jsonify(error='not found'), 404
+
+
+@api.route('/foods')
+@cached_json
+def foods():
+    u"""음식 목록.  ``id`` 순서로 ``limit`` 개씩 나누며, 다음 장은
+    응답의 ``next`` 를 ``after`` 로 넘겨 가져옵니다.  ``category_big``,
+    ``category_small`` 로 거를 수 있습니다.
+
+    """
+    limit = _page_size()
+    query = get_session().query(Food).options(
+        joinedload(Food.nutrition), _load_aliments())
+    for key in 'category_big', 'category_small':
+        value = request.args.get(key)
+        if value is not None:
+            query = query.filter(getattr(Food, key) == value)
+    after = request.args.get('after', type=int)
+    if after is not None:
+        query = query.filter(Food.id > after)
+    rows = query.order_by(Food.id).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return dict(foods=[_food(food) for food in rows],
+                next=rows[-1].id if more else None)
+
+
+@api.route('/foods/<int:food_id>')
+@cached_json
+def food(food_id):
+    u"""음식 하나와 그 재료의 영양 정보."""
+    food = get_session().query(Food).options(
+        joinedload(Food.nutrition), _load_aliments()
+    ).filter(Food.id == food_id).first()
+    if food is None:
+        abort(404)
+    return _food(food, nutrients=True)
+
+
+@api.route('/foods/<int:food_id>/similar')
+@cached_json
+def similar_foods(food_id):
+    u"""영양이 비슷한 음식 ``k`` 개 (기본 10개).  ``metric`` 은
+    ``cosine`` (기본값) 이나 ``euclidean`` 이고, ``category_big``,
+    ``category_small``, ``max_energy``, ``max_sodium`` 으로 거를 수
+    있습니다.
+
+    """
+    metric = request.args.get('metric', 'cosine')
+    if metric not in METRICS:
+        abort(400, u'metric must be one of {0}: {1}'.format(
+            ', '.join(METRICS), metric))
+    k = max(1, min(request.args.get('k', type=int, default=10),
+                   current_app.config['API_MAX_PAGE_SIZE']))
+    try:
+        similar, = similarity_matrix().similar(
+            [food_id], k=k, metric=metric,
+            category_big=request.args.get('category_big'),
+            category_small=request.args.get('category_small'),
+            max_energy=request.args.get('max_energy', type=float),
+            max_sodium=request.args.get('max_sodium', type=float))
+    except KeyError:
+        abort(404)
+    names = dict(get_session().query(Food.id, Food.name).filter(
+        Food.id.in_([id_ for id_, _ in similar])) if similar else ())
+    return dict(foods=[dict(id=id_, name=names.get(id_), score=score)
+                       for id_, score in similar])
+
+
+@api.route('/mealplan')
+@cached_json
+def mealplan():
+    u"""하루 영양 목표를 맞추는 ``days`` 일치 식단 (최대 31일).
+    ``require`` (ex. ``밥류``, ``반찬류:2``) 는 여러 번 줄 수 있고,
+    ``size``, ``max_per_category`` 와 :class:`~seektam.mealplan.Targets`
+    의 이름들로 목표를 바꿉니다.
+
+    """
+    args = request.args
+    targets = [args.get(name, type=float, default=default)
+               for name, default in DEFAULT_TARGETS._asdict().items()]
+    days = max(1, min(args.get('days', type=int, default=1), 31))
+    try:
+        planner = MealPlanner(
+            similarity_matrix(), targets,
+            size=max(1, min(args.get('size', type=int, default=6), 20)),
+            required=parse_required(args.getlist('require')),
+            max_per_category=args.get('max_per_category', type=int,
+                                      default=1))
+        plan = planner.plan(days)
+    except ValueError as e:
+        abort(400, unicode(e))
+    rows = get_session().query(
+        Food.id, Food.name, Food.category_big
+    ).filter(Food.id.in_(set(id_ for day in plan for id_ in day)))
+    foods = dict((row.id, row) for row in rows)
+    return dict(
+        targets=planner.targets._asdict(),
+        days=[dict(foods=[dict(id=id_, name=foods[id_].name,
+                               category_big=foods[id_].category_big)
+                          for id_ in day],
+                   totals=planner.totals(day))
+              for day in plan])
+
+
+@api.route('/aliments/<int:aliment_id>')
+@cached_json
+def aliment(aliment_id):
+    u"""재료 하나의 영양 정보 (1g 기준)."""
+    aliment = get_session().query(Aliment).filter(
+        Aliment.id == aliment_id).first()
+    if aliment is None:
+        abort(404)
+    return _aliment(aliment)
+
+
+@api.route('/categories')
+@cached_json
+def categories():
+    u"""대분류와 그 아래 소분류별 음식 수."""
+    rows = get_session().query(
+        Food.category_big, Food.category_small, func.count(Food.id)
+    ).group_by(Food.category_big, Food.category_small).order_by(
+        Food.category_big, Food.category_small)
+    result = []
+    for big, small, count in rows:
+        if not result or result[-1]['name'] != big:
+            result.append(dict(name=big, count=0, subcategories=[]))
+        result[-1]['count'] += count
+        result[-1]['subcategories'].append(dict(name=small, count=count))
+    return dict(categories=result)
+
+
+def _search_page(ids, names):
+    limit = _page_size()
+    total = len(ids)
+    after = request.args.get('after', type=int)
+    if after is not None:
+        ids = ids[bisect.bisect_right(ids, after):]
+    more = len(ids) > limit
+    ids = ids[:limit]
+    return dict(total=total, next=ids[-1] if more else None,
+                items=[dict(id=id_, name=names[id_]) for id_ in ids])
+
+
+@api.route('/search')
+@cached_json
+def search():
+    u"""음식 검색.  ``q`` 는 이름에 들어 있을 글자이고 ``prefix=1`` 이면
+    이름이 ``q`` 로 시작하는 음식만 찾습니다.  ``with`` 에 준 재료가 모두
+    들어 있고 ``without`` 에 준 재료는 없는 음식만 남깁니다.  둘 다 여러
+    번 줄 수 있습니다.  ``id`` 순서이며 ``after`` 와 ``limit`` 으로
+    나눕니다.
+
+    """
+    index = search_index()
+    ids = index.foods(
+        name=request.args.get('q'),
+        prefix=request.args.get('prefix', type=int, default=0) == 1,
+        with_aliments=request.args.getlist('with'),
+        without=request.args.getlist('without'))
+    page = _search_page(ids, index.food_names.names)
+    page['foods'] = page.pop('items')
+    return page
+
+
+@api.route('/search/aliments')
+@cached_json
+def search_aliments():
+    u"""재료 이름 검색.  ``q`` 와 ``prefix`` 는 :func:`search` 와 같습니다."""
+    index = search_index()
+    q = request.args.get('q', u'')
+    prefix = request.args.get('prefix', type=int, default=0) == 1
+    ids = index.aliments(q, prefix=prefix) if q else []
+    page = _search_page(ids, index.aliment_names.names)
+    page['aliments'] = page.pop('items')
+    return page
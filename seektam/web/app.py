@@ -1,6 +1,48 @@
+# -*- coding: utf-8 -*-
+
 from flask import Flask
 
+from .api import api
+from .db import close_session
+from .metrics import finish_request, metrics, record_request, start_request
+
 __all__ = 'app',
 
 #: (:class:`flask.Flask`) a web application
 app = Flask(__name__)
+app.config.update(
+    #: 연결 풀 크기, 넘쳐서 더 열 수 있는 연결 수, 연결을 기다릴 시간(초)
+    DATABASE_POOL_SIZE=5,
+    DATABASE_MAX_OVERFLOW=10,
+    DATABASE_POOL_TIMEOUT=30,
+    #: 이 시간(초)보다 오래된 연결은 다시 엶 (-1이면 안 함)
+    DATABASE_POOL_RECYCLE=3600,
+    #: 연결을 빌릴 때마다 살아 있는지 확인 (SQLAlchemy 1.2 이상)
+    DATABASE_POOL_PRE_PING=False,
+    #: 읽기 쿼리를 나눠 보낼 복제 DB URL들과 고르는 방법
+    #: (``round_robin``, ``random``, ``primary``)
+    DATABASE_REPLICA_URLS=[],
+    DATABASE_REPLICA_POLICY='round_robin',
+    #: 캐시해 둘 API 응답 수
+    API_CACHE_SIZE=1024,
+    #: API 응답의 ``Cache-Control: max-age`` (초)
+    API_MAX_AGE=60,
+    #: 목록 API의 기본/최대 ``limit``
+    API_PAGE_SIZE=50,
+    API_MAX_PAGE_SIZE=500,
+    #: ``loader --search-index`` 로 저장한 검색 색인 파일 (없으면 DB에서 만듦)
+    SEARCH_INDEX_PATH=None,
+    #: ``loader --similarity`` 로 저장한 영양 유사도 행렬.  워커들이
+    #: 메모리 매핑해 함께 씀 (없거나 오래되면 워커마다 DB에서 만듦)
+    SIMILARITY_PATH=None,
+    #: 요청과 SQL 통계를 모아 ``/metrics`` 로 보여 줌
+    METRICS_ENABLED=False,
+    #: 이 시간(초)보다 오래 걸린 SQL 쿼리를 로그로 남김
+    SLOW_QUERY_THRESHOLD=0.5,
+)
+app.register_blueprint(api)
+app.register_blueprint(metrics)
+app.before_request(start_request)
+app.after_request(record_request)
+app.teardown_request(finish_request)
+app.teardown_appcontext(close_session)
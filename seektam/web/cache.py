@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.web.cache` --- In-process response cache
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+from __future__ import absolute_import
+
+import collections
+import threading
+
+__all__ = 'ResponseCache',
+
+
+class ResponseCache(object):
+    u"""데이터 번호와 요청 경로로 응답 본문을 기억하는 LRU 캐시.
+
+    키에 :class:`~seektam.model.revision.Revision` 번호가 들어 있으므로
+    로더가 번호를 올리면 예전 항목은 더 이상 쓰이지 않고 밀려납니다.
+
+    :param max_entries: 기억할 최대 응답 수
+
+    """
+
+    def __init__(self, max_entries=1024):
+        if max_entries < 1:
+            raise ValueError(
+                'max_entries must be positive: %r' % (max_entries,))
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, revision, path):
+        key = revision, path
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries[key] = value  # 최근에 쓴 항목으로
+            self.hits += 1
+            return value
+
+    def put(self, revision, path, value):
+        with self._lock:
+            self._entries.pop((revision, path), None)
+            self._entries[revision, path] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.web.db` --- Database engines and sessions for requests
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+설정의 ``DATABASE_URL`` 로 앱마다 :class:`Database` 를 한 번만 만듭니다.
+연결 풀은 ``DATABASE_POOL_*`` 설정을 따르고, 세션은 앱 컨텍스트마다 하나인
+:class:`~sqlalchemy.orm.scoping.scoped_session` 으로 열었다가 컨텍스트가
+끝날 때 닫습니다.
+
+``DATABASE_REPLICA_URLS`` 를 주면 읽기만 하는 쿼리는 복제 DB들에
+나눠 보냅니다.  풀마다 연결을 빌린 수와 기다린 시간은
+:meth:`Database.pool_metrics` 로 볼 수 있습니다.
+
+"""
+from __future__ import absolute_import
+
+import itertools
+import random
+import threading
+import time
+
+from flask import _app_ctx_stack, current_app
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm.scoping import scoped_session
+from sqlalchemy.orm.session import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import Select
+
+from .metrics import get_metrics
+
+__all__ = ('REPLICA_POLICIES', 'Database', 'PoolMetrics', 'RoutingSession',
+           'close_session', 'get_database', 'get_engine', 'get_session',
+           'reset_database')
+
+#: ``DATABASE_REPLICA_POLICY`` 값.  ``primary`` 이면 복제 DB를 쓰지 않습니다.
+REPLICA_POLICIES = 'round_robin', 'random', 'primary'
+
+_lock = threading.Lock()
+
+
+class PoolMetrics(object):
+    u"""연결 풀 하나의 사용 통계."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        #: 빌려 간 횟수, 돌려받은 횟수, 새로 연 연결 수
+        self.checkouts = self.checkins = self.connects = 0
+        #: 지금 빌려 간 연결 수와 그 최댓값
+        self.checked_out = self.peak_checked_out = 0
+        #: 연결을 얻기까지 기다린 횟수, 합계와 최댓값(초)
+        self.waits = 0
+        self.wait_total = self.wait_max = 0.0
+
+    def listen(self, engine):
+        event.listen(engine, 'connect', self._connect)
+        event.listen(engine, 'checkout', self._checkout)
+        event.listen(engine, 'checkin', self._checkin)
+
+    def _connect(self, dbapi_connection, record):
+        with self._lock:
+            self.connects += 1
+
+    def _checkout(self, dbapi_connection, record, proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out,
+                                        self.checked_out)
+
+    def _checkin(self, dbapi_connection, record):
+        with self._lock:
+            self.checkins += 1
+            self.checked_out -= 1
+
+    def waited(self, seconds):
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self, pool=None):
+        u"""통계를 :class:`dict` 로.  ``pool`` 이
+        :class:`~sqlalchemy.pool.QueuePool` 이면 크기와 넘친 연결 수도
+        넣습니다.
+
+        """
+        with self._lock:
+            data = dict(
+                checkouts=self.checkouts, checkins=self.checkins,
+                connects=self.connects, checked_out=self.checked_out,
+                peak_checked_out=self.peak_checked_out, waits=self.waits,
+                wait_total=self.wait_total, wait_max=self.wait_max)
+        if isinstance(pool, QueuePool):
+            data.update(size=pool.size(), overflow=pool.overflow(),
+                        idle=pool.checkedin())
+        return data
+
+
+def _measured_pool(pool_class, metrics):
+    u"""연결을 얻기까지 걸린 시간을 ``metrics`` 에 남기는 ``pool_class``.
+    :meth:`~sqlalchemy.pool.Pool.recreate` 는 같은 클래스로 풀을 다시
+    만드므로 :meth:`~sqlalchemy.engine.Engine.dispose` 한 뒤에도 잽니다.
+
+    """
+    class MeasuredPool(pool_class):
+        def _do_get(self):
+            started = time.time()
+            try:
+                return pool_class._do_get(self)
+            finally:
+                metrics.waited(time.time() - started)
+    MeasuredPool.__name__ = 'Measured' + pool_class.__name__
+    return MeasuredPool
+
+
+def _create_engine(url, config, metrics):
+    url = make_url(url)
+    pool_class = url.get_dialect().get_pool_class(url)
+    options = dict(poolclass=_measured_pool(pool_class, metrics),
+                   pool_recycle=config['DATABASE_POOL_RECYCLE'])
+    if issubclass(pool_class, QueuePool):
+        options.update(pool_size=config['DATABASE_POOL_SIZE'],
+                       max_overflow=config['DATABASE_MAX_OVERFLOW'],
+                       pool_timeout=config['DATABASE_POOL_TIMEOUT'])
+    if config['DATABASE_POOL_PRE_PING']:
+        options['pool_pre_ping'] = True
+    engine = create_engine(url, **options)
+    metrics.listen(engine)
+    return engine
+
+
+class RoutingSession(Session):
+    u"""``SELECT`` 는 복제 DB로, 나머지는 주 DB로 보내는 세션.
+    :meth:`use_primary` 뒤로는 모두 주 DB로 보냅니다.
+
+    """
+
+    def __init__(self, database=None, **kwargs):
+        super(RoutingSession, self).__init__(**kwargs)
+        self.database = database
+        self.primary = False
+
+    def get_bind(self, mapper=None, clause=None):
+        database = self.database
+        if self.primary or self._flushing or not isinstance(clause, Select):
+            return database.engine
+        return database.replica()
+
+    def use_primary(self):
+        u"""이 세션의 쿼리를 모두 주 DB로 보냅니다 (복제 지연을 피할 때)."""
+        self.primary = True
+        return self
+
+
+class Database(object):
+    u"""앱 하나의 DB 엔진들과 요청마다의 세션.
+
+    :param config: ``DATABASE_*`` 설정이 든 앱 설정
+
+    """
+
+    def __init__(self, config):
+        policy = config['DATABASE_REPLICA_POLICY']
+        if policy not in REPLICA_POLICIES:
+            raise ValueError('DATABASE_REPLICA_POLICY must be one of %r: %r' %
+                             (REPLICA_POLICIES, policy))
+        #: 이름마다의 :class:`PoolMetrics`.  주 DB는 ``primary``, 복제
+        #: DB는 ``replica0``, ``replica1``, ...
+        self.metrics = {'primary': PoolMetrics()}
+        self.engine = _create_engine(
+            config['DATABASE_URL'], config, self.metrics['primary'])
+        self.replicas = []
+        if policy != 'primary':
+            for n, url in enumerate(config['DATABASE_REPLICA_URLS']):
+                metrics = self.metrics['replica%d' % n] = PoolMetrics()
+                self.replicas.append(_create_engine(url, config, metrics))
+        self.policy = policy
+        self._cycle = itertools.cycle(self.replicas)
+        self._cycle_lock = threading.Lock()
+        self.session = scoped_session(
+            sessionmaker(class_=RoutingSession, database=self),
+            scopefunc=_app_ctx_stack.__ident_func__)
+
+    @property
+    def engines(self):
+        return [self.engine] + self.replicas
+
+    def replica(self):
+        u"""읽기 쿼리를 보낼 엔진.  복제 DB가 없으면 주 DB."""
+        if not self.replicas:
+            return self.engine
+        if self.policy == 'random':
+            return random.choice(self.replicas)
+        with self._cycle_lock:
+            return next(self._cycle)
+
+    def pool_metrics(self):
+        u"""엔진마다 :meth:`PoolMetrics.snapshot`."""
+        names = ['primary'] + ['replica%d' % n
+                               for n in range(len(self.replicas))]
+        return dict((name, self.metrics[name].snapshot(engine.pool))
+                    for name, engine in zip(names, self.engines))
+
+    def dispose(self):
+        u"""풀에 든 연결을 모두 닫습니다.  포크하기 전에 부릅니다."""
+        self.session.remove()
+        for engine in self.engines:
+            engine.dispose()
+
+
+def get_database(app=None):
+    u"""``app`` 의 :class:`Database`.  처음 부를 때 만듭니다.
+    ``METRICS_ENABLED`` 이면 엔진들의 쿼리를
+    :class:`~seektam.web.metrics.Metrics` 로 잽니다.
+
+    """
+    if app is None:
+        app = current_app
+    with _lock:
+        try:
+            database = app.extensions['seektam.db']
+        except KeyError:
+            database = Database(app.config)
+            app.extensions['seektam.db'] = database
+    metrics = get_metrics(app)
+    if metrics is not None:
+        for engine in database.engines:
+            metrics.watch(engine)
+    return database
+
+
+def reset_database(app):
+    u"""설정이 바뀌었을 때 ``app`` 의 :class:`Database` 를 버립니다.
+    다음에 쓸 때 새 설정으로 다시 만듭니다.
+
+    """
+    with _lock:
+        database = app.extensions.pop('seektam.db', None)
+    if database is not None:
+        database.dispose()
+
+
+def get_engine(app=None):
+    u"""``app`` 의 ``DATABASE_URL`` 엔진."""
+    return get_database(app).engine
+
+
+def get_session():
+    u"""현재 앱 컨텍스트의 :class:`RoutingSession`."""
+    return get_database().session()
+
+
+def close_session(exception=None):
+    u"""앱 컨텍스트가 끝날 때 세션을 닫습니다."""
+    database = current_app.extensions.get('seektam.db')
+    if database is not None:
+        database.session.remove()
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.web.metrics` --- Request and SQL instrumentation
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+``METRICS_ENABLED`` 를 켜면 엔드포인트마다 응답 시간, 요청 하나가 보낸
+SQL 쿼리 수와 SQL 시간을 히스토그램으로 모으고, ``SLOW_QUERY_THRESHOLD``
+초보다 오래 걸린 쿼리는 로그로 남깁니다.  모은 값은 연결 풀과 응답
+캐시 통계와 함께 ``/metrics`` 에서 Prometheus 텍스트 형식으로 봅니다.
+
+값은 프로세스마다 따로 모이므로 워커가 여럿이면 워커마다 긁어야 합니다.
+
+"""
+from __future__ import absolute_import
+
+import bisect
+import collections
+import logging
+import threading
+import time
+import weakref
+
+from flask import Blueprint, abort, current_app, g, has_request_context, \
+    request
+from sqlalchemy import event
+
+__all__ = ('Counter', 'Histogram', 'Metrics', 'finish_request',
+           'get_metrics', 'metrics', 'record_request', 'start_request')
+
+#: (:class:`flask.Blueprint`) ``/metrics`` 엔드포인트
+metrics = Blueprint('metrics', __name__)
+
+#: 시간(초) 히스토그램의 구간
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                5.0, 10.0)
+
+#: 요청 하나의 SQL 쿼리 수 히스토그램의 구간
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, unicode(value).replace('\\', r'\\')
+                     .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in pairs)
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    u"""레이블 값마다 늘어나기만 하는 수."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] += amount
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help),
+                 '# TYPE %s %s' % (self.name, self.type)]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append('%s%s %s' % (
+                    self.name, _labels(self.labels, labels), _number(value)))
+        return lines
+
+
+class Histogram(object):
+    u"""레이블 값마다 관측값이 구간별로 몇 번 나왔는지 셉니다."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            try:
+                counts, total = self._series[labels]
+            except KeyError:
+                counts, total = [0] * (len(self.buckets) + 1), 0.0
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[labels] = counts, total + value
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def sum(self, *labels):
+        series = self._series.get(labels)
+        return series[1] if series else 0.0
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help),
+                 '# TYPE %s %s' % (self.name, self.type)]
+        with self._lock:
+            series = sorted(
+                (labels, list(counts), total)
+                for labels, (counts, total) in self._series.items())
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(float(bound))
+                lines.append('%s_bucket%s %d' % (
+                    self.name, _labels(self.labels, labels, [('le', le)]),
+                    cumulative))
+            lines.append('%s_sum%s %s' % (
+                self.name, _labels(self.labels, labels), _number(total)))
+            lines.append('%s_count%s %d' % (
+                self.name, _labels(self.labels, labels), cumulative))
+        return lines
+
+
+class Metrics(object):
+    u"""앱 하나의 요청, SQL 통계.
+
+    :param slow_query_threshold: 이 시간(초)보다 오래 걸린 쿼리는 로그로
+                                 남깁니다
+
+    """
+
+    def __init__(self, slow_query_threshold=0.5):
+        self.slow_query_threshold = slow_query_threshold
+        self.requests = Counter(
+            'seektam_requests_total', 'Requests handled.',
+            ('endpoint', 'method', 'status'))
+        self.latency = Histogram(
+            'seektam_request_duration_seconds', 'Request latency.',
+            ('endpoint', 'method'))
+        self.request_queries = Histogram(
+            'seektam_request_sql_queries', 'SQL queries per request.',
+            ('endpoint',), COUNT_BUCKETS)
+        self.request_sql_time = Histogram(
+            'seektam_request_sql_duration_seconds',
+            'Total SQL time per request.', ('endpoint',))
+        self.queries = Counter(
+            'seektam_sql_queries_total', 'SQL queries executed.')
+        self.slow_queries = Counter(
+            'seektam_sql_slow_queries_total',
+            'SQL queries slower than the threshold.')
+        self._watched = weakref.WeakSet()
+
+    def watch(self, engine):
+        u"""``engine`` 으로 보내는 쿼리를 잽니다."""
+        if engine in self._watched:
+            return
+        self._watched.add(engine)
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context,
+                        executemany):
+        # 실패한 쿼리는 after_cursor_execute 가 오지 않으므로 연결이 아닌
+        # 실행마다 있는 ``context`` 에 남깁니다
+        if context is not None:
+            context.seektam_query_started = time.time()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        started = getattr(context, 'seektam_query_started', None)
+        if started is None:
+            return
+        elapsed = time.time() - started
+        self.queries.inc()
+        if has_request_context() and 'metrics_started' in g:
+            g.metrics_queries += 1
+            g.metrics_sql_time += elapsed
+        if elapsed >= self.slow_query_threshold:
+            self.slow_queries.inc()
+            logger.warning('slow query (%.3fs): %s', elapsed,
+                           ' '.join(statement.split())[:1000])
+
+    def render(self, extra=()):
+        lines = []
+        for metric in (self.requests, self.latency, self.request_queries,
+                       self.request_sql_time, self.queries,
+                       self.slow_queries) + tuple(extra):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def get_metrics(app=None):
+    u"""``app`` 의 :class:`Metrics`.  ``METRICS_ENABLED`` 가 꺼져 있으면
+    ``None``.
+
+    """
+    if app is None:
+        app = current_app
+    if not app.config.get('METRICS_ENABLED'):
+        return None
+    with _lock:
+        try:
+            return app.extensions['seektam.metrics']
+        except KeyError:
+            result = Metrics(app.config['SLOW_QUERY_THRESHOLD'])
+            app.extensions['seektam.metrics'] = result
+            return result
+
+
+def start_request():
+    u""":meth:`flask.Flask.before_request` 로 등록합니다."""
+    if get_metrics() is not None:
+        g.metrics_started = time.time()
+        g.metrics_queries = 0
+        g.metrics_sql_time = 0.0
+
+
+def record_request(response):
+    u""":meth:`flask.Flask.after_request` 로 등록합니다.  응답 상태만 적어
+    두고, 세는 것은 :func:`finish_request` 가 합니다.
+
+    """
+    if 'metrics_started' in g:
+        g.metrics_status = response.status_code
+    return response
+
+
+def finish_request(error=None):
+    u""":meth:`flask.Flask.teardown_request` 로 등록합니다.  처리하지 못한
+    예외로 끝나 :meth:`~flask.Flask.after_request` 를 거치지 않은 요청은
+    상태 500으로 셉니다.
+
+    """
+    result = get_metrics()
+    if result is not None and 'metrics_started' in g:
+        endpoint = request.endpoint or 'unknown'
+        result.requests.inc(1, endpoint, request.method,
+                            g.pop('metrics_status', 500))
+        result.latency.observe(time.time() - g.metrics_started,
+                               endpoint, request.method)
+        result.request_queries.observe(g.metrics_queries, endpoint)
+        result.request_sql_time.observe(g.metrics_sql_time, endpoint)
+        del g.metrics_started
+
+
+def _gauge(name, help, labels=()):
+    metric = Counter(name, help, labels)
+    metric.type = 'gauge'
+    return metric
+
+
+def _pool_metrics(database):
+    metrics = dict(
+        checkouts=Counter('seektam_db_pool_checkouts_total',
+                          'Connections checked out of the pool.', ['pool']),
+        connects=Counter('seektam_db_pool_connects_total',
+                         'New DB connections opened.', ['pool']),
+        waits=Counter('seektam_db_pool_waits_total',
+                      'Times a connection was requested.', ['pool']),
+        wait_total=Counter('seektam_db_pool_wait_seconds_total',
+                           'Time spent getting a connection.', ['pool']),
+        wait_max=_gauge('seektam_db_pool_wait_seconds_max',
+                        'Longest time spent getting a connection.',
+                        ['pool']),
+        checked_out=_gauge('seektam_db_pool_checked_out',
+                           'Connections in use.', ['pool']),
+        peak_checked_out=_gauge('seektam_db_pool_checked_out_peak',
+                                'Most connections in use at once.',
+                                ['pool']),
+    )
+    for pool, values in sorted(database.pool_metrics().items()):
+        for key, metric in metrics.items():
+            metric.inc(values[key], pool)
+    return [metrics[key] for key in sorted(metrics)]
+
+
+def _cache_metrics(cache):
+    hits = Counter('seektam_response_cache_hits_total',
+                   'API responses served from the cache.')
+    misses = Counter('seektam_response_cache_misses_total',
+                     'API responses rendered.')
+    entries = _gauge('seektam_response_cache_entries',
+                     'API responses in the cache.')
+    hits.inc(cache.hits)
+    misses.inc(cache.misses)
+    entries.inc(len(cache))
+    return [hits, misses, entries]
+
+
+@metrics.route('/metrics')
+def export():
+    u"""Prometheus 텍스트 형식의 통계.  꺼져 있으면 404."""
+    result = get_metrics()
+    if result is None:
+        abort(404)
+    extra = []
+    database = current_app.extensions.get('seektam.db')
+    if database is not None:
+        extra.extend(_pool_metrics(database))
+    cache = current_app.extensions.get('seektam.response_cache')
+    if cache is not None:
+        extra.extend(_cache_metrics(cache))
+    return current_app.response_class(
+        result.render(extra), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+""":mod:`seektam.web.server` --- Pre-fork WSGI server
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+gunicorn_ 으로 앱을 여러 워커 프로세스에서 돌립니다.  ``preload`` 이면
+마스터가 포크하기 전에 앱을 읽고 :func:`warm_up` 으로 DB 엔진과 검색
+색인, 유사도 행렬을 마련해 두므로 워커들은 그 메모리를 copy-on-write로
+나눠 씁니다.  DB 연결은 프로세스끼리 나눠 쓸 수 없으므로 포크한 뒤
+워커마다 새로 엽니다.
+
+마스터에 ``HUP`` 을 보내면 요청을 마저 처리한 뒤 워커들을 차례로 새로
+띄웁니다.
+
+.. _gunicorn: http://gunicorn.org/
+
+"""
+from __future__ import absolute_import
+
+from gunicorn.app.base import BaseApplication
+
+from .api import search_index, similarity_matrix
+from .db import get_database
+
+__all__ = 'Server', 'warm_up'
+
+
+def warm_up(app):
+    u"""``app`` 의 DB 엔진을 만들어 연결해 보고, 검색 색인과 유사도
+    행렬을 읽어 둡니다.  ``DATABASE_URL`` 이 없으면 아무것도 하지
+    않습니다.
+
+    """
+    if not app.config.get('DATABASE_URL'):
+        return
+    database = get_database(app)
+    with app.app_context():
+        for engine in database.engines:
+            engine.connect().close()
+        search_index(app)
+        similarity_matrix(app)
+    # 풀에 든 연결을 포크한 워커들이 나눠 쓰면 안 되므로 비웁니다
+    database.dispose()
+
+
+class Server(BaseApplication):
+    u"""``app`` 을 돌리는 gunicorn 애플리케이션.
+
+    :param app: :class:`flask.Flask` 앱
+    :param options: gunicorn 설정 (ex. ``dict(bind=['127.0.0.1:8000'],
+                    workers=4, preload_app=True)``).  값이 ``None`` 인
+                    것은 기본값을 씁니다.
+
+    """
+
+    def __init__(self, app, options=None):
+        self.application = app
+        self.options = dict(options or {})
+        super(Server, self).__init__()
+
+    def load_config(self):
+        app = self.application
+
+        def post_worker_init(worker):
+            # 워커의 연결 풀에 연결을 하나 열어 둡니다
+            if app.config.get('DATABASE_URL'):
+                for engine in get_database(app).engines:
+                    engine.connect().close()
+
+        for key, value in self.options.items():
+            if value is not None:
+                self.cfg.set(key, value)
+        self.cfg.set('post_worker_init', post_worker_init)
+
+    def load(self):
+        warm_up(self.application)
+        return self.application
@@ -22,12 +22,14 @@ def readme():
 
 install_requires = {
     # Module 'seektam.db'
-    'cssselect >= 0.9.1',
     'lxml >= 3.4.0',
     'requests >= 2.4.1',
     # Entity classes
     'SQLAlchemy >= 0.9.0',
-    'alembic >= 0.6.0',
+    # batch_alter_table에서 CHECK 제약이 있는 Boolean 열을 지우려면 0.8.7
+    'alembic >= 0.8.7',
+    # Module 'seektam.similarity'
+    'numpy >= 1.8',
     # Configuration
     'PyYAML >= 3.10',
     # Web
@@ -42,6 +44,10 @@ tests_require = {
     'pytest >= 2.5.0',
     }
 
+serve_require = {
+    'gunicorn >= 19.0',
+    }
+
 docs_require = {
     'Sphinx >= 1.2',
     }
@@ -57,11 +63,13 @@ setup(
     author='LeafDev',
     url='http://seektam.kr/',
     packages=find_packages(exclude=['tests']),
+    package_data={'seektam': ['migrations/script.py.mako']},
     zip_safe=False,
     install_requires=install_requires,
     tests_require=tests_require,
     extras_require={
         'docs': docs_require,
+        'serve': serve_require,
         'tests': tests_require
     },
     entry_points='''
@@ -1,18 +1,32 @@
 # -*- coding: utf-8 -*-
 
+import codecs
+import json
+import os.path
+import re
+import subprocess
+import sys
+import urlparse
+
 import click
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm.session import sessionmaker
 
-from seektam.cli import loader, shell
+from seektam.cli import loader, mealplan, migrate, shell
+from seektam.crawl import client as client_module
 from seektam.crawl import koreafood
+from seektam.migrations import (INITIAL_REVISION, current_revision,
+                                head_revision, upgrade)
 from seektam.model import orm
 from seektam.model import koreafood as koreafood_model
+from seektam.search import SearchIndex
+from seektam.similarity import SimilarityMatrix
 from tests.crawl.test_koreafood import listfile  # noqa
+from tests.crawl.test_koreafood import listfile_path
+from tests.crawl.test_koreafood import MockHTTPClient
 from tests.crawl.test_koreafood import MockHTTPResponse
-from tests.crawl.test_koreafood import MockHTTPSession
 from tests.crawl.test_koreafood import _mock_foodlist_analysis_page
 
 
@@ -27,15 +41,23 @@ def test_loader_argument_requires_url(clirunner):
 
 
 def test_loader_argument_takes_db_url(clirunner, monkeypatch):
-    monkeypatch.setattr(koreafood, 'get_food_list', lambda: [])
+    monkeypatch.setattr(koreafood, 'get_food_list', lambda **kwargs: [])
 
     res = clirunner.invoke(loader, ['sqlite://'])  # SQLite memory
     assert res.exit_code == 0
 
 
+def test_loader_offline_requires_cache_dir(clirunner, monkeypatch):
+    monkeypatch.setattr(koreafood, 'get_food_list', lambda **kwargs: [])
+
+    res = clirunner.invoke(loader, ['sqlite://', '--offline'])
+    assert res.exit_code == 1
+    assert u'--cache-dir' in res.output
+
+
 def test_loader_builds_db_model_if_new(clirunner, monkeypatch, tmpdir):
     # We have no interest in list parsing, so let's ignore it
-    monkeypatch.setattr(koreafood, 'get_food_list', lambda: [])
+    monkeypatch.setattr(koreafood, 'get_food_list', lambda **kwargs: [])
 
     # Create clean SQLite DB (just new file ;)
     url = 'sqlite:///'+tmpdir.join('new.db').strpath
@@ -47,22 +69,65 @@ def test_loader_builds_db_model_if_new(clirunner, monkeypatch, tmpdir):
     assert res.exit_code == 0
     Base = declarative_base()
     Base.metadata.reflect(create_engine(url))
-    assert Base.metadata.tables.keys() == orm.Base.metadata.tables.keys()
+    assert sorted(Base.metadata.tables.keys()) == sorted(
+        orm.Base.metadata.tables.keys() + ['alembic_version'])
+    assert current_revision(create_engine(url)) == head_revision()
+
+
+def _pre_migration_db(url):
+    upgrade(url, INITIAL_REVISION)
+    engine = create_engine(url)
+    engine.execute('DROP TABLE alembic_version')
+    engine.execute(u"INSERT INTO koreafood_foods (id, name) "
+                   u"VALUES (1, '누룽지')")
+    return engine
+
+
+def test_loader_refuses_unmigrated_db(clirunner, monkeypatch, tmpdir):
+    monkeypatch.setattr(koreafood, 'get_food_list', lambda **kwargs: [])
+    url = 'sqlite:///'+tmpdir.join('old.db').strpath
+    engine = _pre_migration_db(url)
+
+    res = clirunner.invoke(loader, [url])
+    assert res.exit_code == 1
+    assert INITIAL_REVISION in res.output
+    # 표를 만들지 않고 그대로 둡니다
+    assert sorted(engine.table_names()) == [
+        'koreafood_aliments', 'koreafood_food_aliment_rels',
+        'koreafood_foods']
+
+    res = clirunner.invoke(migrate, ['--stamp', '-r', INITIAL_REVISION, url])
+    assert res.exit_code == 0
+    res = clirunner.invoke(loader, [url])
+    assert res.exit_code == 1
+    assert 'seektam migrate URL' in res.output
+
+    assert clirunner.invoke(migrate, [url]).exit_code == 0
+    assert clirunner.invoke(loader, [url]).exit_code == 0
+    session = sessionmaker(create_engine(url))()
+    assert session.query(koreafood_model.Food).one().name == u'누룽지'
+
+
+def test_loader_asks_to_stamp_create_all_db(clirunner, monkeypatch, tmpdir):
+    monkeypatch.setattr(koreafood, 'get_food_list', lambda **kwargs: [])
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+    orm.Base.metadata.create_all(create_engine(url))
+
+    res = clirunner.invoke(loader, [url])
+    assert res.exit_code == 1
+    assert 'migrate --stamp URL' in res.output
 
 
 def test_loader_inserts_food_element(  # noqa
     clirunner, monkeypatch, tmpdir, listfile):
     # Mocking for Nurungji-only food list
-    monkeypatch.setattr(
-        koreafood.requests, 'get',
-        lambda _: MockHTTPResponse(listfile.read()))
-    monkeypatch.setattr(
-        koreafood.requests, 'Session',
-        lambda: MockHTTPSession(post=_mock_foodlist_analysis_page))
+    client = MockHTTPClient(
+        get=lambda _: MockHTTPResponse(listfile.read()),
+        post=_mock_foodlist_analysis_page)
 
-    food = koreafood.get_food_list().next()
+    food = koreafood.get_food_list(client).next()
     monkeypatch.setattr(
-        koreafood, 'get_food_list', lambda: [food])
+        koreafood, 'get_food_list', lambda **kwargs: [food])
 
     # Trigger SUT command
     url = 'sqlite:///'+tmpdir.join('new.db').strpath
@@ -95,3 +160,470 @@ def test_shell_run(fx_cli_runner, fx_py_cfg_file):
     res = fx_cli_runner.invoke(shell, ['-c', fx_py_cfg_file])
     assert res.exit_code == 0
     assert '(InteractiveConsole)' in res.output
+
+
+def _mock_site_client(posts):
+    with codecs.open(listfile_path, encoding='euckr') as f:
+        content = f.read()
+
+    def get(url):
+        query = urlparse.parse_qs(url.split('?')[1], keep_blank_values=True)
+        if query['qPage'] == ['1']:
+            return MockHTTPResponse(content)
+        return MockHTTPResponse(u'<html></html>')
+
+    def post(url, param):
+        posts.append(url)
+        if 'D011010' in url:
+            return _mock_foodlist_analysis_page(url, param)
+        return MockHTTPResponse(u'<html></html>')
+
+    return MockHTTPClient(get=get, post=post)
+
+
+def _mock_paged_site_client(pages, error_page=None, error_code=None):
+    with codecs.open(listfile_path, encoding='euckr') as f:
+        content = f.read()
+
+    def get(url):
+        query = urlparse.parse_qs(url.split('?')[1], keep_blank_values=True)
+        page = int(query['qPage'][0])
+        if page == error_page:
+            return MockHTTPResponse(u'<html>Forbidden</html>', 403)
+        elif page > pages:
+            return MockHTTPResponse(u'<html></html>')
+        # 페이지마다 다른 식단 코드를 줍니다
+        return MockHTTPResponse(content.replace(
+            u'meal_code=D', u'meal_code=P%dD' % page))
+
+    def post(url, param):
+        if error_code is not None and error_code in url:
+            return MockHTTPResponse(u'<html>Error</html>', 500)
+        elif 'D011010' in url:
+            return _mock_foodlist_analysis_page(
+                re.sub(r'P\d+D', 'D', url), param)
+        return MockHTTPResponse(u'<html></html>')
+
+    return MockHTTPClient(get=get, post=post)
+
+
+def _dump(url):
+    engine = create_engine(url)
+    return dict(
+        (table.name, engine.execute(
+            table.select().order_by(*table.primary_key.columns)).fetchall())
+        for table in orm.Base.metadata.sorted_tables
+        if table.name.startswith('koreafood_'))
+
+
+def test_loader_processes_match_sequential_run(
+        clirunner, monkeypatch, tmpdir):
+    client = _mock_paged_site_client(5)
+    monkeypatch.setattr(client_module, 'Client', lambda **kwargs: client)
+    urls = ['sqlite:///' + tmpdir.join(name).strpath
+            for name in ('sequential.db', 'processes.db')]
+
+    res = clirunner.invoke(loader, [urls[0], '--progress', '0'])
+    assert res.exit_code == 0
+    res = clirunner.invoke(loader, [
+        urls[1], '--progress', '0', '--processes', '3', '--workers', '2',
+        '--batch-size', '4'])
+    assert res.exit_code == 0
+
+    sequential = _dump(urls[0])
+    assert len(sequential['koreafood_foods']) == 10
+    # 이름이 같은 음식은 마지막 페이지의 것이 남습니다
+    assert all(row.meal_code.startswith('P5D')
+               for row in sequential['koreafood_foods'])
+    assert sequential['koreafood_food_aliment_rels']
+    assert _dump(urls[1]) == sequential
+
+
+def test_loader_splits_host_limits_between_processes(
+        clirunner, monkeypatch, tmpdir):
+    client = _mock_paged_site_client(2)
+    log = tmpdir.join('clients.log')
+
+    def make_client(**kwargs):
+        # 크롤링 프로세스에서 만든 클라이언트도 남도록 파일에 씁니다
+        log.write('%d %g\n' % (kwargs['max_per_host'],
+                               kwargs['rate_limiter'].rate), mode='a')
+        return client
+    monkeypatch.setattr(client_module, 'Client', make_client)
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+
+    res = clirunner.invoke(loader, [url, '--progress', '0', '--processes',
+                                    '3', '--max-per-host', '7', '--rate',
+                                    '6'])
+    assert res.exit_code == 0
+    assert sorted(log.read().splitlines()) == ['2 2'] * 3 + ['7 6']
+
+    log.remove()
+    res = clirunner.invoke(loader, [url, '--progress', '0', '--processes',
+                                    '3', '--max-per-host', '2'])
+    assert res.exit_code == 0
+    assert sorted(line.split()[0] for line in log.readlines()) == \
+        ['1', '1', '1', '2']
+
+
+@pytest.mark.parametrize('processes', ['1', '2'])
+def test_loader_stops_on_error_page_without_marking_stale(
+        clirunner, monkeypatch, tmpdir, processes):
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+    client = _mock_paged_site_client(2)
+    monkeypatch.setattr(client_module, 'Client', lambda **kwargs: client)
+    res = clirunner.invoke(loader, [url, '--progress', '0'])
+    assert res.exit_code == 0
+
+    client = _mock_paged_site_client(2, error_page=2)
+    res = clirunner.invoke(loader, [url, '--progress', '0',
+                                    '--processes', processes])
+    assert res.exit_code == 1
+    assert '403' in res.output
+
+    session = sessionmaker(create_engine(url))()
+    foods = session.query(koreafood_model.Food).all()
+    assert len(foods) == 10
+    assert not any(food.stale for food in foods)
+
+
+def test_loader_skips_foods_with_failed_analysis(
+        clirunner, monkeypatch, tmpdir):
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+    client = _mock_paged_site_client(1, error_code='P1D011010')
+    monkeypatch.setattr(client_module, 'Client', lambda **kwargs: client)
+    res = clirunner.invoke(loader, [url, '--progress', '0'])
+    assert res.exit_code == 0
+    assert 'P1D011010' in res.output
+
+    Food = koreafood_model.Food
+    session = sessionmaker(create_engine(url))()
+    assert session.query(Food).count() == 9
+    assert session.query(Food).filter_by(meal_code=u'P1D011010').first() \
+        is None
+    session.close()
+
+    # 지문을 남기지 않았으므로 --incremental 이 다시 가져옵니다
+    client = _mock_paged_site_client(1)
+    res = clirunner.invoke(loader, [url, '--progress', '0', '--incremental'])
+    assert res.exit_code == 0
+    food = session.query(Food).filter_by(meal_code=u'P1D011010').one()
+    assert len(food.aliments) == 1
+
+
+def test_loader_processes_do_not_refetch_failed_foods(
+        clirunner, monkeypatch, tmpdir):
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+    site = _mock_paged_site_client(2, error_code='P1D011010')
+    requests = []
+
+    def get(url):
+        requests.append(url)
+        return site.get(url)
+
+    def post(url, param):
+        requests.append(url)
+        return site.post(url, param)
+    parent = os.getpid()
+    monkeypatch.setattr(
+        client_module, 'Client',
+        lambda **kwargs: MockHTTPClient(get=get, post=post)
+        if os.getpid() == parent else site)
+    res = clirunner.invoke(loader, [url, '--progress', '0',
+                                    '--processes', '2'])
+    assert res.exit_code == 0
+    # 모든 요청은 크롤링 프로세스들이 보냅니다
+    assert requests == []
+    session = sessionmaker(create_engine(url))()
+    assert session.query(koreafood_model.Food).count() == 10
+
+
+def test_loader_rejects_non_positive_processes(clirunner, tmpdir):
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+    res = clirunner.invoke(loader, [url, '--processes', '0'])
+    assert res.exit_code == 1
+
+
+def test_loader_incremental_fetches_only_changed(
+        clirunner, monkeypatch, tmpdir):
+    posts = []
+    client = _mock_site_client(posts)
+    monkeypatch.setattr(client_module, 'Client', lambda **kwargs: client)
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+
+    res = clirunner.invoke(loader, [url])
+    assert res.exit_code == 0
+    assert len(posts) == 20  # 10 foods * 2 analysis pages
+
+    del posts[:]
+    res = clirunner.invoke(loader, [url, '--incremental'])
+    assert res.exit_code == 0
+    assert posts == []
+
+    session = sessionmaker(create_engine(url))()
+    foods = session.query(koreafood_model.Food).order_by(
+        koreafood_model.Food.id).all()
+    assert len(foods) == 10
+    assert foods[0].meal_code == u'D011010'
+    assert len(foods[0].aliments) == 1
+    assert not any(food.stale for food in foods)
+
+
+def test_loader_runs_stages_concurrently(clirunner, monkeypatch, tmpdir):
+    posts = []
+    client = _mock_site_client(posts)
+    monkeypatch.setattr(client_module, 'Client', lambda **kwargs: client)
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+
+    res = clirunner.invoke(loader, [
+        url, '--workers', '3', '--parse-workers', '2', '--model-workers', '2',
+        '--queue-size', '2', '--batch-size', '3'])
+    assert res.exit_code == 0
+    assert len(posts) == 20
+
+    session = sessionmaker(create_engine(url))()
+    foods = session.query(koreafood_model.Food).order_by(
+        koreafood_model.Food.id).all()
+    with codecs.open(listfile_path, encoding='euckr') as f:
+        expect = [entry[3] for entry in koreafood.parse_list_page(f.read())]
+    assert [food.meal_code for food in foods] == expect
+    assert len(foods[0].aliments) == 1
+
+
+def test_loader_writes_crawl_stats(clirunner, monkeypatch, tmpdir):
+    client = _mock_site_client([])
+    monkeypatch.setattr(client_module, 'Client', lambda **kwargs: client)
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+    path = tmpdir.join('stats.json')
+
+    res = clirunner.invoke(loader, [
+        url, '--progress', '0', '--stats-file', path.strpath,
+        '--batch-size', '7'])
+    assert res.exit_code == 0
+    summary = json.loads(path.read())
+    assert summary['items'] == dict(foods=10, written=10)
+    assert sorted(summary['phases']) == [
+        'convert', 'fetch', 'parse', 'write']
+    assert summary['phases']['fetch']['count'] == 10
+    assert summary['phases']['write']['count'] == 2
+
+    res = clirunner.invoke(loader, [url, '--progress', '0'])
+    assert res.exit_code == 0
+    assert '"totals": {' in res.output  # 파일이 없으면 표준 에러로
+
+
+def test_loader_adapts_request_rate(clirunner, monkeypatch, tmpdir):
+    client = _mock_site_client([])
+    kwargs = {}
+
+    def make_client(**options):
+        kwargs.update(options)
+        return client
+    monkeypatch.setattr(client_module, 'Client', make_client)
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+
+    res = clirunner.invoke(loader, [url, '--progress', '0', '--rate', '2',
+                                    '--max-rate', '8'])
+    assert res.exit_code == 0
+    assert kwargs['rate_limiter'].rate == 2
+    assert kwargs['rate_limiter'].max_rate == 8
+
+    res = clirunner.invoke(loader, [url, '--progress', '0', '--rate', '0'])
+    assert res.exit_code == 0
+    assert kwargs['rate_limiter'] is None
+
+    res = clirunner.invoke(loader, [url, '--rate', '1', '--min-rate', '2'])
+    assert res.exit_code == 1
+
+
+def test_loader_fills_missing_nutrition_totals(
+        clirunner, monkeypatch, tmpdir):
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+    food = koreafood.Food(u'누룽지')
+    food.code = 'D1'
+    food.aliment = {
+        u'쌀': koreafood.AlimentRow.from_fields(u'쌀', dict(energy=3.5))}
+    monkeypatch.setattr(koreafood, 'get_food_list', lambda **kwargs: [food])
+    assert clirunner.invoke(loader, [url]).exit_code == 0
+
+    session = sessionmaker(create_engine(url))()
+    session.query(koreafood_model.FoodNutrition).delete()
+    session.commit()
+
+    monkeypatch.setattr(koreafood, 'get_food_list', lambda **kwargs: [])
+    assert clirunner.invoke(loader, [url]).exit_code == 0
+    assert session.query(koreafood_model.FoodNutrition).one().energy == 3.5
+
+
+def test_loader_corrects_shifted_aliment_values(
+        clirunner, monkeypatch, tmpdir):
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+    food = koreafood.Food(u'누룽지')
+    food.code = 'D1'
+    food.aliment = {
+        u'쌀': koreafood.AlimentRow.from_fields(u'쌀', dict(energy=3.5))}
+    monkeypatch.setattr(koreafood, 'get_food_list', lambda **kwargs: [food])
+    assert clirunner.invoke(loader, [url]).exit_code == 0
+
+    # 예전 파서가 열을 밀려 읽어 저장한 DB
+    session = sessionmaker(create_engine(url))()
+    session.query(koreafood_model.Aliment).update(
+        dict(energy=None, protein=3.5))
+    session.commit()
+
+    assert clirunner.invoke(loader, [url]).exit_code == 0
+    session.expire_all()
+    rice = session.query(koreafood_model.Aliment).one()
+    assert (rice.energy, rice.protein) == (3.5, None)
+    assert session.query(koreafood_model.FoodNutrition).one().energy == 3.5
+
+
+def test_loader_saves_search_index_and_similarity(
+        clirunner, monkeypatch, tmpdir):
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+    path = tmpdir.join('search.idx').strpath
+    food = koreafood.Food(u'누룽지')
+    food.code = 'D1'
+    food.aliment = {
+        u'쌀': koreafood.AlimentRow.from_fields(u'쌀', dict(energy=3.5))}
+    monkeypatch.setattr(koreafood, 'get_food_list', lambda **kwargs: [food])
+    similarity = tmpdir.join('similarity').strpath
+    res = clirunner.invoke(loader, [url, '--search-index', path,
+                                    '--similarity', similarity])
+    assert res.exit_code == 0
+    assert len(SimilarityMatrix.load(similarity)) == 1
+
+    index = SearchIndex.load(path)
+    assert index.revision == 1
+    assert [index.food_names.names[id_]
+            for id_ in index.foods(with_aliments=[u'쌀'])] == [u'누룽지']
+
+
+def test_mealplan(clirunner, monkeypatch, tmpdir):
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+    foods = []
+    for code, name, category, energy in [('D1', u'쌀밥', u'밥류', 300.0),
+                                         ('D2', u'보리밥', u'밥류', 350.0),
+                                         ('D3', u'된장국', u'국류', 80.0)]:
+        food = koreafood.Food(name)
+        food.code = code
+        food.category_big = category
+        food.aliment = {name: koreafood.AlimentRow.from_fields(
+            name, dict(energy=energy, protein=10.0))}
+        foods.append(food)
+    monkeypatch.setattr(koreafood, 'get_food_list', lambda **kwargs: foods)
+    assert clirunner.invoke(loader, [url]).exit_code == 0
+
+    res = clirunner.invoke(mealplan, [
+        url, '--size', '2', '--require', u'밥류', '--require', u'국류',
+        '--energy-min', '400', '--energy-max', '500', '--protein-min', '10'])
+    assert res.exit_code == 0
+    assert u'쌀밥 (밥류)' not in res.output
+    assert u'보리밥 (밥류)' in res.output
+    assert u'된장국 (국류)' in res.output
+    assert u'열량 430kcal' in res.output
+
+    res = clirunner.invoke(mealplan, [url, '--days', '3', '-r', u'국류'])
+    assert res.exit_code == 1
+    assert u'식단을 짤 수 없습니다' in res.output
+
+
+def test_loader_marks_missing_foods_stale(clirunner, monkeypatch, tmpdir):
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+    foods = []
+    for code, name in [('D1', u'누룽지'), ('D2', u'쌀밥')]:
+        food = koreafood.Food(name)
+        food.code = code
+        foods.append(food)
+
+    monkeypatch.setattr(koreafood, 'get_food_list', lambda **kwargs: foods)
+    assert clirunner.invoke(loader, [url]).exit_code == 0
+    monkeypatch.setattr(
+        koreafood, 'get_food_list', lambda **kwargs: foods[:1])
+    assert clirunner.invoke(loader, [url]).exit_code == 0
+
+    session = sessionmaker(create_engine(url))()
+    stale = session.query(koreafood_model.Food.meal_code).filter_by(
+        stale=True)
+    assert [code for code, in stale] == [u'D2']
+
+
+def test_loader_resumes_from_checkpoint(clirunner, monkeypatch, tmpdir):
+    url = 'sqlite:///'+tmpdir.join('new.db').strpath
+    state = tmpdir.join('state.json').strpath
+    posts = []
+    client = _mock_site_client(posts)
+    post = client.post
+
+    def crashing_post(url, param):
+        if 'D011050' in url:
+            raise IOError('connection reset')
+        return post(url, param)
+
+    client.post = crashing_post
+    monkeypatch.setattr(client_module, 'Client', lambda **kwargs: client)
+    res = clirunner.invoke(
+        loader, [url, '--batch-size', '2', '--checkpoint', state])
+    assert isinstance(res.exception, IOError)
+    with open(state) as f:
+        assert json.load(f) == dict(
+            page=0, codes=['D011010', 'D011020', 'D011030', 'D011040'])
+
+    del posts[:]
+    client.post = post
+    res = clirunner.invoke(
+        loader, [url, '--checkpoint', state, '--resume'])
+    assert res.exit_code == 0
+    assert len(posts) == 12  # remaining 6 foods * 2 analysis pages
+    assert not os.path.exists(state)
+
+    session = sessionmaker(create_engine(url))()
+    assert session.query(koreafood_model.Food).count() == 10
+    assert session.query(koreafood_model.Food).filter_by(
+        stale=True).count() == 0
+
+
+def test_loader_resume_requires_checkpoint(clirunner, monkeypatch):
+    monkeypatch.setattr(koreafood, 'get_food_list', lambda **kwargs: [])
+
+    res = clirunner.invoke(loader, ['sqlite://', '--resume'])
+    assert res.exit_code == 1
+    assert u'--checkpoint' in res.output
+
+
+#: 명령줄을 파싱하기만 할 때는 읽지 않아야 하는 무거운 모듈
+HEAVY_MODULES = ('flask', 'lxml', 'numpy', 'requests', 'sqlalchemy',
+                 'werkzeug', 'seektam.crawl', 'seektam.web')
+
+STARTUP_SCRIPT = '''
+import sys
+from seektam.cli import main
+try:
+    main(sys.argv[1:], prog_name='seektam')
+except SystemExit:
+    pass
+sys.stderr.write('\\n'.join(sorted(sys.modules)))
+'''
+
+
+def _startup_modules(*args):
+    process = subprocess.Popen(
+        [sys.executable, '-c', STARTUP_SCRIPT] + list(args),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    _, modules = process.communicate()
+    assert process.returncode == 0
+    return set(modules.decode('utf-8').split())
+
+
+@pytest.mark.parametrize('args', [
+    ('no-such-command',), ('loader',), ('mealplan',), ('migrate',),
+    ('serve', '--config', 'no-such-file.py'), ('shell', '--bad-option'),
+])
+def test_cli_starts_without_heavy_imports(args):
+    modules = _startup_modules(*args)
+    assert 'seektam.cli' in modules
+    loaded = [name for name in modules
+              if any(name == heavy or name.startswith(heavy + '.')
+                     for heavy in HEAVY_MODULES)]
+    assert loaded == []
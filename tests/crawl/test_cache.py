@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+from seektam.crawl.cache import CacheMiss, DiskCache, parse_cached  # SUT
+from seektam.crawl.client import Client
+
+
+class FakeResponse(object):
+    def __init__(self, url, content, status_code=200, headers=None):
+        self.url = url
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSession(object):
+    '''Serves ``pages`` and answers conditional requests with 304.'''
+
+    def __init__(self, pages, etag=None):
+        self.pages = pages
+        self.etag = etag
+        self.requests = []
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def request(self, method, url, headers=None, **kwargs):
+        self.requests.append((method, url, headers))
+        headers = headers or {}
+        if self.etag and headers.get('If-None-Match') == self.etag:
+            return FakeResponse(url, '', 304)
+        response_headers = {'ETag': self.etag} if self.etag else {}
+        return FakeResponse(url, self.pages[url], 200, response_headers)
+
+
+@pytest.fixture
+def fx_cache_dir(tmpdir):
+    return tmpdir.join('cache').strpath
+
+
+def test_diskcache_key_depends_on_post_body():
+    key = DiskCache.key
+    assert key('POST', 'http://a/', data={'n': 1}) == \
+        key('post', 'http://a/', data={'n': 1})
+    assert key('POST', 'http://a/', data={'n': 1}) != \
+        key('POST', 'http://a/', data={'n': 2})
+    assert key('GET', 'http://a/', params={'n': 1}) != key('GET', 'http://a/')
+
+
+def test_client_serves_fresh_entry_without_network(fx_cache_dir):
+    session = FakeSession({'http://a/': 'page'})
+    client = Client(session=session, cache=DiskCache(fx_cache_dir, ttl=60))
+
+    first = client.post('http://a/', {'n': 1})
+    second = client.post('http://a/', {'n': 1})
+
+    assert len(session.requests) == 1
+    assert not first.from_cache
+    assert second.from_cache
+    assert second.content == 'page'
+    assert second.content_hash == first.content_hash
+
+
+def test_client_revalidates_stale_entry_with_etag(fx_cache_dir):
+    session = FakeSession({'http://a/': 'page'}, etag='"v1"')
+    client = Client(session=session, cache=DiskCache(fx_cache_dir, ttl=0))
+
+    client.get('http://a/')
+    r = client.get('http://a/')
+
+    assert len(session.requests) == 2
+    assert session.requests[1][2]['If-None-Match'] == '"v1"'
+    assert r.from_cache
+    assert r.content == 'page'
+
+
+def test_client_offline_replay(fx_cache_dir):
+    session = FakeSession({'http://a/': 'page'})
+    Client(session=session, cache=DiskCache(fx_cache_dir)).get('http://a/')
+
+    offline = Client(session=FakeSession({}),
+                     cache=DiskCache(fx_cache_dir, ttl=0, offline=True))
+    assert offline.get('http://a/').content == 'page'
+    with pytest.raises(CacheMiss):
+        offline.get('http://b/')
+
+
+def test_parse_cached_skips_parsing_same_content(fx_cache_dir):
+    session = FakeSession({'http://a/': 'page', 'http://b/': 'page'})
+    client = Client(session=session, cache=DiskCache(fx_cache_dir))
+    calls = []
+
+    def parse(content):
+        calls.append(content)
+        return [content.upper()]
+
+    assert parse_cached(client, client.get('http://a/'), 't', parse) == \
+        ['PAGE']
+    assert parse_cached(client, client.get('http://b/'), 't', parse) == \
+        ['PAGE']
+    assert calls == ['page']
+
+
+def test_parse_cached_without_cache_parses():
+    class Response(object):
+        content = 'page'
+
+    assert parse_cached(object(), Response(), 't', len) == 4
+
+
+def test_diskcache_evicts_least_recently_used(fx_cache_dir):
+    cache = DiskCache(fx_cache_dir, max_size=3000)
+    for n in range(10):
+        cache.put_parsed('t', '%040d' % n, 'x' * 500)
+        os.utime(cache._path('parsed', 't-%040d' % n), (n, n))
+
+    assert cache.size() <= 3000
+    with pytest.raises(KeyError):
+        cache.get_parsed('t', '%040d' % 0)
+    assert cache.get_parsed('t', '%040d' % 9) == 'x' * 500
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os.path
+
+from seektam.crawl.checkpoint import Checkpoint  # SUT
+from seektam.crawl.koreafood import Food
+
+
+def _food(code, page):
+    food = Food(code)
+    food.code = code
+    food.page = page
+    return food
+
+
+def test_checkpoint_load_missing_file_starts_fresh(tmpdir):
+    state = Checkpoint.load(tmpdir.join('state.json').strpath)
+
+    assert state.page == 0
+    assert state.start_page == 1
+    assert state.codes == set()
+
+
+def test_checkpoint_records_only_flushed_foods(tmpdir):
+    path = tmpdir.join('state.json').strpath
+    state = Checkpoint(path)
+    state.mark(_food('D1', 1))
+    state.mark(_food('D2', 2))
+    assert not os.path.exists(path)
+
+    state.flushed()
+    state.mark(_food('D3', 2))  # not flushed yet
+
+    loaded = Checkpoint.load(path)
+    assert loaded.page == 1  # page 2 may still have foods left
+    assert loaded.start_page == 2
+    assert loaded.codes == set(['D1', 'D2'])
+    with open(path) as f:
+        assert json.load(f) == dict(page=1, codes=['D1', 'D2'])
+
+
+def test_checkpoint_clear_removes_file(tmpdir):
+    path = tmpdir.join('state.json').strpath
+    state = Checkpoint(path)
+    state.mark(_food('D1', 3))
+    state.flushed()
+    assert os.path.exists(path)
+
+    state.clear()
+    assert not os.path.exists(path)
+    assert state.start_page == 1
+    state.clear()  # already removed
+
+
+def test_checkpoint_without_path_stays_in_memory(tmpdir):
+    state = Checkpoint(None)
+    state.mark(_food('D1', 3))
+    state.flushed()
+
+    assert state.page == 2
+    assert state.codes == set(['D1'])
+    state.clear()
+    assert tmpdir.listdir() == []
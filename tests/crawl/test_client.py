@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+import io
+import warnings
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from seektam.crawl.client import Client, url_kind  # SUT
+from seektam.crawl.ratelimit import AdaptiveLimiter
+from seektam.crawl.stats import CrawlStats
+
+
+class RecordingSession(object):
+    def __init__(self):
+        self.adapters = {}
+        self.calls = []
+
+    def mount(self, prefix, adapter):
+        self.adapters[prefix] = adapter
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return kwargs
+
+
+def test_client_mounts_pooled_adapter():
+    session = RecordingSession()
+    Client(pool_size=7, retries=5, backoff=0.1, session=session)
+
+    adapter = session.adapters['http://']
+    assert session.adapters['https://'] is adapter
+    assert adapter._pool_maxsize == 7
+    assert adapter.max_retries.total == 5
+    assert adapter.max_retries.backoff_factor == 0.1
+    assert 503 in adapter.max_retries.status_forcelist
+    assert adapter.max_retries.is_retry('POST', 503)
+
+
+def test_client_builds_retry_without_deprecated_arguments():
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        Client(session=RecordingSession())
+    assert not [w for w in caught
+                if issubclass(w.category, DeprecationWarning)]
+
+
+def test_client_leaves_status_retries_to_rate_limiter():
+    session = RecordingSession()
+    Client(retries=5, session=session, rate_limiter=AdaptiveLimiter())
+
+    retry = session.adapters['http://'].max_retries
+    assert retry.total == 5
+    assert not retry.status_forcelist
+
+
+def test_client_reuses_one_session():
+    session = RecordingSession()
+    client = Client(session=session)
+
+    client.get('http://example.com/list', params={'qPage': 1})
+    client.post('http://example.com/detail', {'h_NutriPage': 2})
+
+    assert [c[:2] for c in session.calls] == [
+        ('GET', 'http://example.com/list'),
+        ('POST', 'http://example.com/detail')]
+    assert session.calls[0][2]['params'] == {'qPage': 1}
+    assert session.calls[1][2]['data'] == {'h_NutriPage': 2}
+
+
+def test_client_applies_default_timeout():
+    session = RecordingSession()
+    client = Client(timeout=3.5, session=session)
+
+    assert client.get('http://example.com/')['timeout'] == 3.5
+    assert client.request(
+        'GET', 'http://example.com/', timeout=1)['timeout'] == 1
+
+
+def test_client_streams_uncached_bodies():
+    session = RecordingSession()
+    client = Client(session=session)
+
+    assert client.get('http://example.com/')['stream'] is True
+
+
+def test_client_limits_per_host_only_if_asked():
+    assert Client(session=RecordingSession()).limiter is None
+    client = Client(max_per_host=3, session=RecordingSession())
+    assert client.limiter.limit == 3
+
+
+class RetriedBody(io.BytesIO):
+    class retries(object):
+        history = ('first', 'second')
+
+
+class FixedAdapter(BaseAdapter):
+    def send(self, request, **kwargs):
+        if request.url.endswith('/down'):
+            raise requests.ConnectionError('down')
+        response = requests.Response()
+        response.status_code = 500 if request.url.endswith('/error') else 200
+        response.raw = RetriedBody(b'x' * 100)
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+def test_url_kind():
+    assert url_kind('http://a.kr/mgn/list.aspx?page=2') == 'list.aspx'
+    assert url_kind('http://a.kr/') == 'a.kr'
+
+
+def test_client_records_stats():
+    stats = CrawlStats()
+    client = Client(retries=4, stats=stats)
+    client.session.mount('http://stats.test/', FixedAdapter())
+
+    client.get('http://stats.test/list').content
+    r = client.post('http://stats.test/error')
+    assert b''.join(r.iter_content(10)) == b'x' * 100
+    with pytest.raises(requests.ConnectionError):
+        client.get('http://stats.test/down')
+
+    summary = stats.summary()
+    assert summary['requests']['list'] == dict(
+        count=1, cached=0, bytes=100, retries=2, failures=0,
+        statuses={'200': 1})
+    assert summary['requests']['error']['failures'] == 1
+    assert summary['requests']['down'] == dict(
+        count=1, cached=0, bytes=0, retries=4, failures=1,
+        statuses={'error': 1})
+    assert summary['phases']['http']['count'] == 2
+
+
+def test_client_counts_preloaded_body_once():
+    stats = CrawlStats()
+    client = Client(stats=stats)
+    client.session.mount('http://stats.test/', FixedAdapter())
+
+    r = client.post('http://stats.test/analysis')
+    assert len(r.content) == 100
+    # 파싱할 때 받아 둔 본문을 다시 읽어도 더 세지 않습니다
+    assert b''.join(r.iter_content(10)) == b'x' * 100
+    assert stats.summary()['requests']['analysis']['bytes'] == 100
+
+
+class ThrottlingAdapter(BaseAdapter):
+    def __init__(self, throttled, status=429):
+        super(ThrottlingAdapter, self).__init__()
+        self.throttled = throttled
+        self.status = status
+        self.urls = []
+
+    def send(self, request, **kwargs):
+        self.urls.append(request.url)
+        response = requests.Response()
+        if len(self.urls) <= self.throttled:
+            response.status_code = self.status
+            if self.status == 429:
+                response.headers['Retry-After'] = '0'
+        else:
+            response.status_code = 200
+        response.raw = io.BytesIO(b'ok')
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+def test_client_retries_throttled_requests():
+    limiter = AdaptiveLimiter(rate=50, max_rate=50)
+    client = Client(retries=3, rate_limiter=limiter)
+    adapter = ThrottlingAdapter(2)
+    client.session.mount('http://throttle.test/', adapter)
+
+    r = client.get('http://throttle.test/list')
+    assert r.status_code == 200
+    assert len(adapter.urls) == 3
+    assert limiter.rates()['throttle.test'] < 50
+
+
+def test_client_gives_up_on_throttling_after_retries():
+    client = Client(retries=1, rate_limiter=AdaptiveLimiter(rate=50,
+                                                            max_rate=50))
+    adapter = ThrottlingAdapter(5)
+    client.session.mount('http://throttle.test/', adapter)
+
+    assert client.get('http://throttle.test/list').status_code == 429
+    assert len(adapter.urls) == 2
+
+
+def test_client_does_not_retry_throttling_without_limiter():
+    client = Client(retries=3)
+    adapter = ThrottlingAdapter(5)
+    client.session.mount('http://throttle.test/', adapter)
+
+    assert client.get('http://throttle.test/list').status_code == 429
+    assert len(adapter.urls) == 1
+
+
+class RecordingLimiter(AdaptiveLimiter):
+    def __init__(self, *args, **kwargs):
+        super(RecordingLimiter, self).__init__(*args, **kwargs)
+        self.acquired = []
+        self.observed = []
+
+    def acquire(self, url, kind=None):
+        self.acquired.append(url)
+        super(RecordingLimiter, self).acquire(url, kind)
+
+    def observe(self, url, status, seconds=None, retry_after=None):
+        self.observed.append(status)
+        super(RecordingLimiter, self).observe(url, status, seconds,
+                                              retry_after)
+
+
+def test_client_retries_server_errors_through_limiter():
+    limiter = RecordingLimiter(rate=50, max_rate=50)
+    client = Client(retries=3, backoff=0, rate_limiter=limiter)
+    adapter = ThrottlingAdapter(3, status=503)
+    client.session.mount('http://flaky.test/', adapter)
+
+    r = client.post('http://flaky.test/analysis')
+    assert r.status_code == 200
+    assert len(adapter.urls) == 4
+    assert len(limiter.acquired) == 4
+    assert limiter.observed == [503, 503, 503, 200]
+    assert limiter.rates()['flaky.test'] < 50
+
+
+def test_client_gives_up_on_server_errors_after_retries():
+    client = Client(retries=2, backoff=0,
+                    rate_limiter=AdaptiveLimiter(rate=50, max_rate=50))
+    adapter = ThrottlingAdapter(5, status=502)
+    client.session.mount('http://flaky.test/', adapter)
+
+    assert client.get('http://flaky.test/list').status_code == 502
+    assert len(adapter.urls) == 3
@@ -1,13 +1,20 @@
 # -*- coding: utf-8 -*-
 
 import codecs
+import gc
+import itertools
 import os
 import random
+import threading
+import time
+import weakref
 
 import pytest
+import requests
 from sqlalchemy.orm.exc import NoResultFound
 
 from seektam.crawl import koreafood  # SUT
+from seektam.crawl.client import Client
 from seektam import model
 
 
@@ -33,24 +40,32 @@ def trigger_error_func(*args, **kwarg):
 
 
 class MockHTTPResponse(object):
-    def __init__(self, content):
+    def __init__(self, content, status_code=200):
         self.content = content
+        self.status_code = status_code
 
 
-class MockHTTPSession(object):
-    def __init__(self, post):
+class MockHTTPClient(object):
+    '''Stand-in for :class:`seektam.crawl.client.Client`.'''
+
+    def __init__(self, get=trigger_error_func, post=trigger_error_func):
+        self.get = get
         self.post = post
 
 
-def test_foodlist_monkeypatch_work(monkeypatch):
+def _empty_analysis_page(url, param):
+    return MockHTTPResponse(u'<html></html>')
+
+
+def test_foodlist_client_injected():
     '''
-    Test if koreafood.get_food_list() calls monkeypatched
-    requests.get() method.
+    Test if koreafood.get_food_list() calls injected client's
+    get() method.
     '''
 
-    monkeypatch.setattr(koreafood.requests, 'get', trigger_error_func)
+    client = MockHTTPClient(get=trigger_error_func)
 
-    l = koreafood.get_food_list()
+    l = koreafood.get_food_list(client)
     with pytest.raises(AttributeError):
         l.next()
 
@@ -80,14 +95,12 @@ def test_foodlist_listfile_valid(listfile):
 
 
 def test_foodlist_listfile_food_parsed(monkeypatch, listfile):
-    monkeypatch.setattr(
-        koreafood.requests, 'get',
-        lambda _: MockHTTPResponse(listfile.read()))
+    client = MockHTTPClient(get=lambda _: MockHTTPResponse(listfile.read()))
     monkeypatch.setattr(
         koreafood, 'get_food_analysis',
-        lambda _: {})  # alignment parse ignored
+        lambda code, client=None: {})  # alignment parse ignored
 
-    food = koreafood.get_food_list().next()
+    food = koreafood.get_food_list(client).next()
     assert food.category_big == u'밥류'
     assert food.category_small == u'쌀밥'
     assert food.name == u'누룽지'
@@ -107,54 +120,135 @@ def _mock_foodlist_analysis_page(url, param):
     return MockHTTPResponse(content=f.read())
 
 
-def test_foodlist_analysis_session_mocked(monkeypatch):
-    monkeypatch.setattr(
-        koreafood.requests, 'Session',
-        lambda: MockHTTPSession(post=trigger_error_func))
+def _mock_list_client(listfile, post=_mock_foodlist_analysis_page):
+    content = listfile.read()
+    return MockHTTPClient(get=lambda _: MockHTTPResponse(content), post=post)
 
-    with pytest.raises(AttributeError):
-        koreafood.get_food_analysis('NO_MEARNING')
 
+def test_foodlist_analysis_client_injected():
+    client = MockHTTPClient(post=trigger_error_func)
 
-def test_foodlist_analysis_exists(monkeypatch):
-    monkeypatch.setattr(
-        koreafood.requests, 'Session',
-        lambda: MockHTTPSession(post=_mock_foodlist_analysis_page))
+    with pytest.raises(AttributeError):
+        koreafood.get_food_analysis('NO_MEARNING', client)
 
-    koreafood.get_food_list().next()
 
+def test_foodlist_analysis_exists(listfile):
+    koreafood.get_food_list(_mock_list_client(listfile)).next()
 
-def test_foodlist_analysis_parsed(monkeypatch):
-    monkeypatch.setattr(
-        koreafood.requests, 'Session',
-        lambda: MockHTTPSession(post=_mock_foodlist_analysis_page))
 
-    nurungji = koreafood.get_food_list().next()
+def test_foodlist_analysis_parsed(listfile):
+    nurungji = koreafood.get_food_list(_mock_list_client(listfile)).next()
+    name = u'쌀,멥쌀,논벼,백미,(국내산),일반형,일품'
     expect_aliment = {
-        u'쌀,멥쌀,논벼,백미,(국내산),일반형,일품': [
-            50, 185, 5.6, 2.6, 0.2, 41.3, 0.2, 0.2, 3, 45.5, 0.6,
-            7.5, 52.5, 0, 0, 0, 0.1, 0.015, 0.5, 0
-            ]
+        name: koreafood.AlimentRow(
+            name, weight=50, energy=185, moisture=5.6, protein=2.6, fat=0.2,
+            nonfiborous=41.3, fiber=0.2, ash=0.2, calcium=3,
+            phosphorus=45.5, iron=0.6, sodium=7.5, potassium=52.5,
+            retinol_equivalent=0, retinol=0, betacarotene=0, thiamin=0.1,
+            riboflavin=0.015, niacin=0.5, ascobic_acid=0)
         }
 
-    for k in nurungji.aliment:
-        assert k in nurungji.aliment
-        assert len(nurungji.aliment[k]) == len(expect_aliment[k])
-        for a, b in zip(nurungji.aliment[k], expect_aliment[k]):
-            assert float(a) == float(b)
+    assert nurungji.aliment == expect_aliment
+    assert all(isinstance(v, float) for v in nurungji.aliment[name][1:])
 
 
-def test_foodlist_listfile_next_called(monkeypatch, listfile):
-    monkeypatch.setattr(
-        koreafood.requests, 'get',
-        lambda _: MockHTTPResponse(listfile.read()))
+def test_analysis_page_header_maps_columns():
+    page = koreafood.parse_analysis_page(analysisfile('D011010', 2).read())
+
+    assert page.fields == (
+        'weight', 'sodium', 'potassium', 'retinol_equivalent', 'retinol',
+        'betacarotene', 'thiamin', 'riboflavin', 'niacin', 'ascobic_acid')
+    assert page.unknown == ()
+    assert page.rows == [(u'쌀,멥쌀,논벼,백미,(국내산),일반형,일품',
+                          (50, 7.5, 52.5, 0, 0, 0, 0.1, 0.015, 0.5, 0))]
+
+
+def test_analysis_page_reports_unknown_columns():
+    page = koreafood.parse_analysis_page(u"""<table>
+        <tr><th>식품명</th><th>중량</th><th>요오드 Iodine</th>
+            <th>철 Iron</th></tr>
+        <tbody id="anal_Table">
+            <tr><td>소금</td><td>1,000</td><td>3</td><td>-</td></tr>
+            <tr><td>합계</td><td>1,000</td><td>3</td><td>-</td></tr>
+        </tbody></table>""")
+
+    assert page.fields == ('weight', 'iron')
+    assert page.unknown == (u'요오드 Iodine',)
+    assert page.rows == [(u'소금', (1000.0, None))]
+
+
+def test_analysis_page_without_table():
+    page = koreafood.parse_analysis_page(u'<html></html>')
+    assert page == ((), [], ())
+
+
+def _chunked(content, size):
+    return iter([content[n:n+size] for n in range(0, len(content), size)])
+
 
-    l = koreafood.get_food_list()
+@pytest.mark.parametrize('size', [7, 100, 4096])
+def test_analysis_page_parses_chunks(size):
+    content = analysisfile('D011010', 2).read()
+    expect = koreafood.parse_analysis_page(content)
+
+    assert expect.rows
+    assert koreafood.parse_analysis_page(_chunked(content, size)) == expect
+    assert koreafood.parse_analysis_page(
+        _chunked(content.encode('euc-kr'), size)) == expect
+
+
+@pytest.mark.parametrize('size', [7, 100, 4096])
+def test_list_page_parses_chunks(listfile, size):
+    content = listfile.read()
+    expect = koreafood.parse_list_page(content)
+
+    assert len(expect) == 10
+    assert koreafood.parse_list_page(_chunked(content, size)) == expect
+    assert koreafood.parse_list_page(
+        _chunked(content.encode('euc-kr'), size)) == expect
+
+
+def test_foodlist_parses_streamed_body(listfile):
+    content = listfile.read()
+
+    class StreamedResponse(object):
+        status_code = 200
+
+        def __init__(self, content):
+            self.chunks = _chunked(content.encode('euc-kr'), 1024)
+
+        @property
+        def content(self):
+            raise AssertionError('body should be streamed')
+
+        def iter_content(self, chunk_size=1):
+            return self.chunks
+
+    client = MockHTTPClient(get=lambda url: StreamedResponse(content),
+                            post=_empty_analysis_page)
+    food = koreafood.get_food_list(client).next()
+    assert (food.name, food.code) == (u'누룽지', 'D011010')
+
+
+def test_foodlist_analysis_warns_missing_columns(caplog):
+    client = MockHTTPClient(post=lambda url, param: MockHTTPResponse(
+        analysisfile('D011010', 1).read()))
+
+    result = koreafood.get_food_analysis('D011010', client)
+
+    row = result.values()[0]
+    assert row.energy == 185
+    assert row.sodium is None
+    assert 'missing analysis columns sodium' in caplog.text
+
+
+def test_foodlist_listfile_next_called(listfile):
+    client = _mock_list_client(listfile, post=_empty_analysis_page)
+
+    l = koreafood.get_food_list(client)
     l.next()  # 1 called (9 items remained)
 
-    monkeypatch.setattr(
-        koreafood.requests, 'get',
-        lambda _: trigger_error_func)
+    client.get = lambda _: trigger_error_func
 
     for n in range(9):
         l.next()  # consume all lists
@@ -163,24 +257,88 @@ def test_foodlist_listfile_next_called(monkeypatch, listfile):
         l.next()  # requets next page
 
 
-def test_foodlist_break_if_no_more_list(monkeypatch, listfile):
-    monkeypatch.setattr(
-        koreafood.requests, 'get',
-        lambda _: MockHTTPResponse(listfile.read()))
+def test_foodlist_break_if_no_more_list(listfile):
+    client = _mock_list_client(listfile, post=_empty_analysis_page)
 
-    l = koreafood.get_food_list()
+    l = koreafood.get_food_list(client)
     for n in range(10):
         l.next()  # traverse all(10) list elements
 
-    monkeypatch.setattr(
-        koreafood.requests, 'get',
-        lambda _: MockHTTPResponse(u'<html></html>'))
+    client.get = lambda _: MockHTTPResponse(u'<html></html>')
 
     # returns nothing, iterator should be stopped
     with pytest.raises(StopIteration):
         l.next()
 
 
+def test_foodlist_raises_on_error_page(listfile):
+    client = _mock_list_client(listfile, post=_empty_analysis_page)
+
+    foods = koreafood.get_food_list(client)
+    for n in range(10):
+        foods.next()
+
+    client.get = lambda _: MockHTTPResponse(u'<html></html>', 403)
+
+    # 오류 페이지를 목록의 끝으로 알면 안 됩니다
+    with pytest.raises(requests.HTTPError):
+        foods.next()
+
+
+def test_foodlist_analysis_raises_on_error_page():
+    client = MockHTTPClient(
+        post=lambda url, param: MockHTTPResponse(u'<html></html>', 500))
+
+    with pytest.raises(requests.HTTPError):
+        koreafood.get_food_analysis('D011010', client)
+
+
+class MockRequestsSession(object):
+    '''Stand-in for :class:`requests.Session` counting in-flight posts.'''
+
+    def __init__(self, list_content):
+        self.list_content = list_content
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.peak = 0
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def request(self, method, url, data=None, params=None, timeout=None,
+                stream=False):
+        if method == 'GET':
+            return MockHTTPResponse(self.list_content)
+        with self.lock:
+            self.inflight += 1
+            self.peak = max(self.peak, self.inflight)
+        time.sleep(random.random() * 0.01)
+        with self.lock:
+            self.inflight -= 1
+        if 'D011010' in url:
+            return _mock_foodlist_analysis_page(url, data)
+        return _empty_analysis_page(url, data)
+
+
+def test_foodlist_concurrent_keeps_list_order(listfile):
+    content = listfile.read()
+
+    def crawl(**kwargs):
+        session = MockRequestsSession(content)
+        client = Client(session=session, **kwargs)
+        foods = koreafood.get_food_list(client, workers=4)
+        return session, [(f.name, f.code, f.aliment)
+                         for f in itertools.islice(foods, 10)]
+
+    _, expect = crawl()
+    session, result = crawl(max_per_host=2)
+
+    assert result == expect
+    assert [r[1] for r in result][:2] == ['D011010', 'D011020']
+    assert len(result[0][2]) == 1
+    assert session.peak <= 2
+
+
 class MockDBSession(object):
     def __init__(self, result=[]):
         self._call_count = 0
@@ -320,21 +478,13 @@ def test_foodtomodel_parse_aliment():
     f = koreafood.Food('FOOD')
     a = dummy_fuzzy_aliment()
 
-    # Function `food_to_model` takes argument food.aliment as dictionary of
-    # lists(fixed order), so for testing we should reorder lists as
-    # SUT-expected order.
-    columns = [
-        'weight', 'energy', 'moisture', 'protein', 'fat',
-        'nonfiborous', 'fiber', 'ash', 'calcium', 'potassium',
-        'retinol_equivalent', 'retinol', 'betacarotene',
-        'thiamin', 'riboflavin', 'niacin', 'ascobic_acid'
-        ]
-    aliment_list = ['2.0']  # weight=1.0
-    weight = float(aliment_list[0])
-    for n in range(1, 1+len(columns[1:])):
-        aliment_list.append('{:,}'.format(getattr(a, columns[n])))
-
-    f.aliment = {a.name: aliment_list}
+    weight = 2.0
+    row = koreafood.AlimentRow.from_fields(a.name, dict(
+        (c, getattr(a, c)) for c in model.koreafood.NUTRIENTS))
+    row = row._replace(weight=weight)
+    columns = ('weight',) + model.koreafood.NUTRIENTS
+
+    f.aliment = {a.name: row}
     result = koreafood.food_to_model(s, f)
 
     assert result.name == f.name
@@ -345,3 +495,145 @@ def test_foodtomodel_parse_aliment():
     for column_name in columns[1:]:
         c = getattr(result.aliments[0], column_name)
         assert c == getattr(a, column_name) / weight
+
+
+def test_foodtomodel_keeps_aliment_weight():
+    cache = koreafood.AlimentCache()
+    f = koreafood.Food('FOOD')
+    f.aliment = {
+        u'쌀': koreafood.AlimentRow.from_fields(
+            u'쌀', dict(weight=50.0, energy=185.0)),
+        u'물': koreafood.AlimentRow.from_fields(u'물', {}),
+    }
+
+    result = koreafood.food_to_model(None, f, cache)
+
+    weights = dict((r.aliment.name, r.weight) for r in result.food_aliments)
+    assert weights == {u'쌀': 50.0, u'물': None}
+    assert cache.get(u'쌀').energy == 3.7
+
+
+def test_foodtomodel_cached_aliment_does_not_keep_foods():
+    cache = koreafood.AlimentCache()
+    row = koreafood.AlimentRow.from_fields(u'쌀', dict(weight=50.0))
+    refs = []
+    for n in range(100):
+        food = koreafood.Food('FOOD%d' % n)
+        food.aliment = {u'쌀': row}
+        result = koreafood.food_to_model(None, food, cache)
+        refs.append(weakref.ref(result))
+        refs.append(weakref.ref(result.food_aliments[0]))
+    del food, result
+    gc.collect()
+
+    # 캐시에 남은 재료가 로더가 다 쓴 음식들을 붙잡으면 안 됩니다
+    assert cache.get(u'쌀') is not None
+    assert [ref for ref in refs if ref() is not None] == []
+
+
+def test_alimentcache_loads_with_single_query():
+    rice = model.koreafood.Aliment(name=u'쌀')
+    salt = model.koreafood.Aliment(name=u'소금')
+    sess = MockDBSession([rice, salt])
+    sess.one = dummy_error_func
+
+    cache = koreafood.AlimentCache.load(sess)
+
+    assert len(cache) == 2
+    assert cache.get(u'쌀') is rice
+    assert u'소금' in cache
+    assert cache.get(u'물') is None
+
+
+def test_foodtomodel_cache_hit_skips_query():
+    rice = model.koreafood.Aliment(name=u'쌀')
+    sess = MockDBSession()
+    sess.query = dummy_error_func  # raise AttributeError if queried
+    food = koreafood.Food('FOOD')
+    food.aliment = {u'쌀': ['50', '185']}
+
+    cache = koreafood.AlimentCache([rice])
+
+    result = koreafood.food_to_model(sess, food, cache)
+
+    assert result.aliments == [rice]
+
+
+def test_foodtomodel_cache_miss_fills_cache():
+    sess = MockDBSession()
+    sess.query = dummy_error_func
+    cache = koreafood.AlimentCache()
+    aliment = koreafood.AlimentRow.from_fields(
+        u'쌀', dict((c, 1.0) for c in model.koreafood.NUTRIENTS))
+    aliment = aliment._replace(weight=2.0)
+    first = koreafood.Food('FIRST')
+    first.aliment = {u'쌀': aliment}
+    second = koreafood.Food('SECOND')
+    second.aliment = {u'쌀': aliment}
+
+    a = koreafood.food_to_model(sess, first, cache).aliments[0]
+    b = koreafood.food_to_model(sess, second, cache).aliments[0]
+
+    assert a.name == u'쌀'
+    assert a.energy == 0.5
+    assert cache.get(u'쌀') is a
+    assert b is a
+
+
+def test_food_list_fingerprint_follows_list_row():
+    a = koreafood.Food(u'누룽지')
+    a.code = 'D011010'
+    b = koreafood.Food(u'누룽지')
+    b.code = 'D011010'
+    b.aliment = {u'쌀': ['50']}
+
+    assert a.list_fingerprint() == b.list_fingerprint()
+    b.category_small = u'쌀밥'
+    assert a.list_fingerprint() != b.list_fingerprint()
+
+
+def test_food_analysis_fingerprint_follows_aliments():
+    a = koreafood.Food(u'누룽지')
+    a.aliment = {u'쌀': ['50', '185']}
+    b = koreafood.Food(u'누룽지')
+    b.aliment = {u'쌀': ['50', '185']}
+
+    assert a.analysis_fingerprint() == b.analysis_fingerprint()
+    b.aliment[u'쌀'][1] = '186'
+    assert a.analysis_fingerprint() != b.analysis_fingerprint()
+    b.aliment = None
+    assert b.analysis_fingerprint() is None
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_foodlist_fetch_analysis_filter(listfile, workers):
+    posts = []
+
+    def post(url, param):
+        posts.append(url)
+        return _mock_foodlist_analysis_page(url, param)
+
+    client = _mock_list_client(listfile, post=post)
+    foods = list(itertools.islice(koreafood.get_food_list(
+        client, workers=workers,
+        fetch_analysis=lambda food: food.code == 'D011010'), 10))
+
+    assert len(foods) == 10
+    assert len(foods[0].aliment) == 1
+    assert all(food.aliment is None for food in foods[1:])
+    assert len(posts) == 2  # two analysis pages of D011010 only
+
+
+def test_foodlist_starts_from_given_page(listfile):
+    urls = []
+    content = listfile.read()
+
+    def get(url):
+        urls.append(url)
+        return MockHTTPResponse(content)
+
+    client = MockHTTPClient(get=get, post=_empty_analysis_page)
+    food = koreafood.get_food_list(client, start_page=7).next()
+
+    assert 'qPage=7' in urls[0]
+    assert food.page == 7
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import time
+
+import pytest
+
+from seektam.crawl.parallel import CrawlProcessError, crawl_pages  # SUT
+
+
+def _page_crawler(last_page, fail_page=None, exit_page=None):
+    def make_crawler():
+        def crawl(page):
+            time.sleep(random.random() * 0.01)
+            if page == fail_page:
+                raise ValueError('broken page %d' % page)
+            elif page == exit_page:
+                os._exit(3)
+            elif page > last_page:
+                return []
+            return [(page, n, os.getpid()) for n in range(3)]
+        return crawl
+    return make_crawler
+
+
+def test_crawl_pages_keeps_page_order():
+    foods = list(crawl_pages(_page_crawler(11), 3, start_page=2))
+
+    assert [food[:2] for food in foods] == [
+        (page, n) for page in range(2, 12) for n in range(3)]
+    pids = dict((page, pid) for page, _, pid in foods)
+    # 페이지를 프로세스 수만큼 건너뛰며 나눠 가집니다
+    assert len(set(pids.values())) == 3
+    for page in range(2, 9):
+        assert pids[page] == pids[page + 3]
+    assert os.getpid() not in pids.values()
+
+
+def test_crawl_pages_single_process():
+    foods = list(crawl_pages(_page_crawler(2), 1))
+
+    assert [food[:2] for food in foods] == [
+        (page, n) for page in (1, 2) for n in range(3)]
+
+
+def test_crawl_pages_empty_list():
+    assert list(crawl_pages(_page_crawler(0), 4)) == []
+
+
+def test_crawl_pages_rejects_non_positive_processes():
+    with pytest.raises(ValueError):
+        list(crawl_pages(_page_crawler(1), 0))
+
+
+def test_crawl_pages_raises_worker_errors():
+    foods = crawl_pages(_page_crawler(10, fail_page=5), 2)
+
+    with pytest.raises(CrawlProcessError) as e:
+        list(foods)
+    assert 'broken page 5' in str(e.value)
+
+
+def test_crawl_pages_notices_dead_workers():
+    foods = crawl_pages(_page_crawler(10, exit_page=4), 2)
+
+    with pytest.raises(CrawlProcessError) as e:
+        list(foods)
+    assert 'exited with code 3' in str(e.value)
+
+
+def test_crawl_pages_bounds_pages_waiting_for_slow_page(tmpdir):
+    def make_crawler():
+        def crawl(page):
+            tmpdir.join(str(page)).write('')
+            if page == 1:
+                time.sleep(0.5)
+            return [page] if page <= 100 else []
+        return crawl
+    foods = crawl_pages(make_crawler, 2, queue_size=2)
+
+    assert next(foods) == 1
+    # 1페이지를 기다리는 동안 다른 프로세스는 2 * 2 페이지까지만 앞서감
+    assert len(tmpdir.listdir()) <= 5
+    assert list(foods) == list(range(2, 101))
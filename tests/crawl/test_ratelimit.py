@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import pytest
+
+from seektam.crawl.ratelimit import (AdaptiveLimiter, HostLimiter,
+                                     parse_retry_after)  # SUT
+
+
+def test_hostlimiter_rejects_non_positive_limit():
+    with pytest.raises(ValueError):
+        HostLimiter(0)
+
+
+def test_hostlimiter_caps_inflight_per_host():
+    limiter = HostLimiter(2)
+    lock = threading.Lock()
+    inflight = {}
+    peak = {}
+
+    def request(url, host):
+        with limiter.slot(url):
+            with lock:
+                inflight[host] = inflight.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), inflight[host])
+            time.sleep(0.01)
+            with lock:
+                inflight[host] -= 1
+
+    threads = []
+    for n in range(6):
+        for host in ('a.example.com', 'b.example.com'):
+            url = 'http://%s/page?n=%d' % (host, n)
+            threads.append(
+                threading.Thread(target=request, args=(url, host)))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert peak == {'a.example.com': 2, 'b.example.com': 2}
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT',
+                             now=1445412470.0) == 10.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT',
+                             now=1445412490.0) == 0.0
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+
+
+def test_adaptivelimiter_rejects_bad_rates():
+    with pytest.raises(ValueError):
+        AdaptiveLimiter(rate=1, min_rate=2)
+    with pytest.raises(ValueError):
+        AdaptiveLimiter(rate=100, max_rate=50)
+    with pytest.raises(ValueError):
+        AdaptiveLimiter(decrease=1)
+
+
+def test_adaptivelimiter_aimd():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(rate=4, min_rate=1, max_rate=6, increase=2,
+                              clock=clock)
+    url = 'http://a.example.com/list'
+    limiter.observe(url, 200, 0.1)
+    assert limiter.rates() == {'a.example.com': 4.5}
+    limiter.observe(url, 503)
+    assert limiter.rates() == {'a.example.com': 2.25}
+    # 이미 보낸 요청들의 실패로는 다시 줄이지 않습니다
+    limiter.failed(url)
+    assert limiter.rates() == {'a.example.com': 2.25}
+    clock.now += 1
+    limiter.failed(url)
+    assert limiter.rates() == {'a.example.com': 1.125}
+    clock.now += 1
+    limiter.observe(url, 429)
+    assert limiter.rates() == {'a.example.com': 1}
+    for _ in range(100):
+        limiter.observe(url, 200, 0.1)
+    assert limiter.rates() == {'a.example.com': 6}
+
+
+def test_adaptivelimiter_slows_down_on_latency():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(rate=4, latency_factor=2, clock=clock)
+    url = 'http://a.example.com/list'
+    for _ in range(3):
+        limiter.observe(url, 200, 0.1)
+    rate = limiter.rates()['a.example.com']
+    for _ in range(10):
+        limiter.observe(url, 200, 1.0)
+    assert limiter.rates()['a.example.com'] < rate
+
+
+def test_adaptivelimiter_limits_rate():
+    limiter = AdaptiveLimiter(rate=50, max_rate=50, burst=1)
+    started = time.time()
+    for _ in range(6):
+        limiter.acquire('http://a.example.com/list')
+    assert time.time() - started >= 0.09
+    # 호스트마다 따로 셉니다
+    started = time.time()
+    limiter.acquire('http://b.example.com/list')
+    assert time.time() - started < 0.02
+
+
+def test_adaptivelimiter_honors_retry_after():
+    limiter = AdaptiveLimiter(rate=50, max_rate=50)
+    limiter.observe('http://a.example.com/list', 503, retry_after='1')
+    started = time.time()
+    limiter.acquire('http://a.example.com/analysis')
+    assert time.time() - started >= 0.9
+
+
+def test_adaptivelimiter_alternates_kinds():
+    limiter = AdaptiveLimiter(rate=20, max_rate=20, burst=1)
+    limiter.acquire('http://a.example.com/')  # 토큰을 써 둡니다
+    order = []
+    lock = threading.Lock()
+
+    def request(kind, n):
+        limiter.acquire('http://a.example.com/%s' % kind, kind)
+        with lock:
+            order.append(kind)
+
+    threads = [threading.Thread(target=request, args=('analysis', n))
+               for n in range(4)]
+    threads.append(threading.Thread(target=request, args=('list', 0)))
+    for t in threads:
+        t.start()
+        time.sleep(0.005)
+    for t in threads:
+        t.join()
+    # 목록 페이지 요청은 앞서 기다리던 분석 페이지 요청들 뒤로 밀리지
+    # 않습니다
+    assert order.index('list') <= 2
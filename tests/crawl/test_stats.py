@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from seektam.crawl.stats import CrawlStats, ProgressReporter  # SUT
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_summary():
+    clock = FakeClock()
+    stats = CrawlStats(clock)
+    stats.request('list.aspx', 0.2, 200)
+    stats.request('list.aspx', cached=True)
+    stats.request('analysis.aspx', 0.4, 503, retries=2)
+    stats.failure('analysis.aspx', retries=3)
+    stats.downloaded('list.aspx', 1024)
+    stats.count('foods', 3)
+    with stats.phase('parse'):
+        clock.now += 0.5
+    stats.timed('parse', lambda: setattr(clock, 'now', clock.now + 1.5))()
+    clock.now = 110.0
+
+    summary = stats.summary()
+    assert summary['elapsed'] == 10.0
+    assert summary['totals'] == dict(requests=4, bytes=1024, retries=5,
+                                     failures=2)
+    assert summary['requests']['list.aspx']['cached'] == 1
+    assert summary['requests']['analysis.aspx']['statuses'] == {
+        '503': 1, 'error': 1}
+    assert summary['rates']['requests'] == 0.4
+    assert summary['rates']['foods'] == 0.3
+    assert summary['phases']['parse'] == dict(count=2, total=2.0, max=1.5,
+                                              mean=1.0)
+    assert summary['phases']['http']['count'] == 2
+
+    line = stats.format()
+    assert line.startswith('10s | foods 3 (0.3/s) | requests 4 (0.4/s, ')
+    assert '5 retries, 2 failed' in line
+    assert 'parse 1000ms' in line
+
+
+def test_progress_reporter():
+    stats = CrawlStats()
+    lines = []
+    written = threading.Event()
+
+    def write(line):
+        lines.append(line)
+        written.set()
+
+    with ProgressReporter(stats, write, interval=0.01):
+        assert written.wait(5)
+    count = len(lines)
+    assert count >= 1 and 'requests 0' in lines[0]
+    written.clear()
+    assert not written.wait(0.05)  # 끝나면 더 쓰지 않습니다
+
+    with ProgressReporter(stats, write, interval=0) as reporter:
+        assert reporter._thread is None
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm.session import sessionmaker
+
+from seektam.loader import (BulkLoader, mark_stale, refresh_nutrition,  # SUT
+                            REVISION)
+from seektam.model import koreafood
+from seektam.model import orm
+from seektam.model.revision import get_revision
+
+
+@pytest.fixture
+def fx_session():
+    engine = create_engine('sqlite://')
+    orm.Base.metadata.create_all(engine)
+    return sessionmaker(engine, expire_on_commit=False)()
+
+
+def _food(name, aliments, category_big=u'밥류'):
+    return koreafood.Food(
+        name=name, category_big=category_big, category_small=u'쌀밥',
+        aliments=[koreafood.Aliment(name=a, energy=1.0) for a in aliments])
+
+
+def _count_commits(session):
+    commits = []
+    event.listen(session, 'after_commit', lambda s: commits.append(s))
+    return commits
+
+
+def test_bulkloader_rejects_non_positive_batch_size(fx_session):
+    with pytest.raises(ValueError):
+        BulkLoader(fx_session, batch_size=0)
+
+
+def test_bulkloader_commits_once_per_batch(fx_session):
+    commits = _count_commits(fx_session)
+    loader = BulkLoader(fx_session, batch_size=2)
+
+    loader.add(_food(u'누룽지', [u'쌀']))
+    assert not commits
+    loader.add(_food(u'쌀밥', [u'쌀']))
+    assert len(commits) == 1
+    loader.add(_food(u'찰밥', [u'찹쌀']))
+    loader.flush()
+    assert len(commits) == 2
+    loader.flush()  # nothing buffered
+    assert len(commits) == 2
+
+    assert fx_session.query(koreafood.Food).count() == 3
+
+
+def test_bulkloader_shares_aliments_by_name(fx_session):
+    loader = BulkLoader(fx_session)
+    loader.add(_food(u'누룽지', [u'쌀', u'물']))
+    loader.add(_food(u'쌀밥', [u'쌀']))
+    loader.flush()
+    loader.add(_food(u'현미밥', [u'현미', u'물']))
+    loader.flush()
+
+    names = [a.name for a in fx_session.query(koreafood.Aliment).order_by(
+        koreafood.Aliment.id)]
+    assert names == [u'쌀', u'물', u'현미']
+    food = fx_session.query(koreafood.Food).filter_by(name=u'현미밥').one()
+    assert sorted(a.name for a in food.aliments) == [u'물', u'현미']
+
+
+def test_bulkloader_upserts_foods_by_name(fx_session):
+    loader = BulkLoader(fx_session)
+    loader.add(_food(u'누룽지', [u'쌀', u'물']))
+    loader.flush()
+    loader.add(_food(u'누룽지', [u'현미'], category_big=u'죽류'))
+    loader.flush()
+
+    food = fx_session.query(koreafood.Food).one()
+    fx_session.refresh(food)
+    assert food.category_big == u'죽류'
+    assert [a.name for a in food.aliments] == [u'현미']
+
+
+def test_bulkloader_keeps_last_duplicate_in_batch(fx_session):
+    loader = BulkLoader(fx_session)
+    loader.add(_food(u'누룽지', [u'쌀']))
+    loader.add(_food(u'누룽지', [u'물']))
+    loader.flush()
+
+    food = fx_session.query(koreafood.Food).one()
+    assert [a.name for a in food.aliments] == [u'물']
+
+
+def test_bulkloader_rolls_back_failed_batch(fx_session, monkeypatch):
+    def broken_write_rels(*args):
+        raise RuntimeError('broken')
+
+    loader = BulkLoader(fx_session)
+    monkeypatch.setattr(loader, '_write_rels', broken_write_rels)
+    loader.add(_food(u'누룽지', [u'쌀']))
+
+    with pytest.raises(RuntimeError):
+        loader.flush()
+    assert not loader.buffer
+    assert fx_session.query(koreafood.Food).count() == 0
+    assert fx_session.query(koreafood.Aliment).count() == 0
+
+
+def test_bulkloader_matches_foods_by_meal_code(fx_session):
+    loader = BulkLoader(fx_session)
+    food = _food(u'누룽지', [u'쌀'])
+    food.meal_code = u'D011010'
+    loader.add(food)
+    loader.flush()
+    renamed = _food(u'눌은밥', [u'쌀'])
+    renamed.meal_code = u'D011010'
+    loader.add(renamed)
+    loader.flush()
+
+    food = fx_session.query(koreafood.Food).one()
+    fx_session.refresh(food)
+    assert food.name == u'눌은밥'
+    assert food.stale is False
+
+
+def test_mark_stale_flags_missing_foods(fx_session):
+    loader = BulkLoader(fx_session)
+    for code, name in [(u'D1', u'누룽지'), (u'D2', u'쌀밥'), (u'D3', u'찰밥')]:
+        food = _food(name, [])
+        food.meal_code = code
+        loader.add(food)
+    loader.flush()
+
+    assert mark_stale(fx_session, set([u'D1', u'D3'])) == 1
+    assert mark_stale(fx_session, set([u'D1', u'D2'])) == 1
+
+    stale = fx_session.query(koreafood.Food.meal_code).filter_by(stale=True)
+    assert [code for code, in stale] == [u'D3']
+
+
+def test_bulkloader_bumps_revision_per_batch(fx_session):
+    loader = BulkLoader(fx_session, batch_size=2)
+    assert get_revision(fx_session, REVISION) == 0
+    for name in [u'누룽지', u'쌀밥', u'찰밥']:
+        loader.add(_food(name, [u'쌀']))
+    assert get_revision(fx_session, REVISION) == 1
+    loader.flush()
+    assert get_revision(fx_session, REVISION) == 2
+    loader.flush()  # nothing to write
+    assert get_revision(fx_session, REVISION) == 2
+
+
+def test_mark_stale_bumps_revision_only_on_change(fx_session):
+    loader = BulkLoader(fx_session)
+    food = _food(u'누룽지', [])
+    food.meal_code = u'D1'
+    loader.add(food)
+    loader.flush()
+
+    mark_stale(fx_session, set([u'D1']))
+    assert get_revision(fx_session, REVISION) == 1
+    mark_stale(fx_session, set())
+    assert get_revision(fx_session, REVISION) == 2
+
+
+def test_bulkloader_maintains_nutrition_totals(fx_session):
+    loader = BulkLoader(fx_session)
+    loader.add(_food(u'누룽지', [u'쌀', u'물']))
+    loader.add(_food(u'맹물', []))
+    loader.flush()
+
+    foods = dict((f.name, f) for f in fx_session.query(koreafood.Food))
+    assert foods[u'누룽지'].nutrient('energy') == 2.0
+    assert foods[u'누룽지'].nutrition.protein is None
+    assert foods[u'맹물'].nutrition is not None
+    assert foods[u'맹물'].nutrient('energy') is None
+
+    loader.add(_food(u'누룽지', [u'쌀']))
+    loader.flush()
+    fx_session.expire_all()
+    assert foods[u'누룽지'].nutrient('energy') == 1.0
+    assert fx_session.query(koreafood.FoodNutrition).count() == 2
+
+
+def test_food_nutrient_rejects_unknown_name(fx_session):
+    with pytest.raises(ValueError):
+        koreafood.Food(name=u'누룽지').nutrient('caffeine')
+
+
+def test_refresh_nutrition_rebuilds_all(fx_session):
+    loader = BulkLoader(fx_session)
+    loader.add(_food(u'누룽지', [u'쌀', u'물']))
+    loader.flush()
+    fx_session.query(koreafood.FoodNutrition).delete()
+
+    refresh_nutrition(fx_session)
+    nutrition = fx_session.query(koreafood.FoodNutrition).one()
+    assert nutrition.energy == 2.0
+
+
+def test_bulkloader_writes_aliment_weights(fx_session):
+    rice = koreafood.Aliment(name=u'쌀', energy=3.5, protein=0.1)
+    water = koreafood.Aliment(name=u'물', energy=0.0)
+    loader = BulkLoader(fx_session)
+    loader.add(koreafood.Food(name=u'누룽지', food_aliments=[
+        koreafood.FoodAliment(rice, 50.0),
+        koreafood.FoodAliment(water, None)]))
+    loader.flush()
+
+    food = fx_session.query(koreafood.Food).one()
+    weights = dict((r.aliment.name, r.weight) for r in food.food_aliments)
+    assert weights == {u'쌀': 50.0, u'물': None}
+    assert food.nutrient('energy') == 175.0
+    assert food.nutrient('protein') == 5.0
+
+
+def test_bulkloader_corrects_existing_aliments(fx_session):
+    loader = BulkLoader(fx_session)
+    # 예전 파서가 열을 밀려 읽어 저장한 값
+    loader.add(_food(u'누룽지', [u'쌀']))
+    loader.flush()
+    nurungji = fx_session.query(koreafood.Food).one()
+    assert nurungji.nutrient('energy') == 1.0
+
+    loader.add(koreafood.Food(name=u'쌀밥', aliments=[
+        koreafood.Aliment(name=u'쌀', energy=3.5, protein=0.1)]))
+    loader.flush()
+    fx_session.expire_all()
+    rice = fx_session.query(koreafood.Aliment).one()
+    assert (rice.energy, rice.protein) == (3.5, 0.1)
+    # 같은 재료를 쓰는 다른 음식의 합계도 고칩니다
+    assert nurungji.nutrient('energy') == 3.5
+    assert nurungji.nutrient('protein') == 0.1
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import numpy
+import pytest
+
+from seektam.mealplan import MealPlanner, Targets, parse_required  # SUT
+from seektam.model.koreafood import NUTRIENTS
+from seektam.similarity import SimilarityMatrix
+
+CATEGORIES = [u'밥류', u'국류', u'김치류', u'나물류', u'구이류', u'조림류']
+
+
+def _matrix(n=600, seed=0):
+    rng = numpy.random.RandomState(seed)
+    raw = numpy.zeros((n, len(NUTRIENTS)), dtype=numpy.float32)
+    raw[:, NUTRIENTS.index('energy')] = rng.uniform(50, 800, n)
+    raw[:, NUTRIENTS.index('protein')] = rng.uniform(1, 40, n)
+    raw[:, NUTRIENTS.index('sodium')] = rng.uniform(10, 1500, n)
+    raw[0, NUTRIENTS.index('energy')] = 0  # 영양 정보가 없는 음식
+    return SimilarityMatrix(
+        numpy.arange(1, n + 1, dtype=numpy.int64), raw,
+        rng.randint(0, len(CATEGORIES), n).astype(numpy.int32),
+        numpy.full(n, -1, dtype=numpy.int32),
+        dict(category_big=CATEGORIES, category_small=[]))
+
+
+def _categories(matrix, day):
+    return [CATEGORIES[c] for c in matrix.category_big[matrix.rows(day)]]
+
+
+def test_parse_required():
+    assert parse_required([u'밥류', u'반찬류:2', u'a:b:3']) == [
+        (u'밥류', 1), (u'반찬류', 2), (u'a:b', 3)]
+    with pytest.raises(ValueError):
+        parse_required([u'밥류:x'])
+
+
+def test_day_meets_targets_and_structure():
+    matrix = _matrix()
+    targets = Targets(1800, 2400, 55, 2000)
+    planner = MealPlanner(matrix, targets, size=5,
+                          required=[(u'밥류', 1), (u'국류', 1)])
+    day = planner.day()
+    assert len(day) == 5 and 1 not in day
+    categories = _categories(matrix, day)
+    assert categories[:2] == [u'밥류', u'국류']
+    assert len(set(categories)) == 5  # 한 분류에서 하나씩
+    totals = planner.totals(day)
+    assert 1800 <= totals['energy'] <= 2400
+    assert totals['protein'] >= 55
+    assert totals['sodium'] <= 2000
+
+
+def test_required_count_raises_category_limit():
+    matrix = _matrix()
+    planner = MealPlanner(matrix, size=4, required=[(u'나물류', 2)])
+    categories = _categories(matrix, planner.day())
+    assert categories.count(u'나물류') == 2
+    assert len(set(categories)) == 3
+
+
+def test_week_plan_does_not_repeat_and_is_fast():
+    matrix = _matrix(3000)
+    planner = MealPlanner(matrix, required=[(u'밥류', 1), (u'국류', 1)])
+    started = time.time()
+    plan = planner.plan(days=7)
+    assert time.time() - started < 5  # 한 코어에서 보통 0.1초 안쪽
+    assert len(plan) == 7
+    ids = [id_ for day in plan for id_ in day]
+    assert len(ids) == len(set(ids)) == 7 * 6
+    for day in plan:
+        assert planner.penalty(numpy.array(
+            [[planner.totals(day)[k] for k in 'energy', 'protein',
+              'sodium']]))[0] < 0.01
+
+
+def test_invalid_plans():
+    matrix = _matrix(20)
+    with pytest.raises(ValueError):
+        MealPlanner(matrix, required=[(u'없는류', 1)])
+    with pytest.raises(ValueError):
+        MealPlanner(matrix, size=1, required=[(u'밥류', 2)])
+    with pytest.raises(ValueError):
+        # 분류마다 하나씩이면 여섯 개까지만 고를 수 있습니다
+        MealPlanner(matrix, size=7).day()
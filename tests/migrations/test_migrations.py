@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+import pytest
+from sqlalchemy import create_engine
+
+from seektam.cli import migrate
+from seektam.migrations import get_config, stamp, upgrade  # SUT
+from seektam.model import koreafood, revision  # noqa
+from seektam.model import orm
+
+
+@pytest.fixture
+def fx_url(tmpdir):
+    return 'sqlite:///' + tmpdir.join('migrations.db').strpath
+
+
+@pytest.fixture(params=['migrations', 'create_all'])
+def fx_engine(request, fx_url):
+    if request.param == 'migrations':
+        upgrade(fx_url)
+        return create_engine(fx_url)
+    engine = create_engine(fx_url)
+    orm.Base.metadata.create_all(engine)
+    return engine
+
+
+def test_migrations_match_models(fx_url):
+    upgrade(fx_url)
+    with create_engine(fx_url).connect() as connection:
+        context = MigrationContext.configure(connection)
+        assert compare_metadata(context, orm.Base.metadata) == []
+
+
+def test_migrations_downgrade_to_base(fx_url):
+    upgrade(fx_url)
+    command.downgrade(get_config(fx_url), 'base')
+    assert create_engine(fx_url).table_names() == ['alembic_version']
+
+
+def test_stamp_marks_create_all_database(fx_url):
+    engine = create_engine(fx_url)
+    orm.Base.metadata.create_all(engine)
+    stamp(fx_url)
+    upgrade(fx_url)  # nothing to run
+    with engine.connect() as connection:
+        context = MigrationContext.configure(connection)
+        current = context.get_current_revision()
+    head = ScriptDirectory.from_config(get_config(fx_url)).get_current_head()
+    assert current == head
+
+
+def test_migrate_command(fx_cli_runner, fx_url):
+    res = fx_cli_runner.invoke(migrate, [fx_url])
+    assert res.exit_code == 0
+    assert 'koreafood_food_nutrition' in create_engine(fx_url).table_names()
+
+
+def _plan(engine, sql, *params):
+    rows = engine.execute('EXPLAIN QUERY PLAN ' + sql, *params).fetchall()
+    return ' | '.join(row[-1] for row in rows)
+
+
+@pytest.mark.parametrize('sql, params, index', [
+    ('SELECT id FROM koreafood_foods WHERE category_big = ?',
+     (u'밥류',), 'ix_koreafood_foods_category'),
+    ('SELECT id FROM koreafood_foods '
+     'WHERE category_big = ? AND category_small = ?',
+     (u'밥류', u'쌀밥'), 'ix_koreafood_foods_category'),
+    ('SELECT food_id FROM koreafood_food_aliment_rels WHERE aliment_id = ?',
+     (1,), 'ix_koreafood_food_aliment_rels_aliment'),
+    ('SELECT food_id FROM koreafood_food_nutrition '
+     'WHERE energy BETWEEN ? AND ?',
+     (100.0, 200.0), 'ix_koreafood_food_nutrition_energy'),
+    ('SELECT food_id FROM koreafood_food_nutrition WHERE sodium < ?',
+     (500.0,), 'ix_koreafood_food_nutrition_sodium'),
+    ('SELECT food_id FROM koreafood_food_nutrition WHERE protein > ?',
+     (20.0,), 'ix_koreafood_food_nutrition_protein'),
+])
+def test_query_plan_uses_index(fx_engine, sql, params, index):
+    plan = _plan(fx_engine, sql, *params)
+    assert plan.startswith('SEARCH')
+    assert index in plan
+
+
+def test_query_plan_foods_containing_aliment(fx_engine):
+    plan = _plan(fx_engine, '''
+        SELECT f.id, f.name FROM koreafood_foods AS f
+        JOIN koreafood_food_aliment_rels AS r ON r.food_id = f.id
+        JOIN koreafood_aliments AS a ON a.id = r.aliment_id
+        WHERE a.name = ?''', u'쌀')
+    assert 'ix_koreafood_food_aliment_rels_aliment' in plan
+    assert 'SCAN' not in plan
@@ -105,3 +105,39 @@ def test_koreafood_aliment_relationship_add_multiple(mockdb):
     assert newf.id == f.id
     assert len(newf.aliments) == 1
     assert newf.aliments[0].id == a.id
+
+
+def test_koreafood_food_aliment_keeps_weight(mockdb):
+    a = koreafood.Aliment(name='aliment_1', id=1001)
+    f = _mockdb_add_model(
+        mockdb, koreafood.Food, id=2001, name='food_1',
+        food_aliments=[koreafood.FoodAliment(a, weight=12.5)])
+
+    newsess = mockdb._Session()
+    newf = newsess.query(koreafood.Food).filter_by(id=f.id).one()
+    assert [(r.aliment.name, r.weight) for r in newf.food_aliments] == [
+        ('aliment_1', 12.5)]
+    assert newf.aliments[0].id == 1001
+
+
+def test_koreafood_food_delete_cascades_to_weights(mockdb):
+    a = koreafood.Aliment(name='aliment_1', id=1001)
+    _mockdb_add_model(
+        mockdb, koreafood.Food, id=2001, name='food_1',
+        food_aliments=[koreafood.FoodAliment(a, weight=12.5)])
+
+    newsess = mockdb._Session()
+    newsess.delete(newsess.query(koreafood.Food).get(2001))
+    newsess.commit()
+    assert newsess.query(koreafood.FoodAliment).count() == 0
+    assert newsess.query(koreafood.Aliment).count() == 1
+
+
+def test_koreafood_food_aliment_not_cascaded_from_aliment(mockdb):
+    _mockdb_add_model(mockdb, koreafood.Aliment, id=1001, name='aliment_1')
+    sess = mockdb._Session()
+    a = sess.query(koreafood.Aliment).get(1001)
+    food_aliment = koreafood.FoodAliment(a, weight=1.0)
+    # 음식에 붙기 전에 autoflush되면 음식 ID 없이 INSERT됩니다
+    assert food_aliment not in sess
+    assert sess.query(koreafood.FoodAliment).count() == 0
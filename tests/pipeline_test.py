@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+
+import pytest
+
+from seektam.pipeline import Pipeline, Stage  # SUT
+
+
+def _jitter(value):
+    time.sleep(random.random() * 0.005)
+    return value
+
+
+def test_pipeline_keeps_source_order():
+    pipeline = Pipeline([
+        Stage('double', lambda n: _jitter(n * 2), workers=4),
+        Stage('inc', lambda n: _jitter(n + 1), workers=3),
+    ], queue_size=5)
+
+    assert list(pipeline.run(range(50))) == [n * 2 + 1 for n in range(50)]
+
+
+def test_pipeline_without_stages():
+    assert list(Pipeline([]).run('abc')) == ['a', 'b', 'c']
+
+
+def test_pipeline_empty_source():
+    assert list(Pipeline([Stage('id', lambda x: x, 2)]).run([])) == []
+
+
+def test_pipeline_raises_error_in_order():
+    def fail_on_five(n):
+        if n == 5:
+            raise IOError('boom')
+        return _jitter(n)
+
+    results = []
+    with pytest.raises(IOError):
+        for n in Pipeline([Stage('f', fail_on_five, 4)]).run(range(20)):
+            results.append(n)
+    assert results == range(5)
+
+
+def test_pipeline_raises_source_error_last():
+    def source():
+        yield 1
+        yield 2
+        raise ValueError('broken list')
+
+    results = []
+    with pytest.raises(ValueError):
+        for n in Pipeline([Stage('id', _jitter, 2)]).run(source()):
+            results.append(n)
+    assert results == [1, 2]
+
+
+def test_pipeline_applies_backpressure():
+    lock = threading.Lock()
+    produced = [0]
+    consumed = [0]
+    peak = [0]
+
+    def source():
+        for n in range(200):
+            with lock:
+                produced[0] += 1
+                peak[0] = max(peak[0], produced[0] - consumed[0])
+            yield n
+
+    pipeline = Pipeline([Stage('a', _jitter, 2), Stage('b', _jitter, 2)],
+                        queue_size=3)
+    for _ in pipeline.run(source()):
+        time.sleep(0.001)  # slow consumer
+        with lock:
+            consumed[0] += 1
+    # one item in the consumer's hands, one read ahead waiting for a slot
+    assert peak[0] <= pipeline.window + 2
+
+
+def test_pipeline_close_stops_threads():
+    before = threading.active_count()
+    results = Pipeline([Stage('id', _jitter, 3)], queue_size=2).run(
+        iter(range(1000)))
+    assert next(results) == 0
+    results.close()
+    assert threading.active_count() == before
+
+
+def test_stage_requires_workers():
+    with pytest.raises(ValueError):
+        Stage('none', lambda x: x, workers=0)
+    with pytest.raises(ValueError):
+        Pipeline([], queue_size=0)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import array
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm.session import sessionmaker
+
+from seektam.loader import BulkLoader
+from seektam.model import koreafood
+from seektam.model import orm
+from seektam.search import (NameIndex, SearchIndex, difference, intersect,
+                            ngrams, union)  # SUT
+
+
+def _ids(*values):
+    return array.array('i', values)
+
+
+FOODS = [(1, u'두부조림'), (2, u'파전'), (3, u'두부김치'), (4, u'된장찌개'),
+         (5, u'순두부찌개')]
+ALIMENTS = [(10, u'두부,일반두부'), (11, u'파,대파'), (12, u'돼지고기,삼겹살'),
+            (13, u'양파'), (14, u'된장'), (15, u'김치,배추김치')]
+RELS = [(1, 10), (1, 11), (2, 11), (2, 13), (3, 10), (3, 11), (3, 12),
+        (3, 15), (4, 10), (4, 14), (4, 11), (5, 10), (5, 12)]
+
+
+def test_sorted_set_operations():
+    assert intersect(_ids(1, 3, 5, 7), _ids(3, 4, 5)) == _ids(3, 5)
+    assert intersect(_ids(), _ids(1)) == _ids()
+    assert difference(_ids(1, 3, 5, 7), _ids(3, 4, 5)) == _ids(1, 7)
+    assert union([_ids(1, 5), _ids(2, 5, 9)]) == _ids(1, 2, 5, 9)
+
+
+def test_ngrams_use_hangul_syllables():
+    assert ngrams(u'순두부') == set([u'순두', u'두부'])
+    assert ngrams(u'된 장', 1) == set([u'된', u'장'])
+
+
+def test_name_index():
+    index = NameIndex(FOODS)
+    assert index.prefix(u'두부') == _ids(1, 3)
+    assert index.prefix(u'') == _ids(1, 2, 3, 4, 5)
+    assert index.contains(u'두부') == _ids(1, 3, 5)
+    assert index.contains(u'찌개') == _ids(4, 5)
+    assert index.contains(u'전') == _ids(2)
+    assert index.contains(u'두부찌개') == _ids(5)
+    assert index.contains(u'부김치') == _ids(3)
+    assert index.contains(u'불고기') == _ids()
+    assert index.exact(u'파전') == _ids(2)
+
+
+def test_foods_by_aliments():
+    index = SearchIndex(FOODS, ALIMENTS, RELS)
+    assert index.foods(with_aliments=[u'두부', u'파'],
+                       without=[u'돼지고기']) == _ids(1, 4)
+    # "파" 는 "양파" 가 아니라 "파,대파" 입니다
+    assert index.foods(with_aliments=[u'파']) == _ids(1, 2, 3, 4)
+    assert index.foods(with_aliments=[u'양파']) == _ids(2)
+    # 같은 조각이 없으면 앞부분이 같은 재료
+    assert index.foods(with_aliments=[u'배추']) == _ids(3)
+    assert index.foods(with_aliments=[u'없는재료']) == _ids()
+    assert index.foods(name=u'찌개', without=[u'돼지고기']) == _ids(4)
+    assert index.foods(name=u'두부', prefix=True) == _ids(1, 3)
+    assert index.foods() == _ids(1, 2, 3, 4, 5)
+
+
+def test_aliments_by_name():
+    index = SearchIndex(FOODS, ALIMENTS, RELS)
+    assert index.aliments(u'파') == _ids(11, 13)
+    assert index.aliments(u'파', prefix=True) == _ids(11)
+
+
+def test_build_save_load(tmpdir):
+    engine = create_engine('sqlite://')
+    orm.Base.metadata.create_all(engine)
+    session = sessionmaker(engine, expire_on_commit=False)()
+    loader = BulkLoader(session)
+    tofu = koreafood.Aliment(name=u'두부,일반두부')
+    pork = koreafood.Aliment(name=u'돼지고기,삼겹살')
+    loader.add(koreafood.Food(name=u'두부조림', meal_code=u'D0',
+                              food_aliments=[koreafood.FoodAliment(tofu)]))
+    loader.add(koreafood.Food(
+        name=u'두부김치', meal_code=u'D1',
+        food_aliments=[koreafood.FoodAliment(tofu),
+                       koreafood.FoodAliment(pork)]))
+    loader.add(koreafood.Food(name=u'순두부', meal_code=u'D2', stale=True,
+                              food_aliments=[koreafood.FoodAliment(tofu)]))
+    loader.flush()
+    index = SearchIndex.build(session)
+    assert index.revision == 1
+    ids = dict((name, id_) for id_, name in index.food_names.names.items())
+    assert sorted(ids) == [u'두부김치', u'두부조림']  # stale 은 뺍니다
+    path = tmpdir.join('search.idx').strpath
+    index.save(path)
+    loaded = SearchIndex.load(path)
+    assert loaded.revision == 1
+    assert list(loaded.foods(with_aliments=[u'두부'],
+                             without=[u'돼지고기'])) == [ids[u'두부조림']]
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm.session import sessionmaker
+
+from seektam.loader import BulkLoader
+from seektam.model import koreafood
+from seektam.model import orm
+from seektam.similarity import SimilarityMatrix  # SUT
+
+
+def _matrix(rows, categories=None):
+    raw = numpy.zeros((len(rows), len(koreafood.NUTRIENTS)),
+                      dtype=numpy.float32)
+    for n, (_, energy, sodium, protein) in enumerate(rows):
+        raw[n, koreafood.NUTRIENTS.index('energy')] = energy
+        raw[n, koreafood.NUTRIENTS.index('sodium')] = sodium
+        raw[n, koreafood.NUTRIENTS.index('protein')] = protein
+    big = numpy.array(categories or [0] * len(rows), dtype=numpy.int32)
+    return SimilarityMatrix(
+        numpy.array([r[0] for r in rows], dtype=numpy.int64), raw, big,
+        numpy.full(len(rows), -1, dtype=numpy.int32),
+        dict(category_big=[u'밥류', u'국류'], category_small=[]))
+
+
+ROWS = [(1, 100, 10, 5), (2, 200, 20, 10), (3, 100, 500, 1),
+        (5, 110, 12, 5), (8, 900, 900, 90)]
+
+
+def test_cosine_top_k():
+    matrix = _matrix(ROWS)
+    similar, = matrix.similar([1], k=2)
+    assert [id_ for id_, _ in similar] == [2, 5]
+    assert similar[0][1] == pytest.approx(1.0)
+
+
+def test_euclidean_prefers_same_scale():
+    matrix = _matrix(ROWS)
+    similar, = matrix.similar([1], k=2, metric='euclidean')
+    assert [id_ for id_, _ in similar] == [5, 2]
+    assert similar[0][1] > similar[1][1]
+
+
+def test_batched_queries_match_single():
+    matrix = _matrix(ROWS)
+    batch = matrix.similar([1, 2, 3, 5, 8], k=3)
+    for food_id, result in zip([1, 2, 3, 5, 8], batch):
+        assert matrix.similar([food_id], k=3) == [result]
+
+
+def test_conditions():
+    matrix = _matrix(ROWS, categories=[0, 1, 0, 0, 0])
+    similar, = matrix.similar([1], k=10, max_sodium=100)
+    assert sorted(id_ for id_, _ in similar) == [2, 5]
+    similar, = matrix.similar([1], k=10, category_big=u'밥류',
+                              max_energy=500)
+    assert sorted(id_ for id_, _ in similar) == [3, 5]
+    assert matrix.similar([1], category_big=u'없는분류') == [[]]
+
+
+def test_unknown_food_and_metric():
+    matrix = _matrix(ROWS)
+    with pytest.raises(KeyError):
+        matrix.similar([4])
+    with pytest.raises(ValueError):
+        matrix.similar([1], metric='manhattan')
+
+
+def test_build_save_load_mmap(tmpdir):
+    engine = create_engine('sqlite://')
+    orm.Base.metadata.create_all(engine)
+    session = sessionmaker(engine, expire_on_commit=False)()
+    loader = BulkLoader(session)
+    for n, energy in enumerate([100.0, 200.0, 400.0]):
+        loader.add(koreafood.Food(
+            name=u'음식%d' % n, category_big=u'밥류', meal_code=u'D%d' % n,
+            aliments=[koreafood.Aliment(name=u'재료%d' % n, energy=energy,
+                                        protein=energy / (n + 1))]))
+    loader.flush()
+
+    matrix = SimilarityMatrix.build(session)
+    assert len(matrix) == 3
+    assert matrix.revision == 1
+    assert matrix.categories['category_big'] == [u'밥류']
+    path = tmpdir.join('similarity').strpath
+    matrix.save(path)
+    first = os.readlink(path)
+    matrix.save(path)  # 이미 있으면 링크를 바꿔 겁니다
+    assert os.readlink(path) != first
+    assert sorted(f.basename for f in tmpdir.listdir()) == \
+        sorted(['similarity', os.readlink(path)])
+    loaded = SimilarityMatrix.load(path)
+    assert isinstance(loaded.unit, numpy.memmap)
+    assert loaded.revision == 1
+    assert loaded.similar(list(matrix.ids), k=2) == \
+        matrix.similar(list(matrix.ids), k=2)
+
+
+def test_save_replaces_directory(tmpdir):
+    path = tmpdir.mkdir('similarity')
+    path.join('meta.json').write('{}')
+    _matrix(ROWS).save(path.strpath)
+    assert path.islink()
+    assert SimilarityMatrix.load(path.strpath).ids.tolist() == [1, 2, 3, 5, 8]
+    assert len(tmpdir.listdir()) == 2
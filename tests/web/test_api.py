@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm.session import sessionmaker
+
+from seektam.loader import BulkLoader
+from seektam.model import koreafood
+from seektam.model import orm
+from seektam.search import SearchIndex
+from seektam.similarity import SimilarityMatrix
+from seektam.web.api import search_index, similarity_matrix
+from seektam.web.app import app  # SUT
+from seektam.web.db import get_engine
+
+
+@pytest.fixture
+def fx_api(tmpdir, monkeypatch):
+    url = 'sqlite:///' + tmpdir.join('api.db').strpath
+    monkeypatch.setitem(app.config, 'DATABASE_URL', url)
+    monkeypatch.setitem(app.config, 'TESTING', True)
+    monkeypatch.setattr(app, 'extensions', {})
+    engine = create_engine(url)
+    orm.Base.metadata.create_all(engine)
+    session = sessionmaker(engine, expire_on_commit=False)()
+    loader = BulkLoader(session)
+    for n, (big, small) in enumerate([(u'밥류', u'쌀밥'), (u'밥류', u'쌀밥'),
+                                      (u'밥류', u'잡곡밥'), (u'국류', u'맑은국'),
+                                      (u'국류', u'맑은국')]):
+        loader.add(koreafood.Food(
+            name=u'음식%d' % n, category_big=big, category_small=small,
+            meal_code=u'D%d' % n,
+            food_aliments=[
+                koreafood.FoodAliment(
+                    koreafood.Aliment(name=u'쌀', energy=3.5), 2.0),
+                koreafood.FoodAliment(
+                    koreafood.Aliment(name=u'재료%d' % n, energy=1.0))]))
+    loader.flush()
+    return app.test_client(), session
+
+
+def _json(response):
+    return json.loads(response.data)
+
+
+def test_foods_keyset_pagination(fx_api):
+    client, _ = fx_api
+    first = _json(client.get('/foods?limit=2'))
+    assert [f['name'] for f in first['foods']] == [u'음식0', u'음식1']
+    assert sorted(first['foods'][0]['aliments'][0]) == [
+        'id', 'name', 'weight']
+
+    names = [f['name'] for f in first['foods']]
+    after = first['next']
+    while after is not None:
+        page = _json(client.get('/foods?limit=2&after=%d' % after))
+        names.extend(f['name'] for f in page['foods'])
+        after = page['next']
+    assert names == [u'음식%d' % n for n in range(5)]
+
+
+def test_foods_filters_by_category(fx_api):
+    client, _ = fx_api
+    res = _json(client.get(u'/foods?category_big=국류'))
+    assert [f['meal_code'] for f in res['foods']] == [u'D3', u'D4']
+    assert res['next'] is None
+
+
+def test_foods_loads_aliments_eagerly(fx_api):
+    client, _ = fx_api
+    engine = get_engine(app)
+    statements = []
+    listen = lambda *args: statements.append(args[2])  # noqa
+    event.listen(engine, 'before_cursor_execute', listen)
+    try:
+        response = client.get('/foods?limit=5')
+    finally:
+        event.remove(engine, 'before_cursor_execute', listen)
+    assert len(_json(response)['foods']) == 5
+    assert len(statements) == 3  # revision, foods, aliments
+
+
+def test_food_detail(fx_api):
+    client, _ = fx_api
+    foods = _json(client.get('/foods'))['foods']
+    food = _json(client.get('/foods/%d' % foods[0]['id']))
+    assert food['name'] == u'음식0'
+    rice = [a for a in food['aliments'] if a['name'] == u'쌀'][0]
+    assert rice['nutrients']['energy'] == 3.5
+    assert rice['weight'] == 2.0
+    assert food['nutrition']['energy'] == 8.0
+    assert food['nutrition'] == foods[0]['nutrition']
+
+    aliment = _json(client.get('/aliments/%d' % rice['id']))
+    assert dict(aliment, weight=2.0) == rice
+
+
+def test_not_found(fx_api):
+    client, _ = fx_api
+    for url in '/foods/999', '/aliments/999':
+        response = client.get(url)
+        assert response.status_code == 404
+        assert _json(response) == dict(error='not found')
+
+
+def test_categories(fx_api):
+    client, _ = fx_api
+    res = _json(client.get('/categories'))
+    assert res['categories'] == [
+        dict(name=u'국류', count=2,
+             subcategories=[dict(name=u'맑은국', count=2)]),
+        dict(name=u'밥류', count=3,
+             subcategories=[dict(name=u'쌀밥', count=2),
+                            dict(name=u'잡곡밥', count=1)]),
+    ]
+
+
+def test_etag_and_cache_control(fx_api):
+    client, _ = fx_api
+    response = client.get('/categories')
+    etag = response.headers['ETag']
+    assert 'max-age=60' in response.headers['Cache-Control']
+    assert 'public' in response.headers['Cache-Control']
+
+    response = client.get('/categories', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_cache_invalidated_by_loader(fx_api):
+    client, session = fx_api
+    first = client.get('/categories')
+    assert client.get('/categories').data == first.data
+
+    loader = BulkLoader(session)
+    loader.add(koreafood.Food(name=u'새 음식', category_big=u'떡류',
+                              category_small=u'찐떡', aliments=[]))
+    loader.flush()
+
+    second = client.get('/categories', headers={
+        'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert u'떡류' in [c['name'] for c in _json(second)['categories']]
+
+
+def test_search_by_aliments(fx_api):
+    client, _ = fx_api
+    res = _json(client.get(u'/search?with=쌀&without=재료1&without=재료3'))
+    assert [f['name'] for f in res['foods']] == [
+        u'음식0', u'음식2', u'음식4']
+    assert res['total'] == 3
+    res = _json(client.get(u'/search?with=쌀&with=재료2'))
+    assert [f['name'] for f in res['foods']] == [u'음식2']
+
+
+def test_search_by_name_pages(fx_api):
+    client, _ = fx_api
+    first = _json(client.get(u'/search?q=음식&prefix=1&limit=3'))
+    assert [f['name'] for f in first['foods']] == [
+        u'음식0', u'음식1', u'음식2']
+    assert first['total'] == 5
+    rest = _json(client.get(
+        u'/search?q=음식&prefix=1&limit=3&after=%d' % first['next']))
+    assert [f['name'] for f in rest['foods']] == [u'음식3', u'음식4']
+    assert rest['next'] is None
+    assert _json(client.get(u'/search?q=식4'))['total'] == 1
+
+
+def test_search_aliments(fx_api):
+    client, _ = fx_api
+    res = _json(client.get(u'/search/aliments?q=재료&prefix=1'))
+    assert sorted(a['name'] for a in res['aliments']) == [
+        u'재료%d' % n for n in range(5)]
+    assert _json(client.get(u'/search/aliments'))['aliments'] == []
+
+
+def test_search_index_follows_revision(fx_api, tmpdir, monkeypatch):
+    client, session = fx_api
+    with app.app_context():
+        first = search_index(app)
+        assert search_index(app) is first
+
+    loader = BulkLoader(session)
+    loader.add(koreafood.Food(name=u'새 음식', aliments=[]))
+    loader.flush()
+    res = _json(client.get(u'/search?q=새'))
+    assert [f['name'] for f in res['foods']] == [u'새 음식']
+
+    # 로더가 저장한 색인이 같은 번호이면 DB에서 다시 만들지 않습니다
+    path = tmpdir.join('search.idx').strpath
+    saved = SearchIndex.build(session)
+    saved.save(path)
+    monkeypatch.setitem(app.config, 'SEARCH_INDEX_PATH', path)
+    monkeypatch.setattr(SearchIndex, 'build', None)
+    app.extensions.pop('seektam.search_index')
+    with app.app_context():
+        index = search_index(app)
+    assert index.revision == saved.revision
+    assert index.food_names.names == saved.food_names.names
+
+
+def test_similar_foods(fx_api, tmpdir):
+    client, session = fx_api
+    app.config['SIMILARITY_PATH'] = tmpdir.join('similarity').strpath
+    try:
+        res = _json(client.get('/foods/1/similar?k=2'))
+        assert len(res['foods']) == 2
+        assert all(f['name'].startswith(u'음식') for f in res['foods'])
+        assert 1 not in [f['id'] for f in res['foods']]
+        # 저장은 로더만 합니다
+        assert not tmpdir.join('similarity').check()
+
+        res = _json(client.get(
+            u'/foods/1/similar?metric=euclidean&category_big=국류'))
+        assert sorted(f['id'] for f in res['foods']) == [4, 5]
+        assert client.get('/foods/99/similar').status_code == 404
+    finally:
+        app.config['SIMILARITY_PATH'] = None
+
+
+def test_similar_foods_unknown_metric(fx_api):
+    client, _ = fx_api
+    res = client.get('/foods/1/similar?metric=manhattan')
+    assert res.status_code == 400
+    assert 'manhattan' in _json(res)['error']
+
+
+def test_similarity_matrix_reads_saved_matrix(fx_api, monkeypatch, tmpdir):
+    _, session = fx_api
+    path = tmpdir.join('similarity').strpath
+    saved = SimilarityMatrix.build(session)
+    saved.save(path)
+    target = tmpdir.join('similarity').realpath()
+    monkeypatch.setitem(app.config, 'SIMILARITY_PATH', path)
+    with app.app_context():
+        matrix = similarity_matrix(app)
+    assert matrix.revision == saved.revision
+    assert matrix.ids.tolist() == saved.ids.tolist()
+
+    # 번호가 다르면 메모리에 만들고 로더가 저장한 것은 건드리지 않습니다
+    loader = BulkLoader(session)
+    loader.add(koreafood.Food(name=u'새 음식', aliments=[]))
+    loader.flush()
+    with app.app_context():
+        matrix = similarity_matrix(app)
+    assert matrix.revision == saved.revision + 1
+    assert tmpdir.join('similarity').realpath() == target
+    assert SimilarityMatrix.load(path).revision == saved.revision
+
+
+def test_mealplan(fx_api):
+    client, _ = fx_api
+    res = _json(client.get(
+        u'/mealplan?days=2&size=2&require=밥류&require=국류'
+        u'&energy_min=10&energy_max=20&protein_min=0'))
+    assert res['targets']['energy_max'] == 20
+    assert len(res['days']) == 2
+    for day in res['days']:
+        assert [f['category_big'] for f in day['foods']] == [u'밥류', u'국류']
+        assert day['totals']['energy'] == 16
+    ids = [f['id'] for day in res['days'] for f in day['foods']]
+    assert len(set(ids)) == 4
+
+
+def test_mealplan_bad_request(fx_api):
+    client, _ = fx_api
+    res = client.get(u'/mealplan?require=없는류')
+    assert res.status_code == 400
+    assert u'없는류' in _json(res)['error']
+    assert client.get(u'/mealplan?require=밥류:x').status_code == 400
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from seektam.web.cache import ResponseCache  # SUT
+
+
+def test_response_cache_keys_by_revision():
+    cache = ResponseCache()
+    cache.put(1, '/foods?', 'old')
+    assert cache.get(1, '/foods?') == 'old'
+    assert cache.get(2, '/foods?') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.put(1, 'a', 'A')
+    cache.put(1, 'b', 'B')
+    cache.get(1, 'a')
+    cache.put(1, 'c', 'C')
+    assert len(cache) == 2
+    assert cache.get(1, 'b') is None
+    assert cache.get(1, 'a') == 'A'
+
+
+def test_response_cache_requires_positive_size():
+    with pytest.raises(ValueError):
+        ResponseCache(max_entries=0)
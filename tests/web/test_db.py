@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.sqlite.pysqlite import SQLiteDialect_pysqlite
+from sqlalchemy.pool import QueuePool
+
+from seektam.config import load_config
+from seektam.model import koreafood
+from seektam.model import orm
+from seektam.web.app import app
+from seektam.web.db import (Database, get_database, get_session,  # SUT
+                            reset_database)
+
+
+def _url(tmpdir, name, foods=()):
+    url = 'sqlite:///' + tmpdir.join(name).strpath
+    engine = create_engine(url)
+    orm.Base.metadata.create_all(engine)
+    for food in foods:
+        engine.execute(koreafood.Food.__table__.insert(), name=food)
+    return url
+
+
+@pytest.fixture
+def fx_config(tmpdir, monkeypatch):
+    monkeypatch.setattr(app, 'extensions', {})
+    config = dict(app.config)
+    config['DATABASE_URL'] = _url(tmpdir, 'primary.db', [u'주'])
+    return config
+
+
+def _names(session):
+    return [name for name, in session.query(koreafood.Food.name)]
+
+
+def test_replica_routing(fx_config, tmpdir):
+    fx_config['DATABASE_REPLICA_URLS'] = [
+        _url(tmpdir, 'replica0.db', [u'복제0']),
+        _url(tmpdir, 'replica1.db', [u'복제1'])]
+    database = Database(fx_config)
+    session = database.session()
+    assert [_names(session) for _ in range(3)] == [
+        [u'복제0'], [u'복제1'], [u'복제0']]
+
+    session.add(koreafood.Food(name=u'새 음식'))
+    session.flush()  # 쓰기는 주 DB로
+    session.commit()
+    assert sorted(_names(database.session().use_primary())) == [
+        u'새 음식', u'주']
+    metrics = database.pool_metrics()
+    assert sorted(metrics) == ['primary', 'replica0', 'replica1']
+    # 한 트랜잭션 안에서는 복제 DB마다 연결 하나를 계속 씁니다
+    assert metrics['replica0']['checkouts'] == 1
+    assert metrics['replica1']['checkouts'] == 1
+    assert metrics['primary']['checkouts'] == 2
+
+
+def test_replica_policy(fx_config, tmpdir):
+    fx_config['DATABASE_REPLICA_URLS'] = [
+        _url(tmpdir, 'replica0.db', [u'복제0'])]
+    fx_config['DATABASE_REPLICA_POLICY'] = 'primary'
+    database = Database(fx_config)
+    assert database.replicas == []
+    assert _names(database.session()) == [u'주']
+    fx_config['DATABASE_REPLICA_POLICY'] = 'nearest'
+    with pytest.raises(ValueError):
+        Database(fx_config)
+
+
+def test_session_scoped_to_app_context(fx_config, monkeypatch):
+    monkeypatch.setitem(app.config, 'DATABASE_URL',
+                        fx_config['DATABASE_URL'])
+    with app.app_context():
+        session = get_session()
+        assert get_session() is session
+        assert _names(session) == [u'주']
+    with app.app_context():
+        assert get_session() is not session
+
+
+def test_queue_pool_options_and_wait_metrics(fx_config, monkeypatch):
+    monkeypatch.setattr(SQLiteDialect_pysqlite, 'get_pool_class',
+                        classmethod(lambda cls, url: QueuePool))
+    fx_config['DATABASE_URL'] += '?check_same_thread=false'
+    fx_config.update(DATABASE_POOL_SIZE=1, DATABASE_MAX_OVERFLOW=0,
+                     DATABASE_POOL_TIMEOUT=5, DATABASE_POOL_PRE_PING=True)
+    database = Database(fx_config)
+    pool = database.engine.pool
+    assert isinstance(pool, QueuePool)
+    assert pool.size() == 1 and pool._max_overflow == 0
+    assert pool._pre_ping
+
+    held = database.engine.connect()
+    waited = []
+
+    def borrow():
+        connection = database.engine.connect()
+        waited.append(True)
+        connection.close()
+
+    thread = threading.Thread(target=borrow)
+    thread.start()
+    time.sleep(0.2)
+    assert not waited
+    assert database.pool_metrics()['primary']['checked_out'] == 1
+    held.close()
+    thread.join()
+    metrics = database.pool_metrics()['primary']
+    assert metrics['waits'] == 2
+    assert metrics['wait_max'] >= 0.15
+    assert metrics['peak_checked_out'] == 1
+    assert metrics['checked_out'] == 0
+    assert metrics['size'] == 1
+
+    database.dispose()  # 풀을 다시 만들어도 잽니다
+    database.engine.connect().close()
+    assert database.pool_metrics()['primary']['waits'] == 3
+
+
+def test_load_config_resets_database(fx_config, monkeypatch, tmpdir):
+    monkeypatch.setitem(app.config, 'DATABASE_URL',
+                        fx_config['DATABASE_URL'])
+    before = get_database(app)
+    path = tmpdir.join('db.cfg.py')
+    path.write('DATABASE_POOL_RECYCLE = 60\n')
+    try:
+        load_config(path.strpath)
+        assert get_database(app) is not before
+        assert get_database(app).engine.pool._recycle == 60
+    finally:
+        app.config['DATABASE_POOL_RECYCLE'] = 3600
+        reset_database(app)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from seektam.web.app import app
+from seektam.web.metrics import (Counter, Histogram, Metrics,  # SUT
+                                 get_metrics)
+from tests.web.test_api import fx_api  # noqa
+
+
+@pytest.fixture
+def fx_metrics(fx_api, monkeypatch):  # noqa
+    monkeypatch.setitem(app.config, 'METRICS_ENABLED', True)
+    return fx_api
+
+
+def _samples(text):
+    return dict(line.rsplit(' ', 1) for line in text.splitlines()
+                if not line.startswith('#'))
+
+
+def test_counter_and_histogram_render():
+    counter = Counter('x_total', 'X.', ['a'])
+    counter.inc(2, u'"q"')
+    assert counter.render() == [
+        '# HELP x_total X.', '# TYPE x_total counter',
+        'x_total{a="\\"q\\""} 2.0']
+    histogram = Histogram('h', 'H.', ['e'], buckets=[1, 5])
+    for value in 0.5, 3, 3, 10:
+        histogram.observe(value, 'p')
+    assert histogram.render()[2:] == [
+        'h_bucket{e="p",le="1.0"} 1', 'h_bucket{e="p",le="5.0"} 3',
+        'h_bucket{e="p",le="+Inf"} 4', 'h_sum{e="p"} 16.5',
+        'h_count{e="p"} 4']
+
+
+def test_metrics_disabled(fx_api):  # noqa
+    client, _ = fx_api
+    assert client.get('/metrics').status_code == 404
+    assert get_metrics(app) is None
+
+
+def test_request_and_sql_metrics(fx_metrics):
+    client, _ = fx_metrics
+    client.get('/foods?limit=5')
+    client.get('/foods?limit=5')  # 캐시된 응답
+    client.get('/foods/1')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    samples = _samples(response.data)
+    assert samples['seektam_requests_total'
+                   '{endpoint="api.foods",method="GET",status="200"}'] == \
+        '2.0'
+    assert samples['seektam_request_duration_seconds_count'
+                   '{endpoint="api.foods",method="GET"}'] == '2'
+    # 첫 요청은 revision, foods, aliments 세 쿼리, 둘째는 revision 하나
+    assert samples['seektam_request_sql_queries_sum'
+                   '{endpoint="api.foods"}'] == '4.0'
+    assert samples['seektam_request_sql_queries_bucket'
+                   '{endpoint="api.foods",le="3.0"}'] == '2'
+    assert float(samples['seektam_sql_queries_total']) >= 4
+    assert samples['seektam_response_cache_hits_total'] == '1.0'
+    assert float(samples['seektam_db_pool_checkouts_total'
+                         '{pool="primary"}']) >= 3
+
+
+def test_slow_query_log(fx_metrics, monkeypatch, caplog):
+    client, _ = fx_metrics
+    monkeypatch.setitem(app.config, 'SLOW_QUERY_THRESHOLD', 0)
+    with caplog.at_level(logging.WARNING, 'seektam.web.metrics'):
+        client.get('/categories')
+    assert any('slow query' in r.getMessage() and 'GROUP BY' in
+               r.getMessage() for r in caplog.records)
+    samples = _samples(client.get('/metrics').data)
+    assert float(samples['seektam_sql_slow_queries_total']) >= 2
+
+
+def test_request_metrics_count_unhandled_errors(fx_metrics, monkeypatch):
+    client, _ = fx_metrics
+
+    def broken():
+        raise RuntimeError('broken view')
+    monkeypatch.setitem(app.view_functions, 'api.categories', broken)
+    # TESTING 에서는 예외가 after_request 를 거치지 않고 올라옴
+    with pytest.raises(RuntimeError):
+        client.get('/categories')
+    monkeypatch.setitem(app.config, 'TESTING', False)
+    assert client.get('/categories').status_code == 500
+    assert client.get('/foods/99').status_code == 404
+    samples = _samples(client.get('/metrics').data)
+    assert samples['seektam_requests_total'
+                   '{endpoint="api.categories",method="GET",status="500"}'] \
+        == '2.0'
+    assert samples['seektam_request_duration_seconds_count'
+                   '{endpoint="api.categories",method="GET"}'] == '2'
+    assert samples['seektam_requests_total'
+                   '{endpoint="api.food",method="GET",status="404"}'] == '1.0'
+
+
+def test_failed_queries_leave_no_timing_on_connection():
+    engine = create_engine('sqlite://')
+    metrics = Metrics()
+    metrics.watch(engine)
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute('SELECT * FROM no_such_table')
+        assert conn.execute('SELECT 1').scalar() == 1
+        assert not conn.info
+    assert metrics.queries.get() == 1
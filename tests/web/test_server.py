@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import urllib2
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm.session import sessionmaker
+
+from seektam.cli import serve
+from seektam.loader import BulkLoader
+from seektam.model import koreafood
+from seektam.model import orm
+from seektam.web import server
+from seektam.web.app import app
+from seektam.web.server import Server, warm_up  # SUT
+
+
+@pytest.fixture
+def fx_db_app(tmpdir, monkeypatch):
+    url = 'sqlite:///' + tmpdir.join('server.db').strpath
+    monkeypatch.setitem(app.config, 'DATABASE_URL', url)
+    monkeypatch.setattr(app, 'extensions', {})
+    engine = create_engine(url)
+    orm.Base.metadata.create_all(engine)
+    loader = BulkLoader(sessionmaker(engine)())
+    loader.add(koreafood.Food(
+        name=u'누룽지', category_big=u'밥류', category_small=u'누룽지',
+        meal_code=u'D1',
+        aliments=[koreafood.Aliment(name=u'쌀', energy=3.5)]))
+    loader.flush()
+    return app
+
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_server_config():
+    srv = Server(app, dict(bind=['127.0.0.1:8123'], workers=3, threads=2,
+                           preload_app=True, pidfile=None))
+    assert srv.cfg.bind == ['127.0.0.1:8123']
+    assert srv.cfg.workers == 3
+    assert srv.cfg.threads == 2
+    assert srv.cfg.preload_app
+    assert srv.cfg.pidfile is None
+    assert callable(srv.cfg.post_worker_init)
+
+
+def test_warm_up_loads_indexes(fx_db_app):
+    warm_up(fx_db_app)
+    index = fx_db_app.extensions['seektam.search_index']
+    assert index.food_names.names.values() == [u'누룽지']
+    assert len(fx_db_app.extensions['seektam.similarity']) == 1
+
+
+def test_warm_up_without_database(monkeypatch):
+    monkeypatch.setattr(app, 'extensions', {})
+    monkeypatch.delitem(app.config, 'DATABASE_URL', raising=False)
+    warm_up(app)
+    assert app.extensions == {}
+
+
+def test_server_serves_requests(fx_db_app):
+    port = _free_port()
+    srv = Server(fx_db_app, dict(bind=['127.0.0.1:%d' % port], workers=2,
+                                 preload_app=True, loglevel='warning'))
+    process = multiprocessing.Process(target=srv.run)
+    process.start()
+    try:
+        deadline = time.time() + 10
+        while True:
+            try:
+                response = urllib2.urlopen(
+                    'http://127.0.0.1:%d/search?q=%%EB%%88%%84' % port)
+                break
+            except urllib2.URLError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+        body = json.load(response)
+        assert [f['name'] for f in body['foods']] == [u'누룽지']
+    finally:
+        os.kill(process.pid, signal.SIGTERM)
+        process.join(10)
+    assert process.exitcode == 0
+
+
+def test_serve_command(fx_cli_runner, fx_py_cfg_file, monkeypatch):
+    runs = []
+    monkeypatch.setattr(server.Server, 'run',
+                        lambda self: runs.append(self.options))
+    res = fx_cli_runner.invoke(serve, ['-c', fx_py_cfg_file, '-w', '2',
+                                       '--no-preload'])
+    assert res.exit_code == 0
+    options, = runs
+    assert options['bind'] == ['127.0.0.1:45009']
+    assert options['workers'] == 2
+    assert not options['preload_app']